@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import checks  # noqa: F401
+        from .images import track_image_variants
+        from .models import Contact, LogBarImage, Profile
+        from .versioning import track_model_versions
+        track_model_versions(Profile, LogBarImage, Contact)
+        track_image_variants(Profile, 'profile_picture', 'secondary_picture')
+        track_image_variants(LogBarImage, 'image')
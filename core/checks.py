@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Warn when the default cache is local to each process. ETag versions and
+    cached responses would then only be invalidated in the process that made
+    the change (see core.versioning).
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend.endswith(('LocMemCache', 'DummyCache', 'FileBasedCache')):
+        return [Warning(
+            'The default cache is not shared between worker processes.',
+            hint='Set CACHE_URL to a Redis, Memcached or database cache so every worker sees model version bumps.',
+            id='core.W001',
+        )]
+    return []
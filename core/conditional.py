@@ -0,0 +1,88 @@
+"""
+Conditional GET support (ETag / Last-Modified) for read-only API actions.
+"""
+import hashlib
+from django.core.exceptions import ValidationError
+from django.http import HttpResponseNotModified
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.exceptions import APIException
+from .versioning import get_model_versions
+
+
+class NotModified(APIException):
+    """Raised before the handler runs when the client's validators still match."""
+    status_code = 304
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class ConditionalGetMixin:
+    """
+    Answer If-None-Match / If-Modified-Since on list and retrieve with
+    304 Not Modified before any object is loaded or serialized.
+
+    The ETag combines the versions of ``conditional_models`` (see
+    core.versioning), which must include every model the responses are built
+    from. With ``conditional_object_field`` set, retrieve also includes that
+    timestamp field of the requested object, read with a single-column query,
+    and sends it as Last-Modified.
+    """
+    conditional_models = ()
+    conditional_object_field = None
+    conditional_actions = ('list', 'retrieve')
+
+    def get_object_timestamp(self):
+        """Read conditional_object_field of the requested object, or None if it does not exist."""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.get_queryset().filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+            return queryset.values_list(self.conditional_object_field, flat=True).first()
+        except (TypeError, ValueError, ValidationError):
+            return None
+
+    def get_conditional_validators(self, request):
+        """
+        Returns:
+            tuple: (etag, last_modified timestamp or None)
+        """
+        parts = [self.action, request.accepted_media_type]
+        parts += [str(version) for version in get_model_versions(self.conditional_models)]
+        last_modified = None
+        if self.conditional_object_field and self.action == 'retrieve':
+            timestamp = self.get_object_timestamp()
+            if timestamp is None:
+                return None, None  # Let the handler answer 404
+            parts.append(timestamp.isoformat())
+            last_modified = int(timestamp.timestamp())
+        digest = hashlib.md5(':'.join(parts).encode('utf-8'), usedforsecurity=False).hexdigest()
+        return f'"{digest}"', last_modified
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._conditional_validators = None
+        if request.method in ('GET', 'HEAD') and self.action in self.conditional_actions:
+            etag, last_modified = self.get_conditional_validators(request)
+            if etag is None:
+                return
+            self._conditional_validators = (etag, last_modified)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if isinstance(response, HttpResponseNotModified):
+                raise NotModified(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        validators = getattr(self, '_conditional_validators', None)
+        if validators and response.status_code in (200, 304):
+            etag, last_modified = validators
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
@@ -0,0 +1,65 @@
+"""
+Sparse fieldsets (?fields=) and field expansion (?expand=) for serializers.
+
+``?fields=id,title`` limits a GET response to the listed top-level fields, so
+method fields and nested serializers that were not asked for are never
+evaluated. ``?expand=service`` replaces a field with the richer representation
+declared for it in ``Meta.expandable_fields``. Views use requested_fields()
+and expanded_fields() to skip the prefetches and lookups those fields need.
+"""
+from django.utils.module_loading import import_string
+from rest_framework.permissions import SAFE_METHODS
+
+
+def _parse_names(request, param):
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    value = request.query_params.get(param)
+    if not value:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def requested_fields(request):
+    """Field names listed in ?fields=, or None if every field is wanted."""
+    return _parse_names(request, 'fields')
+
+
+def expanded_fields(request):
+    """Field names listed in ?expand=."""
+    return _parse_names(request, 'expand') or set()
+
+
+def field_requested(request, name):
+    """Whether a response to this request will include the named field."""
+    fields = requested_fields(request)
+    return fields is None or name in fields or name in expanded_fields(request)
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin applying the request's ?fields= and ?expand= parameters.
+
+    Only the top-level serializer of a GET request (or each row of a
+    many=True one) is affected; nested serializers keep all their fields.
+
+    Meta.expandable_fields maps a field name to (serializer, kwargs), where
+    serializer is a class or its dotted import path.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        fields = requested_fields(request)
+        expand = expanded_fields(request)
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+
+        for name in expand & expandable.keys():
+            serializer_class, field_kwargs = expandable[name]
+            if isinstance(serializer_class, str):
+                serializer_class = import_string(serializer_class)
+            self.fields[name] = serializer_class(read_only=True, **field_kwargs)
+
+        if fields is not None:
+            for name in set(self.fields) - fields - expand:
+                self.fields.pop(name)
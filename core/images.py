@@ -0,0 +1,180 @@
+"""
+Resized image variants for responsive images.
+
+Models register their image fields with track_image_variants(). When one of
+those files changes, the saved instance gets WebP and JPEG (PNG for images with
+transparency) copies at the IMAGE_VARIANT_WIDTHS that are narrower than the
+original, generated once the save commits. The variant file names are recorded
+in the instance's ``image_variants`` JSON field, which serializers expose as
+srcset strings (see core.serializers.SrcsetField). The generate_image_variants
+command fills in variants for files uploaded before this existed.
+"""
+from io import BytesIO
+import logging
+import os
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models.signals import post_save
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Formats Pillow can decode; SVG and ICO files are served as they are
+RASTER_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.tif', '.webp'}
+
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', {'optimize': True}),
+}
+
+# Image fields to keep variants for, by model
+IMAGE_VARIANT_FIELDS = {}
+
+# Factors the JPEG decoder can scale down by while decoding
+JPEG_DRAFT_SCALES = (1, 2, 4, 8)
+
+
+def get_variant_widths():
+    return sorted(getattr(settings, 'IMAGE_VARIANT_WIDTHS', (160, 320, 640, 1280)))
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+
+
+def _encode(image, variant_format):
+    pillow_format, options = VARIANT_FORMATS[variant_format]
+    buffer = BytesIO()
+    image.save(buffer, pillow_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def prepare_downscale(image, max_dimension, max_pixels):
+    """
+    Set up an opened image to be downscaled to fit max_dimension and return
+    the (width, height) it will be decoded at.
+
+    JPEGs are scaled down by the decoder by the largest power of two that
+    keeps their longer side at least max_dimension, or further if that would
+    still decode more than max_pixels. Other formats decode at full size.
+    """
+    width, height = image.size
+    if image.format == 'JPEG':
+        longest = max(width, height)
+        fitting = max(scale for scale in JPEG_DRAFT_SCALES if scale == 1 or longest // scale >= max_dimension)
+        within_budget = [
+            scale for scale in JPEG_DRAFT_SCALES if -(-width // scale) * -(-height // scale) <= max_pixels
+        ]
+        scale = max(fitting, within_budget[0] if within_budget else JPEG_DRAFT_SCALES[-1])
+        image.draft(image.mode, (max(width // scale, 1), max(height // scale, 1)))
+    return image.size
+
+
+def generate_variants(field_file):
+    """
+    Write the resized variants of an image file to its storage.
+
+    Returns:
+        dict: {'source', 'width', 'height', <format>: {<width>: <name>}}, with
+        only 'source' for files that are not raster images or cannot be read
+    """
+    name = field_file.name
+    variants = {'source': name}
+    if os.path.splitext(name)[1].lower() not in RASTER_EXTENSIONS:
+        return variants
+
+    storage = field_file.storage
+    widths = get_variant_widths()
+    try:
+        with storage.open(name, 'rb') as source:
+            image = Image.open(source)
+            # Let the JPEG decoder scale down while decoding when it can
+            image.draft('RGB', (widths[-1], widths[-1]))
+            image = ImageOps.exif_transpose(image)
+            image.load()
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as error:
+        logger.warning(f"Could not create variants for {name}: {error}")
+        return variants
+
+    alpha = _has_alpha(image)
+    image = image.convert('RGBA' if alpha else 'RGB')
+    original_width, original_height = image.size
+    variants.update(width=original_width, height=original_height)
+    target_widths = [width for width in widths if width < original_width]
+    if original_width < widths[-1]:
+        target_widths.append(original_width)  # Re-encoded at full size, still smaller than most uploads
+
+    root = os.path.splitext(name)[0]
+    formats = ('webp', 'png' if alpha else 'jpeg')
+    resized = image
+    # Resize from the largest width down, each step starting from the previous one
+    for width in sorted(target_widths, reverse=True):
+        height = max(1, round(original_height * width / original_width))
+        resized = resized.resize((width, height), Image.LANCZOS)
+        for variant_format in formats:
+            variant_name = storage.save(f'variants/{root}/{width}w.{variant_format}', _encode(resized, variant_format))
+            variants.setdefault(variant_format, {})[str(width)] = variant_name
+    return variants
+
+
+def delete_variants(storage, variants):
+    """
+    Delete the files of a variants entry from storage. Content-addressed
+    storage (see core.storage) is left alone, as other rows may share the files.
+    """
+    if getattr(storage, 'content_addressed', False):
+        return
+    for variant_format in VARIANT_FORMATS:
+        for variant_name in variants.get(variant_format, {}).values():
+            storage.delete(variant_name)
+
+
+def update_image_variants(instance, force=False):
+    """
+    Regenerate the variants of every tracked image field whose file changed
+    since its variants were made (or all of them with force=True).
+
+    Returns:
+        bool: True if the instance's image_variants changed
+    """
+    variants = dict(instance.image_variants or {})
+    changed = False
+    for field_name in IMAGE_VARIANT_FIELDS[type(instance)]:
+        field_file = getattr(instance, field_name)
+        current = variants.get(field_name)
+        source = field_file.name or None
+        if not force and (current or {}).get('source') == source:
+            continue
+        if current:
+            delete_variants(field_file.storage, current)
+        if source:
+            variants[field_name] = generate_variants(field_file)
+        else:
+            variants.pop(field_name, None)
+        changed = True
+
+    if changed:
+        instance.image_variants = variants
+        instance.save(update_fields=['image_variants'])
+    return changed
+
+
+def _update_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and set(update_fields) == {'image_variants'}):
+        return
+    variants = instance.image_variants or {}
+    stale = any(
+        (variants.get(field_name) or {}).get('source') != (getattr(instance, field_name).name or None)
+        for field_name in IMAGE_VARIANT_FIELDS[sender]
+    )
+    if stale:
+        # Generate outside the database transaction, and only if it commits
+        transaction.on_commit(lambda: update_image_variants(instance))
+
+
+def track_image_variants(model, *field_names):
+    """Keep resized variants of the given image fields whenever the model is saved."""
+    IMAGE_VARIANT_FIELDS[model] = field_names
+    post_save.connect(_update_on_save, sender=model, dispatch_uid=f'image-variants:{model._meta.label_lower}')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from core.models import Profile, normalize_profile_name
+
+
+class Command(BaseCommand):
+    """
+    Fill in name_lower for profiles saved before the column existed, so their
+    detail lookups use the index instead of a case-insensitive scan.
+    """
+    help = 'Backfill the case-folded profile name column used for lookups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Number of profiles per chunk')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        queryset = Profile.objects.filter(name_lower__isnull=True).order_by('pk')
+
+        updated = 0
+        last_pk = None
+        while True:
+            chunk_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            chunk = list(chunk_queryset.only('pk', 'name')[:chunk_size])
+            if not chunk:
+                break
+
+            for profile in chunk:
+                profile.name_lower = normalize_profile_name(profile.name)
+            Profile.objects.bulk_update(chunk, ['name_lower'])
+
+            updated += len(chunk)
+            last_pk = chunk[-1].pk
+            self.stdout.write(f'Backfilled {updated} profiles...')
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully backfilled names for {updated} profiles'))
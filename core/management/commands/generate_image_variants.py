@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from core.images import IMAGE_VARIANT_FIELDS, update_image_variants
+
+
+class Command(BaseCommand):
+    """
+    Create resized variants for images uploaded before the variant pipeline
+    existed, or whose variants are missing or out of date.
+    """
+    help = 'Generate responsive image variants for existing media'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate variants that are already up to date')
+        parser.add_argument('--chunk-size', type=int, default=100, help='Rows loaded per query')
+
+    def handle(self, *args, **options):
+        for model, field_names in IMAGE_VARIANT_FIELDS.items():
+            updated = 0
+            for instance in model.objects.only('pk', 'image_variants', *field_names).iterator(chunk_size=options['chunk_size']):
+                if update_image_variants(instance, force=options['force']):
+                    updated += 1
+            self.stdout.write(self.style.SUCCESS(f'{model._meta.verbose_name_plural}: updated variants for {updated} rows'))
@@ -0,0 +1,148 @@
+"""
+Media file serving.
+
+Files are handed to the front proxy when MEDIA_SENDFILE_BACKEND is set:
+'x-accel-redirect' (nginx, with an internal location at
+MEDIA_ACCEL_REDIRECT_PREFIX aliased to MEDIA_ROOT) or 'x-sendfile' (Apache
+mod_xsendfile, lighttpd). Otherwise Django streams the file itself, honouring
+single byte-range requests so media players and download resumes work.
+
+Content-addressed names (see core.storage) never change content, so their
+responses are cached for a year as immutable. Other files are cached for
+MEDIA_CACHE_TIMEOUT seconds and revalidated with ETag and Last-Modified.
+Only successful responses are cacheable; errors such as an unsatisfiable
+range are sent with no-store so a proxy cannot keep them.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from .storage import CONTENT_DIRECTORY
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+CACHEABLE_STATUSES = (200, 206, 304)
+CHUNK_SIZE = 64 * 1024
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def _etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _parse_range(header, size):
+    """
+    Parse a single byte-range Range header.
+
+    Returns:
+        tuple: (start, end) inclusive, None to serve the whole file, or
+        False if the range cannot be satisfied
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None  # Multiple or malformed ranges: ignore the header
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    else:
+        start = max(size - int(last), 0)  # Suffix range: the last N bytes
+        end = size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _not_modified(request, etag, stat):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+    modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return modified_since is not None and int(stat.st_mtime) <= modified_since
+
+
+def serve_media(request, path):
+    """Serve a file from MEDIA_ROOT."""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Not found')
+    if not os.path.isfile(full_path):
+        raise Http404('Not found')
+
+    stat = os.stat(full_path)
+    etag = _etag(stat)
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    if _not_modified(request, etag, stat):
+        response = HttpResponseNotModified()
+    else:
+        backend = getattr(settings, 'MEDIA_SENDFILE_BACKEND', None)
+        if backend == 'x-accel-redirect':
+            response = HttpResponse(content_type=content_type)
+            prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+            response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(path.lstrip('/'))
+        elif backend == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = full_path
+        else:
+            response = _file_response(request, full_path, stat, etag, content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+
+    if response.status_code not in CACHEABLE_STATUSES:
+        patch_cache_control(response, no_store=True)
+        return response
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if path.startswith(f'{CONTENT_DIRECTORY}/'):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'MEDIA_CACHE_TIMEOUT', 60 * 60))
+    return response
+
+
+def _file_response(request, full_path, stat, etag, content_type):
+    """Stream the file from Python, or the requested byte range of it."""
+    size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    # A stale If-Range validator means the client's partial copy is outdated
+    if range_header and (if_range is None or if_range.strip() in (etag, http_date(stat.st_mtime))):
+        byte_range = _parse_range(range_header, size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range is None:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_range(full_path, start, end - start + 1), status=206, content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.1 on 2026-10-17 01:48
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Contact',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('phone', models.CharField(max_length=15)),
+                ('address', models.TextField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Profile',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('job_title', models.CharField(blank=True, max_length=100, null=True)),
+                ('job_description', models.TextField(blank=True, null=True)),
+                ('title', models.CharField(blank=True, max_length=50, null=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('profile_picture', models.FileField(blank=True, null=True, upload_to='profile_pictures/')),
+                ('secondary_picture', models.FileField(blank=True, null=True, upload_to='econdary_pictures/')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LogBarImage',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('image', models.FileField(upload_to='log_bar_images/')),
+                ('caption', models.FileField(blank=True, max_length=200, null=True, upload_to='')),
+                ('order', models.PositiveIntegerField(default=0, help_text='Order of the image in the log bar')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_bar_images', to='core.profile')),
+            ],
+            options={
+                'ordering': ['order', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.1 on 2026-10-17 01:48
+
+import core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contact',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='logbarimage',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='logbarimage',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='name_lower',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='logbarimage',
+            name='image',
+            field=models.FileField(upload_to='log_bar_images/', validators=[core.validators.validate_image_file_extension, core.validators.validate_image_dimensions]),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='profile_picture',
+            field=models.FileField(blank=True, null=True, upload_to='profile_pictures/', validators=[core.validators.validate_image_file_extension, core.validators.validate_image_dimensions]),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='secondary_picture',
+            field=models.FileField(blank=True, null=True, upload_to='econdary_pictures/', validators=[core.validators.validate_image_file_extension, core.validators.validate_image_dimensions]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+CHUNK_SIZE = 500
+
+
+def backfill_name_lower(apps, schema_editor):
+    """Fill in name_lower for existing profiles (see backfill_profile_names)."""
+    Profile = apps.get_model('core', 'Profile')
+    queryset = Profile.objects.filter(name_lower__isnull=True).order_by('pk')
+    last_pk = None
+    while True:
+        chunk_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(chunk_queryset.only('pk', 'name')[:CHUNK_SIZE])
+        if not chunk:
+            break
+        for profile in chunk:
+            profile.name_lower = profile.name.casefold()
+        Profile.objects.bulk_update(chunk, ['name_lower'])
+        last_pk = chunk[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_profile_name_lower_image_variants_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_name_lower, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,11 @@
 from django.db import models
 import uuid
-from .validators import validate_image_file_extension
+from .validators import validate_image_dimensions, validate_image_file_extension
+
+def normalize_profile_name(name):
+    """Normalize a profile name for case-insensitive lookups."""
+    return name.casefold()
+
 
 class Profile(models.Model):
     """
@@ -8,12 +13,33 @@ class Profile(models.Model):
     """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=100, unique=True)
+    # Case-folded copy of name for indexed case-insensitive lookups; kept in
+    # sync by save(), so QuerySet.update() on name must set it too
+    name_lower = models.CharField(max_length=255, db_index=True, editable=False, blank=True, null=True)
     job_title = models.CharField(max_length=100, blank=True, null=True)
     job_description = models.TextField(blank=True, null=True)
     title = models.CharField(max_length=50, blank=True, null=True)
     description = models.TextField(blank=True, null=True)
-    profile_picture = models.FileField(upload_to='profile_pictures/', blank=True, null=True)
-    secondary_picture = models.FileField(upload_to='econdary_pictures/', blank=True, null=True)
+    profile_picture = models.FileField(
+        upload_to='profile_pictures/', blank=True, null=True,
+        validators=[validate_image_file_extension, validate_image_dimensions],
+    )
+    secondary_picture = models.FileField(
+        upload_to='econdary_pictures/', blank=True, null=True,
+        validators=[validate_image_file_extension, validate_image_dimensions],
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    # Resized copies of the pictures, see core.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        if 'name' not in self.get_deferred_fields():
+            self.name_lower = normalize_profile_name(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'name_lower'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
@@ -24,9 +50,14 @@ class LogBarImage(models.Model):
     """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='log_bar_images')
-    image = models.FileField(upload_to='log_bar_images/')
+    image = models.FileField(
+        upload_to='log_bar_images/', validators=[validate_image_file_extension, validate_image_dimensions],
+    )
     caption = models.FileField(max_length=200, blank=True, null=True)
     order = models.PositiveIntegerField(default=0, help_text="Order of the image in the log bar")
+    updated_at = models.DateTimeField(auto_now=True)
+    # Resized copies of the image, see core.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     
     class Meta:
         ordering = ['order', 'id']
@@ -42,6 +73,7 @@ class Contact(models.Model):
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=15)
     address = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.email
\ No newline at end of file
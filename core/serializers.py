@@ -1,14 +1,48 @@
 from rest_framework import serializers
+from .dynamic_fields import DynamicFieldsMixin
+from .images import VARIANT_FORMATS
 from .models import Profile, Contact, LogBarImage
 
+class SrcsetField(serializers.Field):
+    """
+    Read-only srcset strings for an image field's resized variants, keyed by
+    format, e.g. {"webp": "https://.../160w.webp 160w, ...", "jpeg": "..."}.
+    None until variants exist.
+    """
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        variants = (instance.image_variants or {}).get(self.image_field) or {}
+        request = self.context.get('request')
+        storage = getattr(instance, self.image_field).storage
+        srcset = {}
+        for variant_format in VARIANT_FORMATS:
+            widths = variants.get(variant_format)
+            if not widths:
+                continue
+            candidates = []
+            for width, name in sorted(widths.items(), key=lambda item: int(item[0])):
+                url = storage.url(name)
+                candidates.append(f"{request.build_absolute_uri(url) if request else url} {width}w")
+            srcset[variant_format] = ', '.join(candidates)
+        return srcset or None
+
+
 class LogBarImageSerializer(serializers.ModelSerializer):
+    srcset = SrcsetField('image')
+
     class Meta:
         model = LogBarImage
-        fields = ['id', 'image', 'caption', 'order']
+        fields = ['id', 'image', 'srcset', 'caption', 'order']
 
 
-class ProfileSerializer(serializers.ModelSerializer):
+class ProfileSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     log_bar_images = serializers.SerializerMethodField()
+    profile_picture_srcset = SrcsetField('profile_picture')
+    secondary_picture_srcset = SrcsetField('secondary_picture')
     
     def get_log_bar_images(self, obj):
         request = self.context.get('request')
@@ -26,7 +60,9 @@ class ProfileSerializer(serializers.ModelSerializer):
             'title',
             'description',
             'profile_picture',
+            'profile_picture_srcset',
             'secondary_picture',
+            'secondary_picture_srcset',
             'log_bar_images'
         ]
         extra_kwargs = {
@@ -37,9 +73,13 @@ class ProfileSerializer(serializers.ModelSerializer):
             'profile_picture': {'required': False},
             'secondary_picture': {'required': False},
         }
+        # ?expand=log_bar_images returns image objects instead of URLs
+        expandable_fields = {
+            'log_bar_images': (LogBarImageSerializer, {'many': True}),
+        }
 
 
-class ContactSerializer(serializers.ModelSerializer):
+class ContactSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Contact
         fields = [
@@ -0,0 +1,112 @@
+"""
+Content-addressed media storage.
+
+Uploads are streamed to a temporary file in chunks and hashed on the way, then
+moved to ``content/<first two hex digits>/<sha256><extension>``. Identical
+content therefore maps to one file: a second upload of the same bytes only
+records the existing name. Memory use is bounded by the chunk size whatever
+the upload size.
+
+Raster images larger than IMAGE_MAX_DIMENSION on either side are downscaled
+before hashing. Their size is read from the header first, and JPEGs are
+scaled down by the decoder (see ``prepare_downscale``). An image is only
+decoded if that takes at most IMAGE_MAX_DECODE_PIXELS pixels, of up to 4
+bytes each; larger ones are stored as uploaded, and the upload validator
+rejects them beforehand. Files may be shared by many rows, so code must not
+delete a stored file because one row stopped using it (see
+``content_addressed``).
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from PIL import Image, ImageOps, UnidentifiedImageError
+from .images import RASTER_EXTENSIONS, prepare_downscale
+
+logger = logging.getLogger(__name__)
+
+CONTENT_DIRECTORY = 'content'
+
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 90, 'optimize': True},
+    'WEBP': {'quality': 90},
+}
+
+
+def downscale_oversized(content, extension):
+    """
+    Return the content, or a downscaled copy of it if it is a raster image
+    wider or taller than IMAGE_MAX_DIMENSION. Animated images are kept as-is.
+    """
+    max_dimension = getattr(settings, 'IMAGE_MAX_DIMENSION', 4096)
+    max_decode_pixels = getattr(settings, 'IMAGE_MAX_DECODE_PIXELS', 24_000_000)
+    if extension not in RASTER_EXTENSIONS:
+        return content
+    content.seek(0)
+    try:
+        image = Image.open(content)  # Reads the header only
+        image_format = image.format
+        oversized = max(image.size) > max_dimension and not getattr(image, 'is_animated', False)
+        if not oversized:
+            return content
+        original_size = image.size
+        width, height = prepare_downscale(image, max_dimension, max_decode_pixels)
+        if width * height > max_decode_pixels:
+            logger.warning(f"Storing {content.name} without downscaling: decoding it takes {width * height} pixels")
+            return content
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        output = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        image.save(output, image_format, **SAVE_OPTIONS.get(image_format, {}))
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as error:
+        logger.warning(f"Storing {content.name} without downscaling: {error}")
+        return content
+    finally:
+        content.seek(0)
+    logger.info(f"Downscaled {content.name} from {original_size} to {image.size}")
+    output.seek(0)
+    return File(output, name=content.name)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that names files by the SHA-256 of their content.
+    """
+    # Stored files can be shared by rows with identical content
+    content_addressed = True
+
+    def get_available_name(self, name, max_length=None):
+        # An existing file with the same name holds the same content
+        return name
+
+    def _save(self, name, content):
+        extension = os.path.splitext(name)[1].lower()
+        content = downscale_oversized(content, extension)
+
+        directory = self.path(CONTENT_DIRECTORY)
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.upload')
+        try:
+            with os.fdopen(descriptor, 'wb') as temp_file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+            hexdigest = digest.hexdigest()
+            stored_name = f'{CONTENT_DIRECTORY}/{hexdigest[:2]}/{hexdigest}{extension}'
+            stored_path = self.path(stored_name)
+            if os.path.exists(stored_path):
+                os.remove(temp_path)  # Same bytes are already stored
+            else:
+                os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+                os.replace(temp_path, stored_path)
+                if self.file_permissions_mode is not None:
+                    os.chmod(stored_path, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return stored_name
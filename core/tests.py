@@ -1,3 +1,258 @@
-from django.test import TestCase
+from io import BytesIO, StringIO
+import shutil
+import tempfile
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIRequestFactory
+from .checks import check_shared_cache
+from .media import serve_media
+from .models import Contact, LogBarImage, Profile
+from .serializers import ProfileSerializer
+from .validators import validate_image_dimensions
+from .views import ContactViewSet, ProfileViewSet
 
-# Create your tests here.
+
+class MigrationTests(TestCase):
+    """
+    Every model change ships with its migration.
+    """
+
+    def test_no_missing_migrations(self):
+        call_command('makemigrations', check=True, dry_run=True, stdout=StringIO())
+
+
+class ConditionalGetTests(TestCase):
+    """
+    Matching validators get 304 Not Modified without touching the database.
+    """
+
+    def setUp(self):
+        self.contact = Contact.objects.create(email='info@example.com', phone='123', address='Street 1')
+
+    def get(self, action, etag=None, **kwargs):
+        headers = {'If-None-Match': etag} if etag else None
+        request = APIRequestFactory().get('/contacts/', headers=headers)
+        return ContactViewSet.as_view({'get': action})(request, **kwargs)
+
+    def test_matching_etag_is_not_modified_without_queries(self):
+        etag = self.get('list')['ETag']
+        with self.assertNumQueries(0):
+            response = self.get('list', etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_saving_a_row_changes_the_etag(self):
+        etag = self.get('retrieve', pk=self.contact.pk)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.contact.phone = '456'
+            self.contact.save()
+        response = self.get('retrieve', etag, pk=self.contact.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class ProfileDetailTests(TestCase):
+    """
+    Profiles are looked up through the indexed name_lower column and their
+    detail responses are cached until a profile or log bar image changes.
+    """
+
+    def setUp(self):
+        # Versions only move on commit, which never happens inside a TestCase
+        cache.clear()
+        self.profile = Profile.objects.create(name='Jane Doe')
+
+    def retrieve(self, name, host='testserver'):
+        request = APIRequestFactory().get(f'/profiles/{name}/', SERVER_NAME=host)
+        return ProfileViewSet.as_view({'get': 'retrieve'})(request, name=name)
+
+    def test_lookup_is_case_insensitive(self):
+        self.assertEqual(self.profile.name_lower, 'jane doe')
+        self.assertEqual(self.retrieve('JANE doe').data['name'], 'Jane Doe')
+
+    def test_rows_without_name_lower_are_found_without_writes(self):
+        Profile.objects.filter(pk=self.profile.pk).update(name_lower=None)
+        self.assertEqual(self.retrieve('jane DOE').status_code, 200)
+        self.assertIsNone(Profile.objects.get(pk=self.profile.pk).name_lower)
+        call_command('backfill_profile_names', stdout=StringIO())
+        self.assertEqual(Profile.objects.get(pk=self.profile.pk).name_lower, 'jane doe')
+
+    def test_cached_detail_is_served_without_queries(self):
+        self.retrieve('jane doe')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.retrieve('Jane Doe').data['name'], 'Jane Doe')
+
+    def test_saving_a_log_bar_image_invalidates_the_cache(self):
+        # Saving the image generates its variants, so keep them out of the real MEDIA_ROOT
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.retrieve('jane doe')
+        buffer = BytesIO()
+        Image.new('RGB', (10, 10), 'red').save(buffer, 'PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            image = LogBarImage.objects.create(
+                profile=self.profile, image=SimpleUploadedFile('a.png', buffer.getvalue()),
+            )
+        response = self.retrieve('jane doe')
+        self.assertEqual(response.data['log_bar_images'], [f'http://testserver/media/{image.image.name}'])
+
+
+class SharedCacheCheckTests(TestCase):
+    """
+    Deployments are warned when versions live in a per-process cache.
+    """
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_local_memory_cache_warns(self):
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['core.W001'])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache:6379/0'}})
+    def test_shared_cache_passes(self):
+        self.assertEqual(check_shared_cache(None), [])
+
+
+@override_settings(IMAGE_VARIANT_WIDTHS=(160, 320))
+class ImageVariantTests(TestCase):
+    """
+    Saving an image generates resized variants exposed as srcset strings.
+    """
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+    def upload(self, size, mode='RGB'):
+        buffer = BytesIO()
+        Image.new(mode, size, 'red').save(buffer, 'PNG')
+        return SimpleUploadedFile('photo.png', buffer.getvalue())
+
+    def test_variants_are_generated_below_the_original_width(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = Profile.objects.create(name='Jane Doe', profile_picture=self.upload((400, 200)))
+        profile.refresh_from_db()
+        variants = profile.image_variants['profile_picture']
+        self.assertEqual(set(variants['webp']), {'160', '320'})
+        self.assertEqual(set(variants['jpeg']), {'160', '320'})
+        with default_storage.open(variants['jpeg']['160']) as variant:
+            self.assertEqual(Image.open(variant).size, (160, 80))
+        srcset = ProfileSerializer(profile).data['profile_picture_srcset']
+        self.assertTrue(srcset['webp'].endswith('.webp 320w'))
+
+    def test_transparent_images_fall_back_to_png(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = Profile.objects.create(name='Jane Doe', profile_picture=self.upload((100, 100), 'RGBA'))
+        profile.refresh_from_db()
+        self.assertEqual(set(profile.image_variants['profile_picture']), {'source', 'width', 'height', 'webp', 'png'})
+
+    def test_backfill_command_fills_missing_variants(self):
+        profile = Profile.objects.create(name='Jane Doe', profile_picture=self.upload((400, 200)))
+        call_command('generate_image_variants', stdout=StringIO())
+        profile.refresh_from_db()
+        self.assertIn('webp', profile.image_variants['profile_picture'])
+
+
+class ContentAddressedStorageTests(TestCase):
+    """
+    Uploads are stored once per distinct content and oversized images are bounded.
+    """
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+    def upload(self, size, name='photo.png', color='red', image_format='PNG'):
+        buffer = BytesIO()
+        Image.new('RGB', size, color).save(buffer, image_format)
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def test_identical_uploads_share_one_file(self):
+        first = default_storage.save('profile_pictures/a.png', self.upload((10, 10)))
+        second = default_storage.save('logos/b.png', self.upload((10, 10)))
+        other = default_storage.save('logos/c.png', self.upload((10, 10), color='blue'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertRegex(first, r'^content/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+
+    @override_settings(IMAGE_MAX_DIMENSION=100)
+    def test_oversized_images_are_downscaled(self):
+        name = default_storage.save('photo.png', self.upload((400, 200)))
+        with default_storage.open(name) as stored:
+            self.assertEqual(Image.open(stored).size, (100, 50))
+
+    @override_settings(IMAGE_MAX_DIMENSION=100, IMAGE_MAX_DECODE_PIXELS=50_000)
+    def test_images_too_large_to_decode_are_not_downscaled(self):
+        upload = self.upload((400, 200))
+        with self.assertRaises(ValidationError) as raised:
+            validate_image_dimensions(upload)
+        self.assertEqual(raised.exception.code, 'image_too_large_to_downscale')
+        name = default_storage.save('photo.png', upload)
+        with default_storage.open(name) as stored:
+            self.assertEqual(Image.open(stored).size, (400, 200))
+
+    @override_settings(IMAGE_MAX_DIMENSION=100, IMAGE_MAX_DECODE_PIXELS=3_000)
+    def test_jpegs_are_scaled_down_while_decoding(self):
+        # Decoding at 1/2 (200 x 100) would exceed the budget, so 1/8 is used
+        upload = self.upload((400, 200), name='photo.jpg', image_format='JPEG')
+        validate_image_dimensions(upload)
+        name = default_storage.save('photo.jpg', upload)
+        with default_storage.open(name) as stored:
+            self.assertEqual(Image.open(stored).size, (50, 25))
+
+    @override_settings(IMAGE_MAX_PIXELS=10_000)
+    def test_images_over_the_pixel_limit_are_rejected(self):
+        validate_image_dimensions(self.upload((100, 100)))
+        with self.assertRaises(ValidationError):
+            validate_image_dimensions(self.upload((101, 100)))
+
+
+class MediaServingTests(TestCase):
+    """
+    Media is served with long-lived caching for hashed names, byte ranges
+    and proxy handoff.
+    """
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.name = default_storage.save('notes.txt', SimpleUploadedFile('notes.txt', b'0123456789'))
+
+    def get(self, path, **headers):
+        return serve_media(RequestFactory().get(f'/media/{path}', headers=headers), path)
+
+    def test_content_addressed_files_are_immutable(self):
+        response = self.get(self.name)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.get(self.name, if_none_match=response['ETag']).status_code, 304)
+
+    def test_byte_ranges(self):
+        response = self.get(self.name, range='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(b''.join(self.get(self.name, range='bytes=-3').streaming_content), b'789')
+        unsatisfiable = self.get(self.name, range='bytes=20-')
+        self.assertEqual(unsatisfiable.status_code, 416)
+        # The error must not be cached for a year like the file
+        self.assertEqual(unsatisfiable['Cache-Control'], 'no-store')
+        self.assertNotIn('ETag', unsatisfiable)
+
+    @override_settings(MEDIA_SENDFILE_BACKEND='x-accel-redirect', MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_proxy_handoff(self):
+        response = self.get(self.name)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.name}')
+        self.assertEqual(response.content, b'')
+
+    def test_paths_outside_media_root_are_not_found(self):
+        with self.assertRaises(Http404):
+            self.get('../etc/passwd')
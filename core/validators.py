@@ -1,6 +1,9 @@
 import os
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
+from PIL import Image, UnidentifiedImageError
+from .images import RASTER_EXTENSIONS, prepare_downscale
 
 def validate_image_file_extension(value):
     """
@@ -36,3 +39,46 @@ def validate_logo_file_extension(value):
                 params={'allowed_extensions': ', '.join(allowed_extensions)},
                 code='invalid_extension'
             )
+
+def validate_image_dimensions(value):
+    """
+    Validator rejecting new raster uploads with more than IMAGE_MAX_PIXELS
+    pixels, and those that would need more than IMAGE_MAX_DECODE_PIXELS
+    decoded to be downscaled to IMAGE_MAX_DIMENSION when stored. Only the
+    image header is read, so oversized files are refused before anything is
+    decoded.
+    """
+    # Files already in storage were checked when they were uploaded
+    if not value or getattr(value, '_committed', False):
+        return
+    if os.path.splitext(value.name)[1].lower() not in RASTER_EXTENSIONS:
+        return
+
+    max_pixels = getattr(settings, 'IMAGE_MAX_PIXELS', 40_000_000)
+    max_dimension = getattr(settings, 'IMAGE_MAX_DIMENSION', 4096)
+    max_decode_pixels = getattr(settings, 'IMAGE_MAX_DECODE_PIXELS', 24_000_000)
+    value.seek(0)
+    try:
+        with Image.open(value) as image:
+            width, height = image.size
+            decode_pixels = 0
+            if max(width, height) > max_dimension and not getattr(image, 'is_animated', False):
+                decode_width, decode_height = prepare_downscale(image, max_dimension, max_decode_pixels)
+                decode_pixels = decode_width * decode_height
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        raise ValidationError(_('Upload a valid image.'), code='invalid_image')
+    finally:
+        value.seek(0)
+    if width * height > max_pixels:
+        raise ValidationError(
+            _('Image is too large (%(width)s x %(height)s). The limit is %(max_pixels)s pixels.'),
+            params={'width': width, 'height': height, 'max_pixels': max_pixels},
+            code='image_too_large'
+        )
+    if decode_pixels > max_decode_pixels:
+        raise ValidationError(
+            _('Image is too large to downscale (%(width)s x %(height)s). Images wider or taller than '
+              '%(max_dimension)s pixels may have at most %(max_pixels)s pixels.'),
+            params={'width': width, 'height': height, 'max_dimension': max_dimension, 'max_pixels': max_decode_pixels},
+            code='image_too_large_to_downscale'
+        )
@@ -0,0 +1,71 @@
+"""
+Per-model version counters for cheap cache validators.
+
+Each tracked model has a version in the default Django cache that is bumped
+whenever one of its rows is saved or deleted. That cache must be shared by all
+worker processes (CACHE_URL, checked by ``check --deploy``), or a bump is only
+seen by the process that made it. Reading a version costs one
+cache lookup and no queries, so views can answer conditional requests and
+key response caches on it without touching the table.
+
+Signals do not fire for QuerySet.update() or bulk_update(); code that writes
+tracked models that way must call bump_model_version() itself.
+"""
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+
+def _version_key(model):
+    return f'model-version:{model._meta.label_lower}'
+
+
+def get_model_version(model):
+    """
+    Get a model's version, seeding it if the cache has none.
+
+    The seed is time-based so a version evicted from the cache never comes back
+    with a value a client already holds a validator for.
+    """
+    key = _version_key(model)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_model_versions(models):
+    """Get the versions of several models with one cache round trip."""
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    return [versions.get(key) or get_model_version(model) for key, model in zip(keys, models)]
+
+
+def _bump(model):
+    try:
+        cache.incr(_version_key(model))
+    except ValueError:
+        cache.add(_version_key(model), time.time_ns(), timeout=None)
+
+
+def bump_model_version(*models):
+    """
+    Bump the versions of the given models once the current database
+    transaction commits, so no reader pairs a new version with old rows.
+    """
+    for model in models:
+        transaction.on_commit(lambda model=model: _bump(model))
+
+
+def _bump_on_change(sender, **kwargs):
+    bump_model_version(sender)
+
+
+def track_model_versions(*models):
+    """Bump each model's version whenever one of its rows is saved or deleted."""
+    for model in models:
+        uid = f'model-version:{model._meta.label_lower}'
+        post_save.connect(_bump_on_change, sender=model, dispatch_uid=uid)
+        post_delete.connect(_bump_on_change, sender=model, dispatch_uid=uid)
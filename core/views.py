@@ -1,25 +1,71 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import render, get_object_or_404
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from .models import Profile, Contact
+from .conditional import ConditionalGetMixin
+from .dynamic_fields import field_requested
+from .models import Profile, Contact, LogBarImage, normalize_profile_name
 from .serializers import ProfileSerializer, ContactSerializer
+from .versioning import get_model_versions
 
 # Create your views here.
 
-class ProfileViewSet(viewsets.ModelViewSet):
-    queryset = Profile.objects.prefetch_related('log_bar_images').all()
+class ProfileViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = Profile.objects.all()
     serializer_class = ProfileSerializer
+    conditional_models = (Profile, LogBarImage)
     lookup_field = 'name'
     lookup_value_regex = '[^/]+'  
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if field_requested(self.request, 'log_bar_images'):
+            queryset = queryset.prefetch_related('log_bar_images')
+        return queryset
+
     def get_object(self):
         queryset = self.filter_queryset(self.get_queryset())
-        filter_kwargs = {f"{self.lookup_field}__iexact": self.kwargs[self.lookup_field]}
-        obj = get_object_or_404(queryset, **filter_kwargs)
+        name = self.kwargs[self.lookup_field]
+        obj = queryset.filter(name_lower=normalize_profile_name(name)).first()
+        if obj is None:
+            # Rows saved before name_lower existed (until backfill_profile_names
+            # has run): match them the slow way, without writing during a read
+            obj = get_object_or_404(queryset, name__iexact=name, name_lower__isnull=True)
         self.check_object_permissions(self.request, obj)
         return obj
 
-class ContactViewSet(viewsets.ModelViewSet):
+    def get_detail_cache_key(self, request):
+        """
+        Cache key for a rendered profile detail, covering everything the body
+        depends on: the profile and log bar image versions, the scheme and host
+        used for absolute image URLs, the name and the query string.
+        """
+        versions = ':'.join(str(version) for version in get_model_versions((Profile, LogBarImage)))
+        variant = hashlib.md5(
+            f"{request.scheme}://{request.get_host()}|{request.accepted_media_type}|{request.GET.urlencode()}".encode('utf-8'),
+            usedforsecurity=False,
+        ).hexdigest()
+        name = normalize_profile_name(self.kwargs[self.lookup_field])
+        return f"profile-detail:{versions}:{variant}:{hashlib.md5(name.encode('utf-8'), usedforsecurity=False).hexdigest()}"
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Get a profile by name, served from the cache until a Profile or
+        LogBarImage is saved or deleted. Invalidation reaches every worker only
+        when the cache is shared between them (see CACHE_URL).
+        """
+        key = self.get_detail_cache_key(request)
+        data = cache.get(key)
+        if data is None:
+            response = super().retrieve(request, *args, **kwargs)
+            cache.set(key, response.data, getattr(settings, 'PROFILE_CACHE_TIMEOUT', 24 * 60 * 60))
+            return response
+        return Response(data)
+
+class ContactViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Contact.objects.all()
-    serializer_class = ContactSerializer
\ No newline at end of file
+    serializer_class = ContactSerializer
+    conditional_models = (Contact,)
\ No newline at end of file
@@ -63,6 +63,52 @@ SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 SESSION_COOKIE_AGE = 60 * 60 * 24 * 7  # 1 week
 SESSION_SAVE_EVERY_REQUEST = True
 
+# Shopping baskets (service.basket_store) are kept outside the session, identified by
+# a signed cookie. CacheBasketStore needs a cache shared by all processes.
+BASKET_STORE = os.getenv('BASKET_STORE', 'service.basket_store.DatabaseBasketStore')
+BASKET_TTL = int(os.getenv('BASKET_TTL', 60 * 60 * 24 * 7))  # 1 week without changes
+BASKET_COOKIE_NAME = 'basket_id'
+
+# Default and maximum page sizes for the cursor-paginated transaction endpoints.
+# Clients can request a smaller or larger page with ?page_size=.
+TRANSACTION_PAGE_SIZE = int(os.getenv('TRANSACTION_PAGE_SIZE', 50))
+TRANSACTION_MAX_PAGE_SIZE = int(os.getenv('TRANSACTION_MAX_PAGE_SIZE', 500))
+
+# Idempotency-Key support on transaction creation and payment processing:
+# how long keys are remembered, how long a duplicate request waits for the
+# original one to finish before getting 409 Conflict, and after how long an
+# unfinished request is presumed crashed so its key can be claimed again
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+IDEMPOTENCY_WAIT_TIMEOUT = int(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT', 10))
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.getenv('IDEMPOTENCY_LOCK_TIMEOUT', 60))
+
+# Background TransactionAdmin jobs (transaction.jobs): rows handled per chunk,
+# whether to also start jobs in a thread right away (process_admin_jobs --loop is
+# the supported runner), and seconds without a heartbeat before a RUNNING job is
+# considered abandoned and reclaimed
+ADMIN_JOB_CHUNK_SIZE = int(os.getenv('ADMIN_JOB_CHUNK_SIZE', 500))
+ADMIN_JOBS_RUN_IN_THREAD = os.getenv('ADMIN_JOBS_RUN_IN_THREAD', 'True') == 'True'
+ADMIN_JOB_STALE_AFTER = int(os.getenv('ADMIN_JOB_STALE_AFTER', 10 * 60))
+
+# Maximum age in seconds of a process's in-memory catalog snapshot (service.catalog).
+# Changes are normally picked up immediately through the shared version key; this
+# bounds staleness when the cache backend is not shared between processes.
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 300))
+
+# Profile detail responses are cached per host and name and invalidated through
+# the Profile/LogBarImage versions, so the timeout only bounds memory use
+PROFILE_CACHE_TIMEOUT = int(os.getenv('PROFILE_CACHE_TIMEOUT', 24 * 60 * 60))
+
+# Catalog search (GET /api/services/search/): query terms at least this long also
+# match as word prefixes, expanding to at most this many indexed words per query
+# (shared by its terms). Only the first SEARCH_MAX_TERMS terms are used, and
+# multi-word queries score at most SEARCH_MAX_CANDIDATES documents.
+SEARCH_MIN_PREFIX = int(os.getenv('SEARCH_MIN_PREFIX', 2))
+SEARCH_MAX_PREFIX_EXPANSIONS = int(os.getenv('SEARCH_MAX_PREFIX_EXPANSIONS', 50))
+SEARCH_MAX_TERMS = int(os.getenv('SEARCH_MAX_TERMS', 8))
+SEARCH_MAX_CANDIDATES = int(os.getenv('SEARCH_MAX_CANDIDATES', 500))
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', 100))
+
 ROOT_URLCONF = 'esale_project.urls'
 
 TEMPLATES = [
@@ -102,6 +148,28 @@ else:
         }
     }
 
+# Cache
+# Model and catalog versions (and so ETags) and cached responses live here, so
+# every worker process must share it: set CACHE_URL to redis://host:6379/0
+# (needs the redis package), memcached://host:11211 (needs pymemcache) or
+# db://table_name (run createcachetable). Without it each process gets its own
+# local-memory cache, which is only correct for a single process.
+CACHE_URL = os.getenv('CACHE_URL')
+if CACHE_URL and CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+elif CACHE_URL and CACHE_URL.startswith('memcached://'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+        'LOCATION': CACHE_URL.removeprefix('memcached://'),
+    }}
+elif CACHE_URL and CACHE_URL.startswith('db://'):
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': CACHE_URL.removeprefix('db://'),
+    }}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -151,6 +219,33 @@ STATIC_ROOT = '/var/www/eSalesone/staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/var/www/eSalesone/media/'
 
+# Media serving (core.media). MEDIA_SERVE routes MEDIA_URL to Django when DEBUG is off.
+# MEDIA_SENDFILE_BACKEND hands files to the front proxy: 'x-accel-redirect' (nginx,
+# internal location at MEDIA_ACCEL_REDIRECT_PREFIX aliased to MEDIA_ROOT) or 'x-sendfile';
+# unset, Django streams files itself with Range support. Content-addressed files are
+# cached as immutable, others for MEDIA_CACHE_TIMEOUT seconds.
+MEDIA_SERVE = os.getenv('MEDIA_SERVE', 'False') == 'True'
+MEDIA_SENDFILE_BACKEND = os.getenv('MEDIA_SENDFILE_BACKEND') or None
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+MEDIA_CACHE_TIMEOUT = int(os.getenv('MEDIA_CACHE_TIMEOUT', 60 * 60))
+
+# Uploads are stored once per distinct content, named by their SHA-256 (see core.storage)
+STORAGES = {
+    'default': {'BACKEND': 'core.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Uploaded images with more pixels than this are rejected from their header alone;
+# images wider or taller than IMAGE_MAX_DIMENSION are downscaled when stored
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', 40_000_000))
+IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', 4096))
+# Most pixels decoded to downscale an image (up to 4 bytes each); larger uploads that
+# need downscaling are rejected. JPEGs count at the size the decoder scales them to
+IMAGE_MAX_DECODE_PIXELS = int(os.getenv('IMAGE_MAX_DECODE_PIXELS', 24_000_000))
+
+# Widths of the resized WebP/JPEG copies made of uploaded images (see core.images)
+IMAGE_VARIANT_WIDTHS = tuple(int(width) for width in os.getenv('IMAGE_VARIANT_WIDTHS', '160,320,640,1280').split(','))
+
 # Email configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'sandbox.smtp.mailtrap.io')
@@ -160,6 +255,14 @@ EMAIL_HOST_USER = os.getenv('EMAIL_USERNAME')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_PASSWORD')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'noreply@esalesone.com')
 
+# Transaction email outbox (transaction.outbox): delivery attempts before giving up,
+# the initial/maximum retry backoff in seconds, and how long a worker's claim on a
+# notification lasts before another worker may retry it
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', 5))
+EMAIL_OUTBOX_RETRY_DELAY = int(os.getenv('EMAIL_OUTBOX_RETRY_DELAY', 60))
+EMAIL_OUTBOX_MAX_RETRY_DELAY = int(os.getenv('EMAIL_OUTBOX_MAX_RETRY_DELAY', 60 * 60))
+EMAIL_OUTBOX_LEASE = int(os.getenv('EMAIL_OUTBOX_LEASE', 5 * 60))
+
 # For development/testing, you can uncomment the line below to print emails to console instead
 # EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
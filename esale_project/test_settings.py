@@ -0,0 +1,11 @@
+"""
+Settings for running the test suite.
+
+The project settings, plus a throwaway SECRET_KEY when the environment does
+not provide one (signed basket cookies need a key):
+
+    python manage.py test --settings=esale_project.test_settings
+"""
+from .settings import *  # noqa: F401,F403
+
+SECRET_KEY = SECRET_KEY or 'insecure-test-only-key'  # noqa: F405
@@ -2,10 +2,11 @@
 URL configuration for esale_project project.
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework.routers import DefaultRouter
+from core.media import serve_media
 from core.urls import router as core_router
 from service.urls import router as service_router
 from transaction.urls import router as transaction_router
@@ -22,7 +23,8 @@ urlpatterns = [
     path('api/', include(api_router.urls)),
 ]
 
-# Serve media files during development
+# Serve media files in development, or in production with MEDIA_SERVE (see core.media)
+if settings.DEBUG or settings.MEDIA_SERVE:
+    urlpatterns += [re_path(rf'^{settings.MEDIA_URL.strip("/")}/(?P<path>.+)$', serve_media)]
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ServiceConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'service'
+
+    def ready(self):
+        from core.images import track_image_variants
+        from core.versioning import track_model_versions
+        from . import signals  # noqa: F401
+        from .models import Service, Type
+        track_model_versions(Service, Type)
+        track_image_variants(Service, 'logo')
@@ -0,0 +1,301 @@
+"""
+Storage backends for shopping baskets.
+
+Baskets live outside the session so a basket request never pickles and
+rewrites the whole session row. Every mutation is a per-line atomic operation
+that changes only the line it targets, so parallel add-to-basket calls cannot
+overwrite each other. Baskets expire after BASKET_TTL seconds without changes.
+
+Lines are plain dicts with service_id, service_type_id, quantity and price,
+keyed by "<service_id>_<service_type_id>". Each basket also has a version that
+changes on every mutation, which the basket view uses as its ETag.
+"""
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import APIException
+from .models import Basket, BasketLine
+
+
+def get_basket_ttl():
+    return getattr(settings, 'BASKET_TTL', 60 * 60 * 24 * 7)
+
+
+class BasketBusy(APIException):
+    """Raised when another request held the basket's lock for too long; the client should retry."""
+    status_code = 503
+    default_detail = 'The basket is being updated by another request, please retry.'
+    default_code = 'basket_busy'
+    wait = 1  # Sent as Retry-After
+
+
+class BaseBasketStore:
+    """
+    Interface shared by the basket storage backends.
+    """
+
+    def get_lines(self, basket_id):
+        """Return the basket's lines as an ordered dict keyed by line key."""
+        raise NotImplementedError
+
+    def get_version(self, basket_id):
+        """
+        Return the basket's version, which changes on every mutation, or None
+        if the basket does not exist.
+        """
+        raise NotImplementedError
+
+    def add_line(self, basket_id, key, line):
+        """
+        Add a line, or increase the quantity of an existing line by
+        line['quantity'], atomically. Returns the stored line.
+        """
+        raise NotImplementedError
+
+    def set_quantity(self, basket_id, key, quantity):
+        """Set a line's quantity. Returns the stored line, or None if it does not exist."""
+        raise NotImplementedError
+
+    def remove_line(self, basket_id, key):
+        """Remove a line. Returns True if it existed."""
+        raise NotImplementedError
+
+    def clear(self, basket_id):
+        """Remove every line of the basket."""
+        raise NotImplementedError
+
+    def replace(self, basket_id, basket):
+        """
+        Make the stored basket match a full basket dict, writing only the
+        lines that were added, changed or removed.
+        """
+        current = self.get_lines(basket_id)
+        for key in current.keys() - basket.keys():
+            self.remove_line(basket_id, key)
+        for key, line in basket.items():
+            if key not in current:
+                self.add_line(basket_id, key, line)
+            elif current[key]['quantity'] != line['quantity']:
+                self.set_quantity(basket_id, key, line['quantity'])
+
+    def purge_expired(self):
+        """Delete baskets idle for longer than BASKET_TTL. Returns the number deleted."""
+        return 0
+
+
+class CacheBasketStore(BaseBasketStore):
+    """
+    Basket store backed by the Django cache.
+
+    Each line is its own cache entry, with a small index entry listing the
+    basket's line keys. Mutations take a short per-basket lock and raise
+    BasketBusy if they cannot get it within lock_wait seconds. Every write
+    renews the timeouts of all the basket's entries, so a basket expires as a
+    whole BASKET_TTL seconds after its last change. Needs a cache shared by all
+    processes (e.g. Redis or Memcached) in production.
+    """
+    lock_timeout = 5
+    lock_wait = 2
+
+    def _index_key(self, basket_id):
+        return f'basket:{basket_id}:lines'
+
+    def _line_key(self, basket_id, key):
+        return f'basket:{basket_id}:line:{key}'
+
+    def _version_key(self, basket_id):
+        return f'basket:{basket_id}:version'
+
+    def _next_version(self, basket_id):
+        version = cache.get(self._version_key(basket_id))
+        return version + 1 if version is not None else time.time_ns()
+
+    @contextmanager
+    def _lock(self, basket_id):
+        lock_key = f'basket:{basket_id}:lock'
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_wait
+        while not cache.add(lock_key, token, self.lock_timeout):
+            if time.monotonic() > deadline:
+                raise BasketBusy()  # A crashed holder's lock expires after lock_timeout
+            time.sleep(0.01)
+        try:
+            yield
+        finally:
+            # Our lock may have expired and been taken by another request; leave theirs alone
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    def _write(self, basket_id, index, changed):
+        """
+        Write the index, a new version and the changed lines, and rewrite the
+        basket's other lines so their timeouts are renewed along with them.
+        """
+        unchanged = cache.get_many([self._line_key(basket_id, key) for key in index if key not in changed])
+        values = {**unchanged, **{self._line_key(basket_id, key): line for key, line in changed.items()}}
+        values[self._index_key(basket_id)] = [key for key in index if self._line_key(basket_id, key) in values]
+        values[self._version_key(basket_id)] = self._next_version(basket_id)
+        cache.set_many(values, get_basket_ttl())
+
+    def get_lines(self, basket_id):
+        index = cache.get(self._index_key(basket_id)) or []
+        values = cache.get_many([self._line_key(basket_id, key) for key in index])
+        lines = {}
+        for key in index:
+            line = values.get(self._line_key(basket_id, key))
+            if line is not None:
+                lines[key] = line
+        return lines
+
+    def get_version(self, basket_id):
+        return cache.get(self._version_key(basket_id))
+
+    def add_line(self, basket_id, key, line):
+        with self._lock(basket_id):
+            index = cache.get(self._index_key(basket_id)) or []
+            existing = cache.get(self._line_key(basket_id, key)) if key in index else None
+            if existing is not None:
+                existing['quantity'] += line['quantity']
+                line = existing
+            else:
+                line = dict(line)
+                index = [*(item for item in index if item != key), key]
+            self._write(basket_id, index, {key: line})
+            return line
+
+    def set_quantity(self, basket_id, key, quantity):
+        with self._lock(basket_id):
+            index = cache.get(self._index_key(basket_id)) or []
+            existing = cache.get(self._line_key(basket_id, key)) if key in index else None
+            if existing is None:
+                return None
+            existing['quantity'] = quantity
+            self._write(basket_id, index, {key: existing})
+            return existing
+
+    def remove_line(self, basket_id, key):
+        with self._lock(basket_id):
+            index = cache.get(self._index_key(basket_id)) or []
+            if key not in index:
+                return False
+            index.remove(key)
+            cache.delete(self._line_key(basket_id, key))
+            self._write(basket_id, index, {})
+            return True
+
+    def clear(self, basket_id):
+        with self._lock(basket_id):
+            index = cache.get(self._index_key(basket_id)) or []
+            cache.delete_many([self._line_key(basket_id, key) for key in index] + [self._index_key(basket_id), self._version_key(basket_id)])
+
+
+class DatabaseBasketStore(BaseBasketStore):
+    """
+    Basket store backed by the Basket and BasketLine tables.
+
+    Quantity changes are single UPDATE statements on one line row, and a unique
+    (basket, key) constraint resolves concurrent inserts of the same line.
+    Baskets idle for longer than BASKET_TTL are ignored on read and deleted by
+    purge_expired() (see the purge_baskets command).
+    """
+
+    def _cutoff(self):
+        return timezone.now() - timedelta(seconds=get_basket_ttl())
+
+    def _delete_if_expired(self, basket_id):
+        """
+        Delete the basket if it expired but was not purged yet, so it starts
+        over empty rather than reviving its old lines. Returns True if deleted.
+        """
+        deleted, _ = Basket.objects.filter(pk=basket_id, updated_at__lt=self._cutoff()).delete()
+        return bool(deleted)
+
+    def _touch(self, basket_id):
+        updated = Basket.objects.filter(pk=basket_id).update(updated_at=timezone.now(), version=F('version') + 1)
+        if not updated:
+            Basket.objects.get_or_create(pk=basket_id)
+
+    def _to_line(self, basket_line):
+        return {
+            'service_id': str(basket_line.service_id),
+            'service_type_id': str(basket_line.service_type_id),
+            'quantity': basket_line.quantity,
+            'price': float(basket_line.price),
+        }
+
+    def get_lines(self, basket_id):
+        basket_lines = BasketLine.objects.filter(basket_id=basket_id, basket__updated_at__gte=self._cutoff())
+        return {basket_line.key: self._to_line(basket_line) for basket_line in basket_lines}
+
+    def get_version(self, basket_id):
+        return (
+            Basket.objects.filter(pk=basket_id, updated_at__gte=self._cutoff())
+            .values_list('version', flat=True)
+            .first()
+        )
+
+    def add_line(self, basket_id, key, line):
+        with db_transaction.atomic():
+            self._delete_if_expired(basket_id)
+            self._touch(basket_id)
+            lines = BasketLine.objects.filter(basket_id=basket_id, key=key)
+            if not lines.update(quantity=F('quantity') + line['quantity']):
+                try:
+                    with db_transaction.atomic():
+                        BasketLine.objects.create(
+                            basket_id=basket_id,
+                            key=key,
+                            service_id=line['service_id'],
+                            service_type_id=line['service_type_id'],
+                            quantity=line['quantity'],
+                            price=Decimal(str(line['price'])),
+                        )
+                except IntegrityError:
+                    # A parallel request inserted the line first
+                    lines.update(quantity=F('quantity') + line['quantity'])
+            return self._to_line(lines.get())
+
+    def set_quantity(self, basket_id, key, quantity):
+        with db_transaction.atomic():
+            if self._delete_if_expired(basket_id):
+                return None
+            lines = BasketLine.objects.filter(basket_id=basket_id, key=key)
+            if not lines.update(quantity=quantity):
+                return None
+            self._touch(basket_id)
+            return self._to_line(lines.get())
+
+    def remove_line(self, basket_id, key):
+        with db_transaction.atomic():
+            if self._delete_if_expired(basket_id):
+                return False
+            deleted, _ = BasketLine.objects.filter(basket_id=basket_id, key=key).delete()
+            if deleted:
+                self._touch(basket_id)
+        return bool(deleted)
+
+    def clear(self, basket_id):
+        Basket.objects.filter(pk=basket_id).delete()
+
+    def purge_expired(self):
+        _, deleted = Basket.objects.filter(updated_at__lt=self._cutoff()).delete()
+        return deleted.get(Basket._meta.label, 0)
+
+
+_stores = {}
+
+
+def get_basket_store():
+    """Get the basket store configured by the BASKET_STORE setting."""
+    path = getattr(settings, 'BASKET_STORE', 'service.basket_store.DatabaseBasketStore')
+    if path not in _stores:
+        _stores[path] = import_string(path)()
+    return _stores[path]
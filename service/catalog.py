@@ -0,0 +1,170 @@
+"""
+Versioned in-process cache of the service catalog.
+
+Active services and service types are read on almost every hot path (basket,
+checkout validation, pricing, emails, admin) but change rarely. Each process
+keeps one immutable snapshot of them keyed by a global catalog version stored
+in the shared Django cache. Saving or deleting a Service or Type bumps the
+version (see service.signals) and every process lazily rebuilds on its next
+read. Concurrent misses in a process are collapsed so only one thread rebuilds.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'service:catalog:version'
+
+_snapshot = None
+_rebuild_lock = threading.Lock()
+
+
+class CatalogSnapshot:
+    """
+    Immutable view of the active catalog at a given version.
+
+    Types have their ``service`` relation pre-populated from ``services``, so
+    reading ``service_type.service`` never hits the database. Instances are
+    shared between threads and must be treated as read-only.
+    """
+
+    def __init__(self, version, services, types):
+        self.version = version
+        self.services = services
+        self.types = types
+        self.built_at = time.monotonic()
+
+    def is_fresh(self, version):
+        """Return True if this snapshot is current for the given version."""
+        timeout = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+        return self.version == version and time.monotonic() - self.built_at < timeout
+
+
+def normalize_id(value):
+    """Return the canonical string form of an ID, or None if it is malformed."""
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
+
+
+def get_version():
+    """
+    Get the global catalog version, seeding it if the cache has none.
+
+    The seed is time-based so a version evicted from the cache never comes back
+    with a value an existing snapshot was built for.
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def invalidate():
+    """
+    Bump the global catalog version so every process rebuilds on next read.
+
+    Returns:
+        int: the new version, or None if the version had to be reseeded
+    """
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        return None
+
+
+def _build_snapshot(version):
+    """Load the active catalog with one query for services and one for types."""
+    from .models import Service, Type
+
+    services = {str(service.id): service for service in Service.objects.filter(is_active=True)}
+    types = {}
+    for service_type in Type.objects.filter(is_active=True, service__is_active=True):
+        service = services.get(str(service_type.service_id))
+        if service is None:
+            continue  # Service was deactivated between the two queries
+        service_type.service = service
+        types[str(service_type.id)] = service_type
+    return CatalogSnapshot(version, services, types)
+
+
+def get_catalog():
+    """
+    Get the current catalog snapshot, rebuilding it if the version moved on.
+    """
+    global _snapshot
+
+    version = get_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.is_fresh(version):
+        return snapshot
+
+    with _rebuild_lock:
+        # Another thread may have rebuilt while we waited for the lock
+        snapshot = _snapshot
+        if snapshot is None or not snapshot.is_fresh(version):
+            snapshot = _build_snapshot(version)
+            _snapshot = snapshot
+    return snapshot
+
+
+def get_service(service_id):
+    """Get an active Service by ID from the catalog, or None."""
+    return get_catalog().services.get(normalize_id(service_id))
+
+
+def get_type(service_type_id):
+    """Get an active Type (with its service) by ID from the catalog, or None."""
+    return get_catalog().types.get(normalize_id(service_type_id))
+
+
+def get_services(service_ids):
+    """
+    Resolve Service IDs to instances, serving active services from the catalog
+    and fetching any others (inactive ones) with a single query.
+
+    Returns:
+        dict: Service instances keyed by their string ID
+    """
+    from .models import Service
+
+    catalog = get_catalog()
+    found, missing = {}, set()
+    for service_id in filter(None, map(normalize_id, service_ids)):
+        if service_id in catalog.services:
+            found[service_id] = catalog.services[service_id]
+        else:
+            missing.add(service_id)
+    if missing:
+        found.update({str(service.id): service for service in Service.objects.filter(id__in=missing)})
+    return found
+
+
+def get_types(service_type_ids):
+    """
+    Resolve Type IDs to instances, serving active types from the catalog and
+    fetching any others (inactive ones) with a single select_related query.
+
+    Returns:
+        dict: Type instances keyed by their string ID
+    """
+    from .models import Type
+
+    catalog = get_catalog()
+    found, missing = {}, set()
+    for service_type_id in filter(None, map(normalize_id, service_type_ids)):
+        if service_type_id in catalog.types:
+            found[service_type_id] = catalog.types[service_type_id]
+        else:
+            missing.add(service_type_id)
+    if missing:
+        found.update({
+            str(service_type.id): service_type
+            for service_type in Type.objects.select_related('service').filter(id__in=missing)
+        })
+    return found
@@ -0,0 +1,83 @@
+from random import Random
+import statistics
+import time
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from service import catalog, search
+from service.models import Service, Type
+
+DEFAULT_QUERIES = ['logo', 'bra', 'web design', 'mobile app', 'so me', 'seo audit video']
+COMMON_WORDS = ['logo', 'brand', 'web', 'site', 'mobile', 'app', 'seo', 'audit', 'video', 'edit', 'social', 'media', 'design']
+
+
+def synthetic_snapshot(type_count, types_per_service=40):
+    """
+    Build an unsaved catalog snapshot of type_count types with random titles,
+    names and features mixing a few common words into a large vocabulary.
+    """
+    random = Random(0)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = COMMON_WORDS + [''.join(random.choices(letters, k=random.randint(4, 9))) for _ in range(5000)]
+
+    def text(count):
+        return ' '.join([random.choice(COMMON_WORDS)] + random.choices(words, k=count - 1))
+
+    services, types = {}, {}
+    for type_number in range(type_count):
+        service_number = type_number // types_per_service
+        service = services.get(str(uuid.UUID(int=service_number)))
+        if service is None:
+            service = Service(id=uuid.UUID(int=service_number), title=text(2).title(), description=text(8))
+            services[str(service.id)] = service
+        service_type = Type(
+            id=uuid.UUID(int=10 ** 9 + type_number),
+            service=service, name=text(2).title(), description=[text(4) for _ in range(3)],
+        )
+        types[str(service_type.id)] = service_type
+    return catalog.CatalogSnapshot(0, services, types)
+
+
+class Command(BaseCommand):
+    """
+    Micro-benchmark of search queries against an index of the active catalog,
+    or of a generated in-memory catalog with --synthetic, reporting the median
+    and 95th percentile time per query.
+
+    Builds its own index and never writes to the database, so it is safe to
+    run anywhere. The target is a median under a millisecond per query on a
+    catalog of tens of thousands of types.
+    """
+    help = 'Measure search time per query'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queries', nargs='*', help='Queries to run (defaults to a mix of single and multi-word queries)')
+        parser.add_argument('--synthetic', type=int, metavar='TYPES', help='Search a generated catalog of this many types instead of the active catalog')
+        parser.add_argument('--iterations', type=int, default=200, help='Runs per query')
+        parser.add_argument('--limit', type=int, default=20, help='Results per query')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+        if options['synthetic']:
+            snapshot = synthetic_snapshot(options['synthetic'])
+        else:
+            snapshot = catalog.get_catalog()
+        if not snapshot.types and not snapshot.services:
+            raise CommandError('The catalog is empty; pass --synthetic to benchmark a generated one')
+
+        started = time.perf_counter()
+        index = search.SearchIndex.build(snapshot)
+        build_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(f'Services: {len(snapshot.services)}, types: {len(snapshot.types)}, index built in {build_ms:.0f} ms')
+
+        iterations = options['iterations']
+        self.stdout.write(f'{"Query":<24}{"hits":>6}{"median ms":>12}{"p95 ms":>10}')
+        for query in options['queries'] or DEFAULT_QUERIES:
+            timings = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                hits = index.search(query, options['limit'])
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            self.stdout.write(f'{query:<24}{len(hits):>6}{statistics.median(timings):>12.3f}{p95:>10.3f}')
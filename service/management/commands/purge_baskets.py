@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from service.basket_store import get_basket_store
+
+
+class Command(BaseCommand):
+    help = 'Delete baskets that have been idle for longer than BASKET_TTL'
+
+    def handle(self, *args, **options):
+        deleted = get_basket_store().purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired baskets'))
@@ -1,6 +1,7 @@
+import time
 import uuid
 from django.db import models
-from core.validators import validate_logo_file_extension
+from core.validators import validate_image_dimensions, validate_logo_file_extension
 
 class Service(models.Model):
     """
@@ -8,9 +9,12 @@ class Service(models.Model):
     """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     title = models.CharField(max_length=255)
-    logo = models.FileField(upload_to='logos/')
+    logo = models.FileField(upload_to='logos/', validators=[validate_logo_file_extension, validate_image_dimensions])
     description = models.TextField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Resized copies of the logo, see core.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return self.title
@@ -26,6 +30,43 @@ class Type(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     is_active = models.BooleanField(default=True)
     recommended = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.service.title}-{self.name}"
+
+
+class Basket(models.Model):
+    """
+    Represents a shopping basket kept by the database basket store.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Bumped on every change; seeded from the clock so a recreated basket never
+    # repeats a version an old ETag was issued for
+    version = models.BigIntegerField(default=time.time_ns)
+
+    def __str__(self):
+        return str(self.id)
+
+class BasketLine(models.Model):
+    """
+    Represents one service type line in a basket.
+    """
+    basket = models.ForeignKey(Basket, on_delete=models.CASCADE, related_name='lines')
+    key = models.CharField(max_length=100)
+    service_id = models.UUIDField()
+    service_type_id = models.UUIDField()
+    quantity = models.IntegerField(default=1)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['basket', 'key'], name='unique_basket_line'),
+        ]
+
+    def __str__(self):
+        return f"{self.basket_id} - {self.key} x {self.quantity}"
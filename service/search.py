@@ -0,0 +1,366 @@
+"""
+In-process full-text search over the active service catalog.
+
+Each process keeps an inverted index (token -> {document: weight}) of service
+titles and descriptions and of type names and feature lists, built from the
+catalog snapshot (see service.catalog) and tagged with its catalog version.
+Saving or deleting a Service or Type updates the saving process's index in
+place (see service.signals); any other process notices the catalog version
+moved on and rebuilds on its next search. One thread rebuilds while the others
+keep searching the previous index, so searches never wait on a rebuild once a
+process has an index.
+
+Queries are tokenized like documents. Every term must match (AND); terms of
+SEARCH_MIN_PREFIX or more characters also match longer tokens at a reduced
+weight, so partial words typed in a search box find results. Hits are ranked
+by the summed field weights of their matched terms. The first SEARCH_MAX_TERMS
+terms are used, and they share one budget of SEARCH_MAX_PREFIX_EXPANSIONS
+prefix expansions, so the work per query is bounded however it is written.
+"""
+import bisect
+import heapq
+import itertools
+from operator import itemgetter
+import re
+import threading
+import time
+import unicodedata
+from django.conf import settings
+from . import catalog
+
+SERVICE_TITLE_WEIGHT = 3
+SERVICE_DESCRIPTION_WEIGHT = 1
+TYPE_NAME_WEIGHT = 3
+TYPE_FEATURES_WEIGHT = 1
+TYPE_SERVICE_TITLE_WEIGHT = 1
+PREFIX_MATCH_FACTOR = 0.5
+
+_TOKEN_RE = re.compile(r'\w+')
+
+_index = None
+_lock = threading.Lock()
+
+
+def tokenize(text):
+    """Split text into lowercase tokens with accents removed."""
+    text = str(text)
+    if not text.isascii():
+        decomposed = unicodedata.normalize('NFKD', text)
+        text = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return _TOKEN_RE.findall(text.casefold())
+
+
+def _strings(value):
+    """Yield every string inside a JSON value, e.g. a type's feature list."""
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _strings(item)
+
+
+def _weigh(fields):
+    """Sum field weights per token for (text, weight) pairs."""
+    weights = {}
+    for text, weight in fields:
+        for token in tokenize(text or ''):
+            weights[token] = weights.get(token, 0) + weight
+    return weights
+
+
+def service_document(service):
+    return f's:{service.id}', _weigh([
+        (service.title, SERVICE_TITLE_WEIGHT),
+        (service.description, SERVICE_DESCRIPTION_WEIGHT),
+    ])
+
+
+def type_document(service_type, service):
+    return f't:{service_type.id}', _weigh([
+        (service_type.name, TYPE_NAME_WEIGHT),
+        (' '.join(_strings(service_type.description)), TYPE_FEATURES_WEIGHT),
+        (service.title, TYPE_SERVICE_TITLE_WEIGHT),
+    ])
+
+
+class SearchIndex:
+    """
+    Inverted index over one version of the catalog.
+
+    Each token's postings dict is kept in descending weight order, so the best
+    hits of a single-term query are read off the front without scoring every
+    matching document. Writers hold the module lock and never mutate a posting dict or the
+    vocabulary list in place; they swap in updated copies, so searches in
+    other threads can read without locking.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.built_at = time.monotonic()
+        self._postings = {}
+        self._vocabulary = []
+        self._documents = {}
+        self._service_types = {}
+
+    @classmethod
+    def build(cls, snapshot):
+        """Index every active service and type of a catalog snapshot."""
+        index = cls(snapshot.version)
+        for service in snapshot.services.values():
+            index._add(*service_document(service))
+        for service_type in snapshot.types.values():
+            index._add(*type_document(service_type, service_type.service))
+            index._service_types.setdefault(str(service_type.service_id), set()).add(str(service_type.id))
+        index._postings = {token: _ranked(postings) for token, postings in index._postings.items()}
+        index._vocabulary = sorted(index._postings)
+        return index
+
+    def _add(self, document, weights):
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                self._postings[token] = {document: weight}
+            else:
+                postings[document] = weight
+        self._documents[document] = weights
+
+    def _replace(self, document, weights):
+        """Copy-on-write replacement of one document, used for incremental updates."""
+        old_weights = self._documents.pop(document, {})
+        new_tokens = []
+        for token in old_weights.keys() - weights.keys():
+            postings = {doc: weight for doc, weight in self._postings[token].items() if doc != document}  # Still ranked
+            if postings:
+                self._postings[token] = postings
+            else:
+                del self._postings[token]
+                vocabulary = list(self._vocabulary)
+                vocabulary.pop(bisect.bisect_left(vocabulary, token))
+                self._vocabulary = vocabulary
+        for token, weight in weights.items():
+            if token not in self._postings:
+                new_tokens.append(token)
+            self._postings[token] = _ranked({**self._postings.get(token, {}), document: weight})
+        if new_tokens:
+            self._vocabulary = sorted(self._vocabulary + new_tokens)
+        if weights:
+            self._documents[document] = weights
+
+    def update_service(self, service, service_types):
+        """Reindex a service and its active types, or drop them if inactive."""
+        service_id = str(service.id)
+        active = service.is_active
+        self._replace(f's:{service_id}', service_document(service)[1] if active else {})
+        current = {str(service_type.id) for service_type in service_types} if active else set()
+        for type_id in self._service_types.get(service_id, set()) - current:
+            self._replace(f't:{type_id}', {})
+        for service_type in service_types if active else ():
+            self._replace(*type_document(service_type, service))
+        self._service_types[service_id] = current
+
+    def update_type(self, service_type, service):
+        """Reindex a type, or drop it if it or its service is inactive."""
+        type_id = str(service_type.id)
+        type_ids = set(self._service_types.get(str(service.id), set()))
+        if service_type.is_active and service.is_active:
+            self._replace(*type_document(service_type, service))
+            type_ids.add(type_id)
+        else:
+            self._replace(f't:{type_id}', {})
+            type_ids.discard(type_id)
+        self._service_types[str(service.id)] = type_ids
+
+    def remove(self, document):
+        """Drop a document from the index."""
+        self._replace(document, {})
+
+    def _expand(self, term, min_prefix, max_expansions):
+        """
+        Indexed tokens matching one query term.
+
+        Returns:
+            list: (postings, weight factor) pairs, the exact token first
+        """
+        expansions = []
+        if term in self._postings:
+            expansions.append((self._postings[term], 1))
+        if len(term) >= min_prefix:
+            vocabulary = self._vocabulary
+            position = bisect.bisect_right(vocabulary, term)
+            for token in vocabulary[position:position + max_expansions]:
+                if not token.startswith(term):
+                    break
+                expansions.append((self._postings.get(token, {}), PREFIX_MATCH_FACTOR))
+        return expansions
+
+    def _stream(self, expansions):
+        """
+        Yield (document, weight) for one term in descending weight order,
+        merged lazily from the ranked postings of its expansions.
+        """
+        if len(expansions) == 1:
+            (postings, factor), = expansions
+            yield from postings.items() if factor == 1 else ((doc, weight * factor) for doc, weight in postings.items())
+            return
+        ranked = heapq.merge(*(
+            ((-weight * factor, document) for document, weight in postings.items())
+            for postings, factor in expansions
+        ))
+        seen = set()
+        for negative_weight, document in ranked:
+            if document not in seen:
+                seen.add(document)
+                yield document, -negative_weight
+
+    def _candidates(self, expansions, max_candidates):
+        """
+        Up to max_candidates of one term's best-weighted documents.
+
+        Only the first max_candidates postings of each expansion can make the
+        cut, since postings are ranked, so at most that many are read from each.
+        """
+        candidates = {}
+        for postings, factor in expansions:
+            for document, weight in itertools.islice(postings.items(), max_candidates):
+                weight *= factor
+                if weight > candidates.get(document, 0):
+                    candidates[document] = weight
+        if len(candidates) > max_candidates:
+            candidates = dict(heapq.nlargest(max_candidates, candidates.items(), key=itemgetter(1)))
+        return candidates
+
+    def _score(self, scores, expansions):
+        """
+        Add one term's weight to each candidate, dropping candidates it does
+        not match. Each expansion is joined from its smaller side, so rare
+        prefix expansions cost little however many candidates there are.
+        """
+        best = {}
+        for postings, factor in expansions:
+            if len(postings) < len(scores):
+                matches = ((document, weight) for document, weight in postings.items() if document in scores)
+            else:
+                matches = ((document, postings[document]) for document in scores if document in postings)
+            for document, weight in matches:
+                weight *= factor
+                if weight > best.get(document, 0):
+                    best[document] = weight
+        return {document: scores[document] + weight for document, weight in best.items()}
+
+    def search(self, query, limit=20):
+        """
+        Find documents matching every term of the query.
+
+        A single term reads its best hits straight off the ranked postings.
+        Longer queries take up to SEARCH_MAX_CANDIDATES of the rarest term's
+        best-weighted documents and score them against the other terms with
+        dictionary lookups, which bounds the work for very common words.
+        Prefix expansions are split evenly between the terms.
+
+        Returns:
+            list: (document, score) pairs, best first, where document is
+            "s:<service id>" or "t:<type id>"
+        """
+        min_prefix = getattr(settings, 'SEARCH_MIN_PREFIX', 2)
+        max_expansions = getattr(settings, 'SEARCH_MAX_PREFIX_EXPANSIONS', 50)
+        max_candidates = getattr(settings, 'SEARCH_MAX_CANDIDATES', 500)
+        max_terms = getattr(settings, 'SEARCH_MAX_TERMS', 8)
+        terms = list(dict.fromkeys(tokenize(query)))[:max_terms]
+        if not terms or limit < 1:
+            return []
+        term_max_expansions = max(max_expansions // len(terms), 1)
+        term_expansions = [self._expand(term, min_prefix, term_max_expansions) for term in terms]
+        if not all(term_expansions):
+            return []
+        if len(term_expansions) == 1:
+            return list(itertools.islice(self._stream(term_expansions[0]), limit))
+
+        term_expansions.sort(key=lambda expansions: sum(len(postings) for postings, _ in expansions))
+        scores = self._candidates(term_expansions[0], max_candidates)
+        for expansions in term_expansions[1:]:
+            scores = self._score(scores, expansions)
+            if not scores:
+                return []
+        return heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+
+
+def _ranked(postings):
+    """Reorder a postings dict by descending weight."""
+    return dict(sorted(postings.items(), key=itemgetter(1), reverse=True))
+
+
+def _is_fresh(index, snapshot):
+    timeout = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+    return index.version == snapshot.version and time.monotonic() - index.built_at < timeout
+
+
+def get_index():
+    """
+    Get the search index for the current catalog, rebuilding it if it is
+    behind the catalog version.
+
+    Only the first thread to notice a stale index rebuilds it; until it is
+    done, other threads get the previous index. Look documents up in the
+    returned snapshot and skip those it does not have, as they may be gone.
+
+    Returns:
+        tuple: (SearchIndex, CatalogSnapshot), the index possibly one
+        rebuild behind the snapshot
+    """
+    global _index
+
+    snapshot = catalog.get_catalog()
+    index = _index
+    if index is not None and _is_fresh(index, snapshot):
+        return index, snapshot
+
+    # With no index yet there is nothing to serve, so wait for the build
+    if not _lock.acquire(blocking=index is None):
+        return index, snapshot
+    try:
+        index = _index
+        if index is None or not _is_fresh(index, snapshot):
+            index = SearchIndex.build(snapshot)
+            _index = index
+    finally:
+        _lock.release()
+    return index, snapshot
+
+
+def apply_change(instance, deleted, version):
+    """
+    Update this process's index for one committed Service or Type change.
+
+    Only applied when the change produced the catalog version right after the
+    index's own; otherwise the index missed a change and is left to rebuild on
+    the next search.
+
+    Args:
+        instance: saved or deleted Service or Type
+        deleted: True if the instance was deleted
+        version: catalog version produced by the change
+    """
+    from .models import Service, Type
+
+    with _lock:
+        index = _index
+        if index is None or version is None or index.version != version - 1:
+            return
+        if isinstance(instance, Service):
+            if deleted:
+                index.remove(f's:{instance.id}')
+                for type_id in index._service_types.pop(str(instance.id), set()):
+                    index.remove(f't:{type_id}')
+            else:
+                index.update_service(instance, list(Type.objects.filter(service=instance, is_active=True)))
+        elif deleted:
+            index.remove(f't:{instance.id}')
+            index._service_types.get(str(instance.service_id), set()).discard(str(instance.id))
+        else:
+            service = Service.objects.filter(pk=instance.service_id).first()
+            if service is not None:
+                index.update_type(instance, service)
+        index.version = version
@@ -1,14 +1,30 @@
 from rest_framework import serializers
+from core.dynamic_fields import DynamicFieldsMixin
+from core.serializers import SrcsetField
 from .models import Service, Type
 
-class TypeSerializer(serializers.ModelSerializer):
+class TypeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Type
         fields = '__all__'
+        # ?expand=service nests the service summary instead of its ID
+        expandable_fields = {
+            'service': ('service.serializers.ServiceSummarySerializer', {}),
+        }
 
-class ServiceSerializer(serializers.ModelSerializer):
+class ServiceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     types = TypeSerializer(source='type_set', many=True, read_only=True)
+    logo_srcset = SrcsetField('logo')
     
     class Meta:
         model = Service
-        fields = '__all__'
\ No newline at end of file
+        exclude = ['image_variants']
+
+class ServiceSummarySerializer(serializers.ModelSerializer):
+    """
+    Compact service representation without its types, for embedding in
+    basket lines where the line's own type is serialized separately.
+    """
+    class Meta:
+        model = Service
+        fields = ['id', 'title', 'description', 'logo', 'is_active']
@@ -0,0 +1,22 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import catalog, search
+from .models import Service, Type
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+@receiver(post_save, sender=Type)
+@receiver(post_delete, sender=Type)
+def invalidate_catalog(sender, instance, signal, **kwargs):
+    """
+    Bump the catalog version once the change is committed, so no process can
+    rebuild its snapshot from data that is about to be rolled back or replaced,
+    then apply the change to this process's search index.
+    """
+    def on_commit():
+        version = catalog.invalidate()
+        search.apply_change(instance, signal is post_delete, version)
+
+    transaction.on_commit(on_commit)
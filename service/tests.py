@@ -1,3 +1,417 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from random import Random
+import threading
+import time
+import uuid
+from unittest import mock
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core import signing
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+from . import catalog, search
+from .basket_store import BasketBusy, CacheBasketStore, DatabaseBasketStore, get_basket_store
+from .models import Basket, BasketLine, Service, Type
+from .views import BASKET_COOKIE_SALT, ServiceViewSet, SessionBasketView, TypeViewSet, clear_basket
 
-# Create your tests here.
+
+@override_settings(BASKET_STORE='service.basket_store.DatabaseBasketStore')
+class BasketTestCase(TestCase):
+    """
+    A database-backed basket with 50 lines across 10 services.
+    """
+
+    def setUp(self):
+        self.basket_id = '5f0c3c4e-9a34-4f7c-b1c2-2f0a8c3f9d10'
+        store = get_basket_store()
+        for service_number in range(10):
+            service = Service.objects.create(title=f'Service {service_number}', logo='logos/logo.png')
+            for type_number in range(5):
+                service_type = Type.objects.create(service=service, name=f'Type {type_number}', price=Decimal('10.00'))
+                store.add_line(self.basket_id, f'{service.id}_{service_type.id}', {
+                    'service_id': str(service.id),
+                    'service_type_id': str(service_type.id),
+                    'quantity': 2,
+                    'price': 10.0,
+                })
+        # Signals invalidate the catalog on commit, which never happens inside a TestCase
+        catalog.invalidate()
+
+    def get_basket(self, method='get', path='/basket/', data=None, headers=None):
+        request = getattr(APIRequestFactory(), method)(path, data, format='json', headers=headers)
+        cookie_signer = signing.get_cookie_signer(salt=settings.BASKET_COOKIE_NAME + BASKET_COOKIE_SALT)
+        request.COOKIES[settings.BASKET_COOKIE_NAME] = cookie_signer.sign(self.basket_id)
+        return SessionBasketView.as_view()(request)
+
+
+class BasketDetailsQueryTests(BasketTestCase):
+    """
+    The detailed basket must resolve all of its lines in bulk, not per line.
+    """
+
+    def test_fifty_line_basket_uses_bulk_queries(self):
+        # The basket version for the ETag, the basket lines, services and types
+        with self.assertNumQueries(4):
+            response = self.get_basket()
+        self.assertEqual(response.data['total_items'], 50)
+        self.assertEqual(response.data['total_amount'], 1000.0)
+
+    def test_warm_catalog_only_reads_basket_lines(self):
+        self.get_basket()
+        with self.assertNumQueries(2):
+            self.get_basket()
+
+    def test_lines_embed_service_summary_without_types(self):
+        item = self.get_basket().data['items'][0]
+        self.assertEqual(set(item['service']), {'id', 'title', 'description', 'logo', 'is_active'})
+
+
+class BasketConditionalResponseTests(BasketTestCase):
+    """
+    GET supports If-None-Match, and mutations can return a compact body.
+    """
+
+    def line_data(self):
+        line = next(iter(get_basket_store().get_lines(self.basket_id).values()))
+        return {'service_id': line['service_id'], 'service_type_id': line['service_type_id']}
+
+    def test_unchanged_basket_is_not_modified(self):
+        etag = self.get_basket()['ETag']
+        with self.assertNumQueries(1):
+            response = self.get_basket(headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_mutation_changes_etag(self):
+        etag = self.get_basket()['ETag']
+        response = self.get_basket('patch', data={**self.line_data(), 'quantity': 5})
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.get_basket(headers={'If-None-Match': etag}).status_code, 200)
+        self.assertEqual(self.get_basket(headers={'If-None-Match': response['ETag']}).status_code, 304)
+
+    def test_compact_mutation_returns_changed_line_and_totals(self):
+        data = {**self.line_data(), 'quantity': 5}
+        response = self.get_basket('patch', '/basket/?response=compact', data)
+        self.assertNotIn('basket', response.data)
+        self.assertEqual(response.data['item']['quantity'], 5)
+        self.assertEqual(response.data['total_items'], 50)
+        self.assertEqual(response.data['total_amount'], 1030.0)
+
+    def test_compact_removal_has_no_item(self):
+        response = self.get_basket('delete', '/basket/', self.line_data(), headers={'Prefer': 'return=minimal'})
+        self.assertIsNone(response.data['item'])
+        self.assertEqual(response.data['total_items'], 49)
+
+
+class BasketIdNormalizationTests(BasketTestCase):
+    """
+    Basket requests find services and lines whatever the case of their IDs.
+    """
+
+    def test_upper_case_ids_add_to_the_existing_line(self):
+        line = next(iter(get_basket_store().get_lines(self.basket_id).values()))
+        data = {
+            'service_id': line['service_id'].upper(),
+            'service_type_id': line['service_type_id'].upper(),
+            'quantity': 1,
+            'price': 10.0,
+        }
+        response = self.get_basket('post', '/basket/?response=compact', data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['item']['quantity'], 3)
+        self.assertEqual(response.data['total_items'], 50)
+
+    def test_malformed_ids_are_not_found(self):
+        response = self.get_basket('post', data={'service_id': 'nope', 'service_type_id': 'nope', 'price': 10.0})
+        self.assertEqual(response.status_code, 404)
+
+
+class BasketStoreTests(TestCase):
+    """
+    Basket store mutations are atomic per line, ignore expired baskets and
+    pick up baskets left in the session.
+    """
+    basket_id = '0b6a5a0e-3f43-4bb4-9a4b-5d6c1f1c2e01'
+
+    def line(self, quantity=1):
+        return {
+            'service_id': '7d7e1f0a-6d0c-4a53-8b2f-0d3c6a4b5e11',
+            'service_type_id': '2c1b9a8d-7e6f-4a5b-9c3d-1e2f3a4b5c6d',
+            'quantity': quantity,
+            'price': 10.0,
+        }
+
+    def test_concurrent_adds_are_all_counted(self):
+        store = CacheBasketStore()
+        threads = [threading.Thread(target=store.add_line, args=(self.basket_id, 'a', self.line())) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(store.get_lines(self.basket_id)['a']['quantity'], 10)
+        store.clear(self.basket_id)
+
+    @override_settings(BASKET_TTL=100)
+    def test_cache_basket_expires_as_a_whole(self):
+        store = CacheBasketStore()
+        now = time.time()
+        with mock.patch('time.time', return_value=now):
+            store.add_line(self.basket_id, 'a', self.line())
+        with mock.patch('time.time', return_value=now + 90):
+            store.add_line(self.basket_id, 'b', self.line())
+        with mock.patch('time.time', return_value=now + 150):
+            # Past a's own timeout, but the basket changed 60 seconds ago
+            self.assertEqual(set(store.get_lines(self.basket_id)), {'a', 'b'})
+        with mock.patch('time.time', return_value=now + 200):
+            self.assertEqual(store.get_lines(self.basket_id), {})
+
+    def test_busy_cache_basket_raises_and_keeps_the_holders_lock(self):
+        store = CacheBasketStore()
+        store.lock_wait = 0.05
+        lock_key = f'basket:{self.basket_id}:lock'
+        cache.add(lock_key, 'other', 60)
+        try:
+            with self.assertRaises(BasketBusy):
+                store.add_line(self.basket_id, 'a', self.line())
+            self.assertEqual(cache.get(lock_key), 'other')
+            self.assertEqual(store.get_lines(self.basket_id), {})
+        finally:
+            cache.delete(lock_key)
+
+    def test_expired_cache_basket_lock_is_not_released_for_its_next_holder(self):
+        store = CacheBasketStore()
+        lock_key = f'basket:{self.basket_id}:lock'
+        with store._lock(self.basket_id):
+            # Our lock expired and another request took it
+            cache.set(lock_key, 'other', 60)
+        self.assertEqual(cache.get(lock_key), 'other')
+        cache.delete(lock_key)
+
+    def test_add_that_loses_the_insert_race_increments(self):
+        store = DatabaseBasketStore()
+        store.add_line(self.basket_id, 'a', self.line())
+        original_update = QuerySet.update
+        missed = []
+
+        def update(queryset, **kwargs):
+            # The first increment misses the line, as if it were inserted concurrently
+            if queryset.model is BasketLine and not missed:
+                missed.append(True)
+                return 0
+            return original_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', update):
+            line = store.add_line(self.basket_id, 'a', self.line(2))
+        self.assertEqual(line['quantity'], 3)
+
+    def test_expired_basket_is_not_revived(self):
+        store = DatabaseBasketStore()
+        store.add_line(self.basket_id, 'a', self.line(3))
+        Basket.objects.filter(pk=self.basket_id).update(updated_at=timezone.now() - timedelta(days=30))
+        self.assertEqual(store.get_lines(self.basket_id), {})
+        self.assertIsNone(store.set_quantity(self.basket_id, 'a', 5))
+        self.assertFalse(store.remove_line(self.basket_id, 'a'))
+        self.assertEqual(store.add_line(self.basket_id, 'a', self.line())['quantity'], 1)
+
+    def test_replace_writes_only_changes(self):
+        store = DatabaseBasketStore()
+        store.add_line(self.basket_id, 'a', self.line())
+        store.add_line(self.basket_id, 'b', self.line())
+        store.replace(self.basket_id, {'a': self.line(4), 'c': self.line(2)})
+        lines = store.get_lines(self.basket_id)
+        self.assertEqual({key: line['quantity'] for key, line in lines.items()}, {'a': 4, 'c': 2})
+
+    @override_settings(BASKET_STORE='service.basket_store.DatabaseBasketStore')
+    def test_session_basket_is_migrated_on_read(self):
+        service = Service.objects.create(title='Logo Design', logo='logos/logo.png')
+        service_type = Type.objects.create(service=service, name='Premium', price=Decimal('10.00'))
+        catalog.invalidate()
+        request = APIRequestFactory().get('/basket/')
+        request.session = SessionStore()
+        request.session['basket'] = {f'{service.id}_{service_type.id}': {
+            'service_id': str(service.id), 'service_type_id': str(service_type.id), 'quantity': 2, 'price': 10.0,
+        }}
+        response = SessionBasketView.as_view()(request)
+        self.assertEqual(response.data['total_items'], 1)
+        self.assertEqual(response.data['total_amount'], 20.0)
+        self.assertIn(settings.BASKET_COOKIE_NAME, response.cookies)
+        self.assertNotIn('basket', request.session)
+
+    @override_settings(BASKET_STORE='service.basket_store.DatabaseBasketStore')
+    def test_clearing_a_session_basket_sets_the_cookie(self):
+        request = APIRequestFactory().delete('/basket/clear/')
+        request.session = SessionStore()
+        service_id, service_type_id = str(uuid.uuid4()), str(uuid.uuid4())
+        request.session['basket'] = {f'{service_id}_{service_type_id}': {
+            'service_id': service_id, 'service_type_id': service_type_id, 'quantity': 1, 'price': 1.0,
+        }}
+        response = clear_basket(request)
+        self.assertEqual(response.status_code, 200)
+        basket_id = signing.get_cookie_signer(salt=settings.BASKET_COOKIE_NAME + BASKET_COOKIE_SALT).unsign(
+            response.cookies[settings.BASKET_COOKIE_NAME].value
+        )
+        self.assertEqual(get_basket_store().get_lines(basket_id), {})
+
+
+class CatalogSearchTests(TestCase):
+    """
+    Prefix and ranked matching over the in-memory catalog index.
+    """
+
+    def setUp(self):
+        self.logo = Service.objects.create(title='Logo Design', logo='logos/logo.png', description='Brand identity')
+        self.web = Service.objects.create(title='Web Development', logo='logos/web.png', description='Sites with a logo')
+        self.premium = Type.objects.create(
+            service=self.logo, name='Premium', price=Decimal('99.00'), description=['Three concepts', 'Vector files']
+        )
+        Type.objects.create(service=self.web, name='Basic', price=Decimal('49.00'), is_active=False)
+        catalog.invalidate()
+
+    def search(self, query):
+        index, _ = search.get_index()
+        return [document for document, _ in index.search(query)]
+
+    def test_title_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('logo')[0], f's:{self.logo.id}')
+        self.assertIn(f's:{self.web.id}', self.search('logo'))
+
+    def test_prefix_terms_must_all_match(self):
+        self.assertEqual(self.search('vec conc'), [f't:{self.premium.id}'])
+        self.assertEqual(self.search('vector web'), [])
+
+    def test_inactive_types_are_not_indexed(self):
+        self.assertEqual(self.search('basic'), [])
+
+    def test_saved_type_updates_the_index_in_place(self):
+        index, _ = search.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.premium.name = 'Platinum'
+            self.premium.save()
+        self.assertIs(search.get_index()[0], index)
+        self.assertEqual(self.search('platinum'), [f't:{self.premium.id}'])
+        self.assertEqual(self.search('premium'), [])
+
+    def test_search_endpoint(self):
+        request = APIRequestFactory().get('/services/search/', {'q': 'premium logo'})
+        response = ServiceViewSet.as_view({'get': 'search'})(request)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['kind'], 'type')
+        self.assertEqual(response.data['results'][0]['service']['title'], 'Logo Design')
+
+
+class SearchIndexTests(SimpleTestCase):
+    """
+    Searches over a catalog of tens of thousands of types read a bounded number
+    of postings per query and never wait on a rebuild. Their latency is
+    measured by the benchmark_search command rather than here.
+    """
+    common_words = ['logo', 'brand', 'web', 'site', 'mobile', 'app', 'seo', 'audit', 'video', 'edit', 'social', 'media']
+
+    def build_snapshot(self, service_count=500, types_per_service=40, version=1):
+        random = Random(0)
+        letters = 'abcdefghijklmnopqrstuvwxyz'
+        words = self.common_words + [''.join(random.choices(letters, k=random.randint(4, 9))) for _ in range(5000)]
+
+        def text(count):
+            return ' '.join([random.choice(self.common_words)] + random.choices(words, k=count - 1))
+
+        services, types = {}, {}
+        for service_number in range(service_count):
+            service = Service(id=uuid.UUID(int=service_number), title=text(2).title(), description=text(8))
+            services[str(service.id)] = service
+            for type_number in range(types_per_service):
+                service_type = Type(
+                    id=uuid.UUID(int=10 ** 6 + service_number * types_per_service + type_number),
+                    service=service, name=text(2).title(), description=[text(4) for _ in range(3)],
+                )
+                types[str(service_type.id)] = service_type
+        return catalog.CatalogSnapshot(version, services, types)
+
+    def count_posting_reads(self, index):
+        """Make every postings read of the index count towards the returned list's length."""
+        reads = []
+
+        class CountingPostings(dict):
+            def items(self):
+                for item in super().items():
+                    reads.append(1)
+                    yield item
+
+            def __getitem__(self, document):
+                reads.append(1)
+                return super().__getitem__(document)
+
+            def __contains__(self, document):
+                reads.append(1)
+                return super().__contains__(document)
+
+        index._postings = {token: CountingPostings(postings) for token, postings in index._postings.items()}
+        return reads
+
+    @override_settings(SEARCH_MAX_PREFIX_EXPANSIONS=8, SEARCH_MAX_CANDIDATES=100)
+    def test_search_work_is_bounded_by_the_limits_not_the_catalog(self):
+        index = search.SearchIndex.build(self.build_snapshot())
+        reads = self.count_posting_reads(index)
+        self.assertGreater(sum(map(len, index._postings.values())), 100000)
+        for query in ['logo', 'bra', 'web site', 'mobile app', 'so me', 'seo audit video']:
+            terms = len(search.tokenize(query))
+            reads.clear()
+            index.search(query, 20)
+            if terms == 1:
+                # Each of the exact token and its expansions yields at most one document per result, plus one read ahead
+                bound = (20 + 1) * (8 + 1)
+            else:
+                # Candidates are read from the first term and scored against the others (a lookup and a read each)
+                bound = 2 * 100 * (8 + terms)
+            self.assertLessEqual(len(reads), bound, query)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_search', 'web design', synthetic=400, iterations=2, stdout=out)
+        self.assertIn('types: 400', out.getvalue())
+        self.assertIn('web design', out.getvalue())
+
+    @override_settings(SEARCH_MAX_PREFIX_EXPANSIONS=4, SEARCH_MAX_TERMS=2)
+    def test_expansions_are_shared_between_terms(self):
+        index = search.SearchIndex.build(self.build_snapshot(service_count=5, types_per_service=2))
+        with mock.patch.object(index, '_expand', wraps=index._expand) as expand:
+            index.search('s a m', 20)
+        self.assertEqual([call.args[2] for call in expand.call_args_list], [2, 2])
+
+    def test_stale_index_is_served_while_another_thread_rebuilds(self):
+        old_index = search.SearchIndex.build(self.build_snapshot(service_count=1, types_per_service=1))
+        snapshot = self.build_snapshot(service_count=1, types_per_service=1, version=2)
+        self.enterContext(mock.patch.object(search, '_index', old_index))
+        self.enterContext(mock.patch.object(catalog, 'get_catalog', return_value=snapshot))
+        with search._lock:
+            self.assertEqual(search.get_index(), (old_index, snapshot))
+        self.assertEqual(search.get_index()[0].version, 2)
+
+
+class SparseFieldsetTests(TestCase):
+    """
+    ?fields= drops unrequested fields and their queries; ?expand= nests relations.
+    """
+
+    def setUp(self):
+        self.service = Service.objects.create(title='Logo Design', logo='logos/logo.png')
+        Type.objects.create(service=self.service, name='Premium', price=Decimal('99.00'))
+
+    def test_fields_skip_nested_types_and_their_prefetch(self):
+        request = APIRequestFactory().get('/services/', {'fields': 'id,title'})
+        with self.assertNumQueries(1):
+            response = ServiceViewSet.as_view({'get': 'list'})(request)
+        self.assertEqual(set(response.data[0]), {'id', 'title'})
+
+    def test_expand_nests_the_service(self):
+        request = APIRequestFactory().get('/types/', {'fields': 'name', 'expand': 'service'})
+        with self.assertNumQueries(1):
+            response = TypeViewSet.as_view({'get': 'list'})(request)
+        self.assertEqual(response.data[0]['service']['title'], 'Logo Design')
+        self.assertEqual(set(response.data[0]), {'name', 'service'})
@@ -1,17 +1,28 @@
+import uuid
+from django.conf import settings
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response, patch_cache_control
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticatedOrReadOnly, AllowAny
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
+from core.conditional import ConditionalGetMixin
+from core.dynamic_fields import expanded_fields, field_requested
+from . import catalog, search
+from .basket_store import get_basket_store
 from .models import Service, Type
-from .serializers import ServiceSerializer, TypeSerializer
+from .serializers import ServiceSerializer, ServiceSummarySerializer, TypeSerializer
 
-class ServiceViewSet(viewsets.ReadOnlyModelViewSet):
+BASKET_COOKIE_SALT = 'service.basket'
+
+class ServiceViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Service.objects.all()
     serializer_class = ServiceSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    conditional_models = (Service, Type)
+    conditional_actions = ('list', 'retrieve', 'search')
 
     def list(self, request, *args, **kwargs):
         title = request.query_params.get('title', None)
@@ -21,158 +32,305 @@ class ServiceViewSet(viewsets.ReadOnlyModelViewSet):
             serializer = TypeSerializer(types, many=True)
             return Response(serializer.data)
         else:
-            # Use prefetch_related to optimize the query for related types
-            queryset = self.queryset.prefetch_related('type_set')
+            queryset = self.queryset
+            if field_requested(request, 'types'):
+                # Use prefetch_related to optimize the query for related types
+                queryset = queryset.prefetch_related('type_set')
             serializer = self.get_serializer(queryset, many=True)
             return Response(serializer.data)
 
-class TypeViewSet(viewsets.ReadOnlyModelViewSet):
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Search active services and types by title, name, description and
+        features, with prefix matching and ranked results.
+        
+        Query params: q (required), limit (default 20, at most SEARCH_MAX_RESULTS)
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {'error': 'q parameter is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), getattr(settings, 'SEARCH_MAX_RESULTS', 100))
+        except ValueError:
+            return Response(
+                {'error': 'limit must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        index, snapshot = search.get_index()
+        results = []
+        for document, score in index.search(query, max(limit, 1)):
+            kind, object_id = document.split(':', 1)
+            if kind == 's' and object_id in snapshot.services:
+                results.append({
+                    'kind': 'service',
+                    'score': score,
+                    'service': ServiceSummarySerializer(snapshot.services[object_id]).data,
+                })
+            elif kind == 't' and object_id in snapshot.types:
+                service_type = snapshot.types[object_id]
+                results.append({
+                    'kind': 'type',
+                    'score': score,
+                    'service': ServiceSummarySerializer(service_type.service).data,
+                    'service_type': TypeSerializer(service_type).data,
+                })
+        return Response({'query': query, 'count': len(results), 'results': results})
+
+class TypeViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Type.objects.all()
     serializer_class = TypeSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    conditional_models = (Type,)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if 'service' in expanded_fields(self.request):
+            queryset = queryset.select_related('service')
+        return queryset
+
+def get_basket_id(request, create=False):
+    """
+    Get the basket ID from the signed basket cookie.
+    
+    With create=True a new basket ID is issued when the client has none. A
+    basket still held in the client's session from before the basket store
+    existed is moved into the store under a new ID on any request, reads
+    included, so it shows up before the client's first change.
+    """
+    basket_id = getattr(request, '_basket_id', None)
+    if basket_id is None:
+        basket_id = request.get_signed_cookie(settings.BASKET_COOKIE_NAME, default=None, salt=BASKET_COOKIE_SALT)
+    if basket_id is None:
+        session = getattr(request, 'session', None)
+        legacy_basket = session.pop('basket', None) if session is not None else None
+        if legacy_basket or create:
+            basket_id = str(uuid.uuid4())
+            request._new_basket_id = True
+        if legacy_basket:
+            get_basket_store().replace(basket_id, legacy_basket)
+    request._basket_id = basket_id
+    return basket_id
+
+
+def set_basket_cookie(request, response):
+    """Send the basket cookie if a new basket ID was issued for this request."""
+    if getattr(request, '_new_basket_id', False):
+        response.set_signed_cookie(
+            settings.BASKET_COOKIE_NAME,
+            request._basket_id,
+            salt=BASKET_COOKIE_SALT,
+            max_age=settings.BASKET_TTL,
+            httponly=True,
+            samesite='Lax',
+            secure=settings.SESSION_COOKIE_SECURE,
+        )
+    return response
+
+
+def basket_etag(request):
+    """
+    ETag of the detailed basket.
+    
+    Built from the basket version and the catalog version, so it changes when
+    a line changes and when a service or type shown in the basket changes.
+    """
+    basket_id = get_basket_id(request)
+    version = get_basket_store().get_version(basket_id) if basket_id is not None else None
+    return f'"{version or 0}-{catalog.get_version()}"'
+
+
+def wants_compact_response(request):
+    """
+    Whether a basket mutation should return only the changed line and the new
+    totals, requested with ?response=compact or a Prefer: return=minimal header.
+    """
+    if request.query_params.get('response') == 'compact':
+        return True
+    return 'return=minimal' in request.headers.get('Prefer', '')
+
 
 class SessionBasketView(APIView):
     permission_classes = [AllowAny]
     
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        return set_basket_cookie(request, response)
+    
     def get_basket(self, request):
-        """Get basket from session"""
-        if 'basket' not in request.session:
-            request.session['basket'] = {}
-        return request.session['basket']
+        """Get basket lines from the basket store"""
+        basket_id = get_basket_id(request)
+        if basket_id is None:
+            return {}
+        return get_basket_store().get_lines(basket_id)
     
     def save_basket(self, request, basket):
-        """Save basket to session"""
-        request.session['basket'] = basket
-        request.session.modified = True
+        """Save a full basket to the basket store, writing only changed lines"""
+        get_basket_store().replace(get_basket_id(request, create=True), basket)
     
-    def get_basket_with_details(self, request):
-        """Get basket with full service and type details"""
-        basket = self.get_basket(request)
-        detailed_basket = []
-        total_amount = 0
+    def resolve_lines(self, basket):
+        """
+        Resolve basket lines against the catalog in bulk.
         
+        Lines whose service or type no longer exists are skipped.
+        
+        Returns:
+            list: (key, item, service, service_type) tuples
+        """
+        services = catalog.get_services(item['service_id'] for item in basket.values())
+        service_types = catalog.get_types(item['service_type_id'] for item in basket.values())
+        resolved = []
         for key, item in basket.items():
-            try:
-                service = Service.objects.get(id=item['service_id'])
-                service_type = Type.objects.get(id=item['service_type_id'])
-                
-                item_detail = {
-                    'key': key,
-                    'service': ServiceSerializer(service).data,
-                    'service_type': TypeSerializer(service_type).data,
-                    'quantity': item['quantity'],
-                    'price': float(item['price']),
-                    'subtotal': item['quantity'] * float(item['price'])
-                }
-                detailed_basket.append(item_detail)
-                total_amount += item_detail['subtotal']
-            except (Service.DoesNotExist, Type.DoesNotExist):
-                continue
+            service = services.get(catalog.normalize_id(item['service_id']))
+            service_type = service_types.get(catalog.normalize_id(item['service_type_id']))
+            if service is not None and service_type is not None:
+                resolved.append((key, item, service, service_type))
+        return resolved
+    
+    def get_line_detail(self, key, item, service, service_type):
+        """Serialize one resolved basket line"""
+        return {
+            'key': key,
+            'service': ServiceSummarySerializer(service).data,
+            'service_type': TypeSerializer(service_type).data,
+            'quantity': item['quantity'],
+            'price': float(item['price']),
+            'subtotal': item['quantity'] * float(item['price'])
+        }
+    
+    def get_basket_with_details(self, request):
+        """
+        Get basket with service and type details.
         
+        All lines are resolved together through the catalog (at most one bulk
+        query for services and one for types), and each line embeds a slim
+        service summary rather than the service's full type list.
+        """
+        detailed_basket = [
+            self.get_line_detail(*line) for line in self.resolve_lines(self.get_basket(request))
+        ]
         return {
             'items': detailed_basket,
             'total_items': len(detailed_basket),
-            'total_amount': total_amount
+            'total_amount': sum(item['subtotal'] for item in detailed_basket)
         }
     
+    def get_compact_basket(self, request, key):
+        """
+        Get only the changed line and the basket totals.
+        
+        'item' is None when the mutation removed the line.
+        """
+        lines = self.resolve_lines(self.get_basket(request))
+        changed = next((line for line in lines if line[0] == key), None)
+        return {
+            'key': key,
+            'item': self.get_line_detail(*changed) if changed else None,
+            'total_items': len(lines),
+            'total_amount': sum(item['quantity'] * float(item['price']) for _, item, _, _ in lines)
+        }
+    
+    def mutation_response(self, request, message, key):
+        """
+        Respond to a basket mutation with the full basket, or the compact form
+        if the client asked for it, plus the ETag of the new basket state.
+        """
+        if wants_compact_response(request):
+            data = {'message': message, **self.get_compact_basket(request, key)}
+        else:
+            data = {'message': message, 'basket': self.get_basket_with_details(request)}
+        response = Response(data)
+        response['ETag'] = basket_etag(request)
+        return response
+    
     def get(self, request):
-        """Get current basket"""
-        basket_data = self.get_basket_with_details(request)
-        return Response(basket_data)
+        """Get current basket, or 304 Not Modified if it matches If-None-Match"""
+        etag = basket_etag(request)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(self.get_basket_with_details(request))
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
     
     def post(self, request):
         """Add item to basket"""
-        service_id = request.data.get('service_id')
-        service_type_id = request.data.get('service_type_id')
+        service_id = catalog.normalize_id(request.data.get('service_id'))
+        service_type_id = catalog.normalize_id(request.data.get('service_type_id'))
         quantity = int(request.data.get('quantity', 1))
         price = float(request.data.get('price'))
         
         # Validate service and type exist
-        try:
-            service = Service.objects.get(id=service_id)
-            service_type = Type.objects.get(id=service_type_id)
-        except (Service.DoesNotExist, Type.DoesNotExist):
+        service = catalog.get_services([service_id]).get(service_id)
+        service_type = catalog.get_types([service_type_id]).get(service_type_id)
+        if service is None or service_type is None:
             return Response(
                 {'error': 'Service or service type not found'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        basket = self.get_basket(request)
         item_key = f"{service_id}_{service_type_id}"
-        
-        if item_key in basket:
-            # Update existing item
-            basket[item_key]['quantity'] += quantity
-        else:
-            # Add new item
-            basket[item_key] = {
-                'service_id': service_id,
-                'service_type_id': service_type_id,
-                'quantity': quantity,
-                'price': price
-            }
-        
-        self.save_basket(request, basket)
-        
-        return Response({
-            'message': 'Item added to basket successfully',
-            'basket': self.get_basket_with_details(request)
+        # Adds to the quantity of an existing line atomically
+        get_basket_store().add_line(get_basket_id(request, create=True), item_key, {
+            'service_id': service_id,
+            'service_type_id': service_type_id,
+            'quantity': quantity,
+            'price': price
         })
+        
+        return self.mutation_response(request, 'Item added to basket successfully', item_key)
     
     def patch(self, request):
         """Update item quantity"""
-        service_id = request.data.get('service_id')
-        service_type_id = request.data.get('service_type_id')
+        service_id = catalog.normalize_id(request.data.get('service_id'))
+        service_type_id = catalog.normalize_id(request.data.get('service_type_id'))
         quantity = int(request.data.get('quantity', 1))
         
-        basket = self.get_basket(request)
+        basket_id = get_basket_id(request)
         item_key = f"{service_id}_{service_type_id}"
-        
-        if item_key not in basket:
-            return Response(
-                {'error': 'Item not found in basket'}, 
-                status=status.HTTP_404_NOT_FOUND
-            )
+        store = get_basket_store()
         
         if quantity <= 0:
             # Remove item if quantity is 0 or negative
-            del basket[item_key]
+            found = basket_id is not None and store.remove_line(basket_id, item_key)
         else:
-            basket[item_key]['quantity'] = quantity
+            found = basket_id is not None and store.set_quantity(basket_id, item_key, quantity) is not None
         
-        self.save_basket(request, basket)
+        if not found:
+            return Response(
+                {'error': 'Item not found in basket'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
         
-        return Response({
-            'message': 'Item quantity updated successfully',
-            'basket': self.get_basket_with_details(request)
-        })
+        return self.mutation_response(request, 'Item quantity updated successfully', item_key)
     
     def delete(self, request):
         """Remove item from basket"""
-        service_id = request.data.get('service_id')
-        service_type_id = request.data.get('service_type_id')
+        service_id = catalog.normalize_id(request.data.get('service_id'))
+        service_type_id = catalog.normalize_id(request.data.get('service_type_id'))
         
-        basket = self.get_basket(request)
+        basket_id = get_basket_id(request)
         item_key = f"{service_id}_{service_type_id}"
         
-        if item_key not in basket:
+        if basket_id is None or not get_basket_store().remove_line(basket_id, item_key):
             return Response(
                 {'error': 'Item not found in basket'}, 
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        del basket[item_key]
-        self.save_basket(request, basket)
-        
-        return Response({
-            'message': 'Item removed from basket successfully',
-            'basket': self.get_basket_with_details(request)
-        })
+        return self.mutation_response(request, 'Item removed from basket successfully', item_key)
 
 @api_view(['DELETE'])
 @permission_classes([AllowAny])
 def clear_basket(request):
     """Clear entire basket"""
-    request.session['basket'] = {}
-    request.session.modified = True
-    return Response({'message': 'Basket cleared successfully'})
+    basket_id = get_basket_id(request)
+    if basket_id is not None:
+        get_basket_store().clear(basket_id)
+    request.session.pop('basket', None)  # Basket kept in the session by older clients
+    # Moving a session basket into the store issues a new ID, which the client must keep
+    return set_basket_cookie(request, Response({'message': 'Basket cleared successfully'}))
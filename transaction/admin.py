@@ -1,25 +1,52 @@
 from django.contrib import admin
-from .models import Transaction
+from django.contrib.admin.views.main import ChangeList
+from .jobs import queue_job
+from .models import AdminJob, EmailOutbox, Transaction, TransactionLine
+from .pricing import price_transactions
 import json
 
 
+class TransactionChangeList(ChangeList):
+    """
+    Changelist that prices all rows of a page together, so the totals columns
+    cost a constant number of queries however large the baskets are.
+    """
+    
+    def get_results(self, request):
+        super().get_results(request)
+        # Rows with a checkout snapshot read their columns; price the rest in one lookup
+        price_transactions([transaction for transaction in self.result_list if transaction.total_with_tax is None])
+
+
+class TransactionLineInline(admin.TabularInline):
+    model = TransactionLine
+    extra = 0
+    fields = ('service_title', 'type_name', 'quantity', 'unit_price', 'line_total')
+    readonly_fields = fields
+    can_delete = False
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     """
     Admin configuration for Transaction model.
     """
-    list_display = ['short_id', 'full_name', 'email', 'amount', 'basket_subtotal', 'basket_tax', 'total_with_tax', 'status', 'created_at']
+    list_display = ['short_id', 'full_name', 'email', 'amount', 'basket_subtotal', 'basket_tax', 'basket_total', 'status', 'created_at']
     list_filter = ['status', 'created_at']
     search_fields = ['full_name', 'email', 'description', 'id']
-    readonly_fields = ['id', 'created_at', 'basket_subtotal', 'basket_tax', 'total_with_tax', 'basket_items_display']
+    readonly_fields = ['id', 'created_at', 'basket_subtotal', 'basket_tax', 'basket_total', 'basket_items_display']
     ordering = ['-created_at']
     actions = ['recalculate_amount_from_basket', 'mark_completed', 'mark_failed']
+    inlines = [TransactionLineInline]
     fieldsets = (
         ('Basic Information', {
             'fields': ('id', 'status', 'amount', 'description')
         }),
         ('Basket Information', {
-            'fields': ('basket', 'basket_items_display', 'basket_subtotal', 'basket_tax', 'total_with_tax'),
+            'fields': ('basket', 'basket_items_display', 'basket_subtotal', 'basket_tax', 'basket_total'),
             'classes': ('collapse',)
         }),
         ('Customer Information', {
@@ -38,6 +65,9 @@ class TransactionAdmin(admin.ModelAdmin):
         })
     )
     
+    def get_changelist(self, request, **kwargs):
+        return TransactionChangeList
+    
     def short_id(self, obj):
         """Display a shortened transaction ID for better readability."""
         return f"{str(obj.id)[:8]}..."
@@ -45,21 +75,21 @@ class TransactionAdmin(admin.ModelAdmin):
     
     def basket_subtotal(self, obj):
         """Display basket subtotal amount (without tax)."""
-        subtotal = obj.calculate_amount_from_basket()
+        subtotal = obj.get_totals()[0]
         return f"${subtotal:.2f}"
     basket_subtotal.short_description = 'Subtotal'
     
     def basket_tax(self, obj):
         """Display basket tax amount."""
-        tax = obj.calculate_tax_amount()
+        tax = obj.get_totals()[1]
         return f"${tax:.2f}"
     basket_tax.short_description = 'Tax (10%)'
     
-    def total_with_tax(self, obj):
+    def basket_total(self, obj):
         """Display total amount including tax."""
-        total = obj.get_total_with_tax()
+        total = obj.get_totals()[2]
         return f"${total:.2f}"
-    total_with_tax.short_description = 'Total (with tax)'
+    basket_total.short_description = 'Total (with tax)'
     
     def basket_items_display(self, obj):
         """Display basket items in a readable format."""
@@ -86,26 +116,54 @@ class TransactionAdmin(admin.ModelAdmin):
         return "No basket data"
     basket_items_display.short_description = 'Basket Items'
     
+    def _queue_job(self, request, queryset, action):
+        """Queue a background job for the selected transactions."""
+        job = queue_job(action, queryset, request.user)
+        self.message_user(request, f'Queued "{job.get_action_display()}" for {job.total} transactions. Track its progress under Admin jobs.')
+    
     def recalculate_amount_from_basket(self, request, queryset):
         """Admin action to recalculate transaction amount from basket."""
-        updated = 0
-        for transaction in queryset:
-            old_amount = transaction.amount
-            new_amount = transaction.get_total_with_tax()
-            transaction.amount = float(new_amount)
-            transaction.save()
-            updated += 1
-        self.message_user(request, f'Successfully recalculated amounts for {updated} transactions. Amounts updated from basket totals.')
+        self._queue_job(request, queryset, 'RECALCULATE')
     recalculate_amount_from_basket.short_description = "Recalculate amount from basket for selected transactions"
     
     def mark_completed(self, request, queryset):
         """Admin action to mark transactions as completed."""
-        updated = queryset.update(status='COMPLETED')
-        self.message_user(request, f'Successfully marked {updated} transactions as COMPLETED.')
+        self._queue_job(request, queryset, 'MARK_COMPLETED')
     mark_completed.short_description = "Mark selected transactions as COMPLETED"
     
     def mark_failed(self, request, queryset):
         """Admin action to mark transactions as failed."""
-        updated = queryset.update(status='FAILED')
-        self.message_user(request, f'Successfully marked {updated} transactions as FAILED.')
+        self._queue_job(request, queryset, 'MARK_FAILED')
     mark_failed.short_description = "Mark selected transactions as FAILED"
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for queued transaction notification emails.
+    """
+    list_display = ['transaction', 'transaction_status', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status', 'transaction_status']
+    search_fields = ['transaction__id', 'transaction__email', 'last_error']
+    readonly_fields = ['id', 'transaction', 'transaction_status', 'attempts', 'last_error', 'created_at', 'sent_at']
+    ordering = ['-created_at']
+
+
+@admin.register(AdminJob)
+class AdminJobAdmin(admin.ModelAdmin):
+    """
+    Admin configuration for background admin jobs and their progress.
+    """
+    list_display = ['action', 'status', 'progress_display', 'requested_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'action']
+    readonly_fields = ['id', 'action', 'status', 'progress_display', 'total', 'processed', 'message', 'requested_by', 'created_at', 'started_at', 'heartbeat_at', 'finished_at']
+    exclude = ['transaction_ids']
+    ordering = ['-created_at']
+    
+    def progress_display(self, obj):
+        """Display job progress as processed/total and a percentage."""
+        return f"{obj.processed}/{obj.total} ({obj.progress}%)"
+    progress_display.short_description = 'Progress'
+    
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,246 @@
+"""
+Daily revenue rollups for reporting.
+
+DailyRevenue holds order counts and pre-tax revenue per day (in the current
+time zone) and status, for whole orders and per service ID. Each transaction's
+RevenueRollupEntry records what it contributes. sync_transactions() compares
+transactions with their entries and moves only the differences into the
+rollup. The transaction rows are locked while it runs, so concurrent syncs
+count each change once. Saves trigger a sync once committed (see
+transaction.signals). Bulk updates call it themselves.
+rebuild_daily_revenue() recomputes a date range from scratch, for example
+after backfilling lines or snapshot totals.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.db import transaction as db_transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+from service.models import Service
+from .models import CENTS, DailyRevenue, RevenueRollupEntry, Transaction, TransactionLine
+from .pricing import price_transactions
+
+ALL_SERVICES = None
+
+# Report grouping names and the DailyRevenue columns behind them
+REPORT_GROUPS = {
+    'day': 'date',
+    'status': 'status',
+    'service': 'service_id',
+}
+
+
+def _service_revenue(transactions):
+    """Line revenue and title per service ID for each transaction, with one query."""
+    revenue = defaultdict(dict)
+    rows = (
+        TransactionLine.objects.filter(transaction__in=[transaction.pk for transaction in transactions], service_id__isnull=False)
+        .values_list('transaction_id', 'service_id')
+        .annotate(Sum('line_total'), Max('service_title'))
+        .order_by()
+    )
+    for transaction_id, service_id, line_revenue, service_title in rows:
+        revenue[transaction_id][str(service_id)] = (service_title, line_revenue)
+    return revenue
+
+
+def _build_entries(transactions):
+    """
+    Compute the current contribution of each transaction.
+
+    Returns:
+        dict: Unsaved RevenueRollupEntry instances keyed by transaction ID
+    """
+    price_transactions([transaction for transaction in transactions if transaction.total_with_tax is None])
+    service_revenue = _service_revenue(transactions)
+    return {
+        transaction.pk: RevenueRollupEntry(
+            transaction=transaction,
+            date=timezone.localdate(transaction.created_at),
+            status=transaction.status,
+            revenue=Decimal(transaction.get_totals()[0]).quantize(CENTS),
+            service_revenue={
+                service_id: {'title': title, 'revenue': str(Decimal(revenue).quantize(CENTS))}
+                for service_id, (title, revenue) in service_revenue[transaction.pk].items()
+            },
+        )
+        for transaction in transactions
+    }
+
+
+def _same(entry, other):
+    return (
+        entry.date == other.date and entry.status == other.status
+        and entry.revenue == other.revenue and entry.service_revenue == other.service_revenue
+    )
+
+
+def _new_delta():
+    """Order count, revenue and service title (None to keep) for one DailyRevenue row."""
+    return [0, Decimal('0'), None]
+
+
+def _add_entry(deltas, entry, sign):
+    """Add (sign=1) or subtract (sign=-1) an entry's contribution to the deltas."""
+    amounts = [(ALL_SERVICES, '', entry.revenue)]
+    amounts += [
+        (service_id, service['title'], Decimal(service['revenue']))
+        for service_id, service in entry.service_revenue.items()
+    ]
+    for service_id, service_title, revenue in amounts:
+        delta = deltas[(entry.date, entry.status, service_id)]
+        delta[0] += sign
+        delta[1] += sign * revenue
+        if sign > 0:
+            delta[2] = service_title
+
+
+def _apply_deltas(deltas):
+    """Add order count and revenue deltas to DailyRevenue rows, creating missing rows."""
+    for (day, status, service_id), (order_count, revenue, service_title) in deltas.items():
+        if not order_count and not revenue:
+            continue
+        rows = DailyRevenue.objects.filter(date=day, status=status, service_id=service_id)
+        updates = {'order_count': F('order_count') + order_count, 'revenue': F('revenue') + revenue}
+        if service_title is not None:
+            updates['service_title'] = service_title
+        if not rows.update(**updates):
+            DailyRevenue.objects.get_or_create(date=day, status=status, service_id=service_id)
+            rows.update(**updates)
+
+
+def sync_transactions(transaction_ids):
+    """
+    Bring DailyRevenue up to date with the given transactions.
+
+    Returns:
+        int: Number of transactions whose contribution changed
+    """
+    deltas = defaultdict(_new_delta)
+    with db_transaction.atomic():
+        transactions = list(Transaction.objects.select_for_update().filter(pk__in=list(transaction_ids)).order_by('pk'))
+        if not transactions:
+            return 0
+        recorded = RevenueRollupEntry.objects.in_bulk([transaction.pk for transaction in transactions])
+        current = _build_entries(transactions)
+        changed = [
+            entry for transaction_id, entry in current.items()
+            if transaction_id not in recorded or not _same(entry, recorded[transaction_id])
+        ]
+        for entry in changed:
+            if entry.transaction_id in recorded:
+                _add_entry(deltas, recorded[entry.transaction_id], -1)
+            _add_entry(deltas, entry, 1)
+        _apply_deltas(deltas)
+        RevenueRollupEntry.objects.bulk_create(
+            changed, update_conflicts=True, unique_fields=['transaction'],
+            update_fields=['date', 'status', 'revenue', 'service_revenue'],
+        )
+    return len(changed)
+
+
+def remove_entry(entry):
+    """Subtract a deleted transaction's recorded contribution."""
+    deltas = defaultdict(_new_delta)
+    _add_entry(deltas, entry, -1)
+    _apply_deltas(deltas)
+
+
+def _day_bounds(start, end):
+    start_at = timezone.make_aware(datetime.combine(start, time.min))
+    end_at = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+    return start_at, end_at
+
+
+def rebuild_daily_revenue(start, end, chunk_size=500):
+    """
+    Recompute DailyRevenue and the rollup entries for transactions created
+    between two dates (inclusive), in one database transaction.
+
+    Returns:
+        int: Number of transactions counted
+    """
+    start_at, end_at = _day_bounds(start, end)
+    transactions = Transaction.objects.filter(created_at__gte=start_at, created_at__lt=end_at).order_by('pk')
+    totals = defaultdict(_new_delta)
+    counted = 0
+    with db_transaction.atomic():
+        DailyRevenue.objects.filter(date__gte=start, date__lte=end).delete()
+        RevenueRollupEntry.objects.filter(transaction__in=transactions).delete()
+        last_pk = None
+        while True:
+            chunk_queryset = transactions if last_pk is None else transactions.filter(pk__gt=last_pk)
+            chunk = list(chunk_queryset.select_for_update()[:chunk_size])
+            if not chunk:
+                break
+            entries = list(_build_entries(chunk).values())
+            for entry in entries:
+                _add_entry(totals, entry, 1)
+            RevenueRollupEntry.objects.bulk_create(entries)
+            counted += len(chunk)
+            last_pk = chunk[-1].pk
+        DailyRevenue.objects.bulk_create(
+            DailyRevenue(
+                date=day, status=status, service_id=service_id, service_title=service_title or '',
+                order_count=order_count, revenue=revenue,
+            )
+            for (day, status, service_id), (order_count, revenue, service_title) in totals.items()
+        )
+    return counted
+
+
+def revenue_report(start=None, end=None, status=None, service=None, group_by=('day', 'status')):
+    """
+    Aggregate DailyRevenue into report rows.
+
+    Args:
+        start: Optional first date (inclusive)
+        end: Optional last date (inclusive)
+        status: Optional status to match
+        service: Optional service ID to match (reports per-service lines)
+        group_by: Names from REPORT_GROUPS to group by
+
+    Returns:
+        list: Dicts with the grouped columns (day, status, service), revenue,
+        order_count and average_order_value, ordered by the grouped columns.
+        Rows for a service also carry its service_title.
+    """
+    rows = DailyRevenue.objects.all()
+    if service:
+        rows = rows.filter(service_id=service)
+    elif 'service' in group_by:
+        rows = rows.exclude(service_id__isnull=True)
+    else:
+        rows = rows.filter(service_id__isnull=True)
+    if start:
+        rows = rows.filter(date__gte=start)
+    if end:
+        rows = rows.filter(date__lte=end)
+    if status:
+        rows = rows.filter(status=status)
+
+    columns = [REPORT_GROUPS[name] for name in group_by]
+    rows = list(
+        rows.values(*columns)
+        .annotate(total_orders=Sum('order_count'), total_revenue=Sum('revenue'), last_title=Max('service_title'))
+        .filter(total_orders__gt=0)
+        .order_by(*columns)
+    )
+    # Show current titles; deleted services keep the last recorded one
+    titles = {}
+    if 'service' in group_by:
+        titles = dict(Service.objects.filter(pk__in={row['service_id'] for row in rows}).values_list('id', 'title'))
+    report = []
+    for row in rows:
+        revenue = Decimal(row['total_revenue']).quantize(CENTS)
+        item = {name: row[REPORT_GROUPS[name]] for name in group_by}
+        if 'service' in group_by:
+            item['service_title'] = titles.get(row['service_id'], row['last_title'])
+        item.update(
+            revenue=revenue,
+            order_count=row['total_orders'],
+            average_order_value=(revenue / row['total_orders']).quantize(CENTS),
+        )
+        report.append(item)
+    return report
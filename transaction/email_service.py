@@ -1,13 +1,45 @@
 """
 Email service for transaction notifications.
 """
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import prefetch_related_objects
 from django.template.loader import render_to_string
 from django.conf import settings
+from service import catalog
+from .pricing import basket_items, basket_service_type_ids, price_transactions, resolve_service_types
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Transaction statuses that have a customer notification email
+NOTIFIABLE_STATUSES = ['APPROVED', 'COMPLETED', 'FAILED', 'DECLINED']
+
+
+class EmailLineItem:
+    """
+    A purchased service type as shown in a transaction email.
+    """
+    __slots__ = ('name', 'price', 'quantity', 'subtotal')
+    
+    def __init__(self, name, price, quantity):
+        self.name = name
+        self.price = price
+        self.quantity = quantity
+        self.subtotal = price * quantity
+
+
+class EmailServiceGroup:
+    """
+    A service and the line items bought from it, as shown in a transaction email.
+    """
+    __slots__ = ('id', 'title', 'description', 'types')
+    
+    def __init__(self, service_id, title, description):
+        self.id = service_id
+        self.title = title
+        self.description = description or ''
+        self.types = []
+
 
 class TransactionEmailService:
     """
@@ -19,234 +51,189 @@ class TransactionEmailService:
         """
         Get comprehensive basket information for email templates.
         
+        Line items come from the TransactionLine rows recorded at checkout,
+        so they add up to the snapshot totals; only service descriptions are
+        read from the catalog. Baskets without lines resolve their service
+        types with one catalog lookup. Totals are read once, from the checkout
+        snapshot when available.
+        
         Args:
             transaction: Transaction instance
             
         Returns:
             dict: Basket information including services, totals, and counts
         """
-        from service.models import Service, Type
+        subtotal, tax_amount, _ = transaction.get_totals()
+        services = {}
+        lines = transaction.get_lines()
         
-        basket_info = {
-            'services': [],
-            'basket': {
-                'total_amount': transaction.calculate_amount_from_basket(),
-                'tax_amount': transaction.calculate_tax_amount(),
-            },
-            'total_amount': transaction.calculate_amount_from_basket(),
-            'tax_amount': transaction.calculate_tax_amount(),
-            'service_count': 0,
-        }
-        
-        if transaction.basket:
-            # Process each item in the JSON basket
-            services_list = []
-            unique_services = {}
-            
+        if lines:
+            # Show the lines in basket order, as sold
+            positions = {}
+            for position, item in enumerate(basket_items(transaction.basket)):
+                positions.setdefault(catalog.normalize_id(item['service_type_id']), position)
+            lines.sort(key=lambda line: positions.get(str(line.service_type_id), len(positions)))
+            current_services = catalog.get_services(line.service_id for line in lines if line.service_id)
+            for line in lines:
+                group = services.get(line.service_id)
+                if group is None:
+                    service = current_services.get(str(line.service_id))
+                    group = services[line.service_id] = EmailServiceGroup(
+                        line.service_id, line.service_title, service.description if service else ''
+                    )
+                group.types.append(EmailLineItem(line.type_name, line.unit_price, line.quantity))
+        elif transaction.basket:
+            service_types = resolve_service_types(basket_service_type_ids(transaction.basket))
             for item in transaction.basket:
-                if 'service_type_id' in item and 'quantity' in item:
-                    try:
-                        service_type = Type.objects.select_related('service').get(id=item['service_type_id'])
-                        service = service_type.service
-                        quantity = int(item['quantity'])
-                        
-                        # Group by service and collect all types
-                        if service.id not in unique_services:
-                            unique_services[service.id] = {
-                                'service': service,
-                                'types': []
-                            }
-                        
-                        # Add this type to the service
-                        unique_services[service.id]['types'].append({
-                            'type': service_type,
-                            'quantity': quantity,
-                            'subtotal': service_type.price * quantity
-                        })
-                        
-                    except Type.DoesNotExist:
-                        continue  # Skip invalid service types
-            
-            # Convert to list format for templates
-            for service_data in unique_services.values():
-                # Create a wrapper object that includes service data and types
-                service = service_data['service']
-                types_data = service_data['types']
-                
-                # Create a service wrapper with type information
-                class ServiceWrapper:
-                    def __init__(self, service, types_data):
-                        # Django model managers and related fields to exclude
-                        excluded_attrs = {
-                            'objects', 'DoesNotExist', 'MultipleObjectsReturned', 'type_set',
-                            '_meta', '_state', '_prefetched_objects_cache'
-                        }
-                        
-                        # Copy safe attributes from the original service
-                        for attr in dir(service):
-                            if (not attr.startswith('_') and 
-                                attr not in excluded_attrs and
-                                not callable(getattr(service, attr, None)) and
-                                not hasattr(getattr(service, attr, None), 'all')):  # Skip manager-like objects
-                                try:
-                                    setattr(self, attr, getattr(service, attr))
-                                except (AttributeError, TypeError):
-                                    continue  # Skip problematic attributes
-                        
-                        # Explicitly set essential service attributes
-                        self.id = service.id
-                        self.title = service.title  # Service model uses 'title', not 'name'
-                        self.name = service.title   # Also set 'name' for template compatibility
-                        self.description = getattr(service, 'description', '')
-                        self.logo = getattr(service, 'logo', None)
-                        
-                        # Create type_set mock
-                        self.type_set = MockTypeSet([t['type'] for t in types_data])
-                        self.types_with_quantities = types_data
+                if 'service_type_id' not in item or 'quantity' not in item:
+                    continue
+                service_type = service_types.get(catalog.normalize_id(item['service_type_id']))
+                if service_type is None:
+                    continue  # Skip invalid service types
                 
-                # Create a simple mock object for type_set
-                class MockTypeSet:
-                    def __init__(self, types):
-                        self._types = types
-                    
-                    def all(self):
-                        return self._types
-                
-                service_wrapper = ServiceWrapper(service, types_data)
-                services_list.append(service_wrapper)
-            
-            basket_info['services'] = services_list
-            basket_info['service_count'] = len(services_list)
+                # Group line items by service
+                group = services.get(service_type.service_id)
+                if group is None:
+                    service = service_type.service
+                    group = services[service_type.service_id] = EmailServiceGroup(service.id, service.title, service.description)
+                group.types.append(EmailLineItem(service_type.name, service_type.price, int(item['quantity'])))
         
-        return basket_info
+        return {
+            'services': list(services.values()),
+            'basket': {
+                'total_amount': subtotal,
+                'tax_amount': tax_amount,
+            },
+            'total_amount': subtotal,
+            'tax_amount': tax_amount,
+            'service_count': len(services),
+        }
     
     @staticmethod
-    def send_transaction_approved_email(transaction):
+    def _build_email(transaction, template_name, subject):
         """
-        Send an email notification for approved transactions.
+        Render a transaction email from its text and HTML templates.
         
         Args:
             transaction: Transaction instance
+            template_name: Template name under emails/, without extension
+            subject: Email subject
             
         Returns:
-            bool: True if email was sent successfully, False otherwise
+            EmailMultiAlternatives: The email message, not yet sent
         """
-        try:
-            # Get comprehensive basket information
-            basket_info = TransactionEmailService._get_basket_info(transaction)
-            
-            # Email context
-            context = {
-                'transaction': transaction,
-                'services': basket_info['services'],
-                'services_with_prices': basket_info.get('services_with_prices', []),
-                'basket': basket_info['basket'],
-                'basket_total': basket_info['total_amount'],
-                'basket_tax': basket_info['tax_amount'],
-                'service_count': basket_info['service_count'],
-            }
-            
-            # Email subject
-            subject = f'✅ Payment Approved - Order #{str(transaction.id)[:8]}... - eSalesOne'
-            
-            # Render email templates
-            text_content = render_to_string('emails/transaction_approved.txt', context)
-            html_content = render_to_string('emails/transaction_approved.html', context)
-            
-            # Create email message
-            email = EmailMultiAlternatives(
-                subject=subject,
-                body=text_content,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                to=[transaction.email],
-            )
-            email.attach_alternative(html_content, "text/html")
-            
-            # Send email
-            result = email.send()
-            
-            if result:
-                logger.info(f"Approved transaction email sent successfully to {transaction.email} for transaction {transaction.id}")
-                return True
-            else:
-                logger.error(f"Failed to send approved transaction email to {transaction.email} for transaction {transaction.id}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Error sending approved transaction email to {transaction.email} for transaction {transaction.id}: {str(e)}")
-            return False
+        # Get comprehensive basket information
+        basket_info = TransactionEmailService._get_basket_info(transaction)
+        
+        # Email context
+        context = {
+            'transaction': transaction,
+            'services': basket_info['services'],
+            'basket': basket_info['basket'],
+            'basket_total': basket_info['total_amount'],
+            'basket_tax': basket_info['tax_amount'],
+            'service_count': basket_info['service_count'],
+        }
+        
+        # Render email templates
+        text_content = render_to_string(f'emails/{template_name}.txt', context)
+        html_content = render_to_string(f'emails/{template_name}.html', context)
+        
+        # Create email message
+        email = EmailMultiAlternatives(
+            subject=subject,
+            body=text_content,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[transaction.email],
+        )
+        email.attach_alternative(html_content, "text/html")
+        return email
     
     @staticmethod
-    def send_transaction_failed_email(transaction):
+    def build_notification_email(transaction):
         """
-        Send an email notification for failed/declined transactions.
+        Render the notification email for the transaction's current status.
         
         Args:
             transaction: Transaction instance
             
         Returns:
-            bool: True if email was sent successfully, False otherwise
+            EmailMultiAlternatives: The email message, or None if the status has no email
         """
-        try:
-            # Get comprehensive basket information for failed transactions too
-            basket_info = TransactionEmailService._get_basket_info(transaction)
-            
-            # Email context
-            context = {
-                'transaction': transaction,
-                'services': basket_info['services'],
-                'services_with_prices': basket_info.get('services_with_prices', []),
-                'basket': basket_info['basket'],
-                'basket_total': basket_info['total_amount'],
-                'basket_tax': basket_info['tax_amount'],
-                'service_count': basket_info['service_count'],
-            }
-            
-            # Email subject
-            subject = f'❌ Payment Failed - Order #{str(transaction.id)[:8]}... - eSalesOne'
-            
-            # Render email templates
-            text_content = render_to_string('emails/transaction_failed.txt', context)
-            html_content = render_to_string('emails/transaction_failed.html', context)
-            
-            # Create email message
-            email = EmailMultiAlternatives(
-                subject=subject,
-                body=text_content,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                to=[transaction.email],
+        order = f"Order #{str(transaction.id)[:8]}..."
+        if transaction.status in ['APPROVED', 'COMPLETED']:
+            return TransactionEmailService._build_email(
+                transaction, 'transaction_approved', f'✅ Payment Approved - {order} - eSalesOne'
             )
-            email.attach_alternative(html_content, "text/html")
-            
-            # Send email
-            result = email.send()
-            
-            if result:
-                logger.info(f"Failed transaction email sent successfully to {transaction.email} for transaction {transaction.id}")
-                return True
-            else:
-                logger.error(f"Failed to send failed transaction email to {transaction.email} for transaction {transaction.id}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Error sending failed transaction email to {transaction.email} for transaction {transaction.id}: {str(e)}")
-            return False
+        elif transaction.status in ['FAILED', 'DECLINED']:
+            return TransactionEmailService._build_email(
+                transaction, 'transaction_failed', f'❌ Payment Failed - {order} - eSalesOne'
+            )
+        return None
     
     @staticmethod
-    def send_transaction_notification(transaction):
+    def deliver_notifications(transactions):
         """
-        Send appropriate email notification based on transaction status.
+        Send the status notification for many transactions over one SMTP connection.
+        
+        Checkout lines are loaded with one query and baskets without a totals
+        snapshot are priced together up front. Every message is delivered with
+        send_messages() on a single backend connection instead of a new
+        connection and TLS handshake per email.
         
         Args:
-            transaction: Transaction instance
+            transactions: Iterable of Transaction instances
             
         Returns:
-            bool: True if email was sent successfully, False otherwise
+            list: One entry per transaction, in order: None if its email was
+            sent, otherwise a message describing why it was not
         """
-        if transaction.status == 'APPROVED':
-            return TransactionEmailService.send_transaction_approved_email(transaction)
-        elif transaction.status in ['FAILED', 'DECLINED']:
-            return TransactionEmailService.send_transaction_failed_email(transaction)
-        else:
-            logger.warning(f"No email template for transaction status: {transaction.status}")
-            return False
+        transactions = list(transactions)
+        prefetch_related_objects(transactions, 'lines')
+        price_transactions([transaction for transaction in transactions if transaction.total_with_tax is None])
+        
+        errors = ['Not sent'] * len(transactions)
+        messages = []
+        for index, transaction in enumerate(transactions):
+            try:
+                email = TransactionEmailService.build_notification_email(transaction)
+            except Exception as e:
+                logger.error(f"Error rendering transaction email for transaction {transaction.id}: {str(e)}")
+                errors[index] = f'Rendering failed: {str(e)}'
+                continue
+            if email is None:
+                logger.warning(f"No email template for transaction status: {transaction.status}")
+                errors[index] = f'No email template for transaction status: {transaction.status}'
+                continue
+            messages.append((index, email))
+        
+        if not messages:
+            return errors
+        
+        connection = get_connection()
+        try:
+            connection.open()
+            for index, email in messages:
+                transaction = transactions[index]
+                try:
+                    sent = connection.send_messages([email])
+                except Exception as e:
+                    logger.error(f"Error sending transaction email to {transaction.email} for transaction {transaction.id}: {str(e)}")
+                    errors[index] = f'Sending failed: {str(e)}'
+                    continue
+                if sent:
+                    errors[index] = None
+                else:
+                    logger.error(f"Failed to send transaction email to {transaction.email} for transaction {transaction.id}")
+                    errors[index] = 'The email backend did not accept the message'
+        except Exception as e:
+            logger.error(f"Error opening email connection for bulk notifications: {str(e)}")
+            for index, _ in messages:
+                if errors[index] == 'Not sent':
+                    errors[index] = f'Connection failed: {str(e)}'
+        finally:
+            connection.close()
+        
+        sent = errors.count(None)
+        logger.info(f"Bulk transaction notifications: {sent} sent, {len(transactions) - sent} not sent")
+        return errors
@@ -0,0 +1,124 @@
+"""
+Streaming exports of transactions as CSV or NDJSON.
+
+Rows are read with ``queryset.iterator(chunk_size=...)`` and encoded one at a
+time, so memory stays flat regardless of how many transactions are exported.
+Totals come from the checkout snapshot columns instead of repricing baskets.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+EXPORT_FIELDS = [
+    'id',
+    'created_at',
+    'status',
+    'full_name',
+    'email',
+    'phone_number',
+    'address',
+    'city',
+    'state',
+    'zip_code',
+    'description',
+    'amount',
+    'subtotal',
+    'tax_amount',
+    'total_with_tax',
+    'basket',
+]
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class _Echo:
+    """File-like object whose write() hands back the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def parse_date_bound(value, end=False):
+    """
+    Parse an ISO date or datetime used as an export range bound.
+
+    A plain date as the end bound includes that whole day.
+
+    Raises:
+        ValueError: If the value is neither a date nor a datetime
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value}")
+        parsed = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def filter_export_queryset(queryset, status=None, start=None, end=None):
+    """
+    Apply the export filters to a transaction queryset.
+
+    Args:
+        queryset: Transaction queryset
+        status: Optional status to match
+        start: Optional ISO date/datetime, inclusive lower bound on created_at
+        end: Optional ISO date/datetime, exclusive upper bound on created_at
+            (a plain date includes that whole day)
+
+    Raises:
+        ValueError: If a date bound cannot be parsed
+    """
+    if status:
+        queryset = queryset.filter(status=status)
+    if start:
+        queryset = queryset.filter(created_at__gte=parse_date_bound(start))
+    if end:
+        queryset = queryset.filter(created_at__lt=parse_date_bound(end, end=True))
+    return queryset.order_by('-created_at', 'id')
+
+
+def _export_row(transaction):
+    """Build the exported values for one transaction."""
+    subtotal, tax_amount, total_with_tax = transaction.get_totals()
+    row = {field: getattr(transaction, field) for field in EXPORT_FIELDS}
+    row.update(subtotal=subtotal, tax_amount=tax_amount, total_with_tax=total_with_tax)
+    return row
+
+
+def _iter_rows(queryset, chunk_size):
+    for transaction in queryset.defer('card_number', 'expiry_date', 'cvv').iterator(chunk_size=chunk_size):
+        yield _export_row(transaction)
+
+
+def iter_csv(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the transactions as CSV lines, starting with a header row."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in _iter_rows(queryset, chunk_size):
+        row['basket'] = json.dumps(row['basket'], cls=DjangoJSONEncoder)
+        yield writer.writerow([row[field] for field in EXPORT_FIELDS])
+
+
+def iter_ndjson(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the transactions as newline-delimited JSON objects."""
+    for row in _iter_rows(queryset, chunk_size):
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def iter_export(queryset, export_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the encoded export for one of EXPORT_FORMATS."""
+    if export_format == 'csv':
+        return iter_csv(queryset, chunk_size)
+    return iter_ndjson(queryset, chunk_size)
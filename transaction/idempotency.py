@@ -0,0 +1,127 @@
+"""
+Idempotency-Key support for unsafe transaction endpoints.
+
+The first request with a given key records an in-progress row, does the work
+and stores its response. Retries with the same key replay that response
+without touching pricing, payment or email code; concurrent duplicates wait
+for the first request to finish instead of repeating its work.
+"""
+from datetime import timedelta
+from functools import wraps
+import hashlib
+import json
+import time
+from django.conf import settings
+from django.db import IntegrityError, transaction as db_transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def _fingerprint(request):
+    """Hash the request body so a key cannot be reused for a different request."""
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def _claim(key, scope, fingerprint):
+    """
+    Try to claim a key for this request.
+
+    Returns:
+        tuple: (IdempotencyKey, created)
+    """
+    now = timezone.now()
+    lock_timeout = timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60))
+    # Expired keys, and in-progress claims abandoned by a crashed worker, can be retaken
+    IdempotencyKey.objects.filter(scope=scope, key=key, expires_at__lte=now).delete()
+    IdempotencyKey.objects.filter(
+        scope=scope, key=key, response_status__isnull=True, created_at__lte=now - lock_timeout
+    ).delete()
+
+    ttl = timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+    try:
+        with db_transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                key=key,
+                scope=scope,
+                request_fingerprint=fingerprint,
+                expires_at=now + ttl,
+            )
+        return record, True
+    except IntegrityError:
+        return IdempotencyKey.objects.get(scope=scope, key=key), False
+
+
+def _wait_for_completion(record):
+    """Poll an in-progress key until its response is stored or the wait times out."""
+    deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT_TIMEOUT', 10)
+    while record.response_status is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+        try:
+            record.refresh_from_db(fields=['response_status', 'response_body'])
+        except IdempotencyKey.DoesNotExist:
+            return None  # The first request failed and released the key
+    return record
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view_method):
+    """
+    Make a ViewSet method honour the Idempotency-Key request header.
+
+    Requests without the header are processed normally. Keys are scoped to the
+    view, action and object, and expire after IDEMPOTENCY_KEY_TTL seconds.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response(
+                {'error': f'{IDEMPOTENCY_HEADER} must be at most 255 characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        scope = f"{self.basename}:{self.action}:{kwargs.get(self.lookup_url_kwarg or self.lookup_field, '')}"
+        fingerprint = _fingerprint(request)
+        record, created = _claim(key, scope, fingerprint)
+
+        if not created:
+            if record.request_fingerprint != fingerprint:
+                return Response(
+                    {'error': f'{IDEMPOTENCY_HEADER} was already used with a different request'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            record = _wait_for_completion(record)
+            if record is None or record.response_status is None:
+                return Response(
+                    {'error': 'A request with this Idempotency-Key is still being processed'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            return _replay(record)
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except Exception:
+            # Nothing was recorded; let a retry do the work
+            record.delete()
+            raise
+
+        record.response_status = response.status_code
+        # Store the data as the JSON renderer encodes it, so replays are identical
+        record.response_body = json.loads(json.dumps(getattr(response, 'data', None), cls=JSONEncoder))
+        record.save(update_fields=['response_status', 'response_body'])
+        return response
+
+    return wrapper
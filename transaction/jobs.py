@@ -0,0 +1,153 @@
+"""
+Chunked background jobs for heavy TransactionAdmin actions.
+
+Admin actions queue an AdminJob with the selected transaction IDs and return
+immediately. The process_admin_jobs command (run with --loop) is the supported
+runner; with ADMIN_JOBS_RUN_IN_THREAD the request also starts the job in a
+thread once it commits, which is a convenience that dies with its worker
+process. Either way the job works through the IDs in chunks: each chunk is
+priced with one service type query and written with bulk operations.
+
+The runner holds a lease on the job: progress and a heartbeat are saved after
+every chunk, and a RUNNING job whose heartbeat is older than
+ADMIN_JOB_STALE_AFTER seconds is reclaimed by the next runner and resumed from
+its saved progress. A runner that finds its lease taken stops. Handlers are
+idempotent, so a chunk that was in progress when the lease was lost is simply
+redone.
+"""
+import logging
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction as db_transaction
+from django.db.models import DateTimeField, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .analytics import sync_transactions
+from .models import AdminJob, Transaction, TransactionLine
+from .outbox import enqueue_notifications
+from .pricing import load_service_types, price_transactions, transactions_service_type_ids
+
+logger = logging.getLogger(__name__)
+
+
+def _recalculate(chunk):
+    """
+    Reprice a chunk at current database prices, as checkout does: amount,
+    totals snapshot and TransactionLine rows are rewritten together, then the
+    revenue rollup is brought up to date with them.
+    """
+    with db_transaction.atomic():
+        transactions = list(Transaction.objects.filter(pk__in=chunk))
+        service_types = load_service_types(transactions_service_type_ids(transactions))
+        price_transactions(transactions, service_types=service_types)
+        now = timezone.now()
+        for transaction in transactions:
+            transaction.amount = float(transaction.get_total_with_tax())
+            transaction.snapshot_totals()
+            transaction.updated_at = now  # bulk_update skips auto_now
+        Transaction.objects.bulk_update(transactions, ['amount', 'subtotal', 'tax_amount', 'total_with_tax', 'updated_at'])
+        TransactionLine.objects.filter(transaction__in=transactions).delete()
+        TransactionLine.objects.bulk_create(
+            [line for transaction in transactions for line in transaction.build_lines(service_types)]
+        )
+    sync_transactions(chunk)
+
+
+def _mark_status(new_status):
+    def mark(chunk):
+        """Set the status for a chunk and queue its customer emails in the outbox."""
+        with db_transaction.atomic():
+            Transaction.objects.filter(pk__in=chunk).update(status=new_status, updated_at=timezone.now())
+            enqueue_notifications(chunk, new_status)
+        sync_transactions(chunk)
+    return mark
+
+
+JOB_HANDLERS = {
+    'RECALCULATE': _recalculate,
+    'MARK_COMPLETED': _mark_status('COMPLETED'),
+    'MARK_FAILED': _mark_status('FAILED'),
+}
+
+
+def claimable_jobs():
+    """Queued jobs, and running jobs whose runner stopped renewing its lease."""
+    stale_before = timezone.now() - timedelta(seconds=getattr(settings, 'ADMIN_JOB_STALE_AFTER', 10 * 60))
+    return AdminJob.objects.filter(
+        Q(status='QUEUED')
+        | Q(status='RUNNING', heartbeat_at__lt=stale_before)
+        # Jobs started before heartbeats were recorded
+        | Q(status='RUNNING', heartbeat_at__isnull=True, started_at__lt=stale_before)
+    )
+
+
+def run_job(job_id):
+    """
+    Run a queued or stale job to completion, unless another runner holds its
+    lease, resuming from the job's saved progress.
+
+    Returns:
+        bool: True if this call ran the job
+    """
+    heartbeat = timezone.now()
+    claimed = claimable_jobs().filter(pk=job_id).update(
+        status='RUNNING',
+        heartbeat_at=heartbeat,
+        started_at=Coalesce('started_at', Value(heartbeat, output_field=DateTimeField())),
+    )
+    if not claimed:
+        return False
+
+    job = AdminJob.objects.get(pk=job_id)
+    # Writes by this runner only land while it still holds the lease
+    lease = AdminJob.objects.filter(pk=job.pk, status='RUNNING')
+    handler = JOB_HANDLERS[job.action]
+    chunk_size = getattr(settings, 'ADMIN_JOB_CHUNK_SIZE', 500)
+    try:
+        for start in range(job.processed, job.total, chunk_size):
+            chunk = job.transaction_ids[start:start + chunk_size]
+            handler(chunk)
+            job.processed = start + len(chunk)
+            now = timezone.now()
+            if not lease.filter(heartbeat_at=heartbeat).update(processed=job.processed, heartbeat_at=now):
+                logger.warning(f"Admin job {job.id} ({job.action}) was reclaimed by another runner; stopping")
+                return True
+            heartbeat = now
+        job.status = 'DONE'
+        job.message = f'Processed {job.processed} transactions.'
+    except Exception as e:
+        logger.error(f"Admin job {job.id} ({job.action}) failed after {job.processed} transactions: {str(e)}")
+        job.status = 'FAILED'
+        job.message = str(e)
+    lease.filter(heartbeat_at=heartbeat).update(status=job.status, message=job.message, finished_at=timezone.now())
+    return True
+
+
+def _run_in_thread(job_id):
+    close_old_connections()
+    try:
+        run_job(job_id)
+    finally:
+        connections.close_all()
+
+
+def queue_job(action, queryset, user=None):
+    """
+    Queue a job for the transactions in queryset and start it once committed.
+
+    Returns:
+        AdminJob: The queued job
+    """
+    transaction_ids = [str(pk) for pk in queryset.values_list('pk', flat=True)]
+    job = AdminJob.objects.create(
+        action=action,
+        transaction_ids=transaction_ids,
+        total=len(transaction_ids),
+        requested_by=getattr(user, 'username', None),
+    )
+    if getattr(settings, 'ADMIN_JOBS_RUN_IN_THREAD', True):
+        db_transaction.on_commit(
+            lambda: threading.Thread(target=_run_in_thread, args=(job.pk,), daemon=True).start()
+        )
+    return job
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+from transaction.models import Transaction, TransactionLine
+from transaction.pricing import resolve_service_types, transactions_service_type_ids
+
+
+class Command(BaseCommand):
+    """
+    Create TransactionLine rows for transactions checked out before lines were
+    recorded, resolving each chunk's service types with a single lookup.
+
+    Historical prices are not known, so lines get the service types' current
+    prices, titles and names. Items whose service type no longer exists are
+    skipped.
+    """
+    help = 'Backfill TransactionLine rows from the basket JSON of existing transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Number of transactions per chunk')
+        parser.add_argument('--all', action='store_true', help='Rebuild lines for transactions that already have them')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        queryset = Transaction.objects.order_by('pk')
+        if not options['all']:
+            queryset = queryset.filter(lines__isnull=True)
+
+        processed = created = 0
+        last_pk = None
+        while True:
+            chunk_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            chunk = list(chunk_queryset.only('pk', 'basket')[:chunk_size])
+            if not chunk:
+                break
+
+            service_types = resolve_service_types(transactions_service_type_ids(chunk))
+            lines = [line for transaction in chunk for line in transaction.build_lines(service_types)]
+            with db_transaction.atomic():
+                if options['all']:
+                    TransactionLine.objects.filter(transaction__in=chunk).delete()
+                TransactionLine.objects.bulk_create(lines, batch_size=chunk_size)
+
+            processed += len(chunk)
+            created += len(lines)
+            last_pk = chunk[-1].pk
+            self.stdout.write(f'Processed {processed} transactions...')
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully created {created} lines for {processed} transactions'))
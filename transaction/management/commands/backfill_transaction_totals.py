@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from transaction.analytics import sync_transactions
+from transaction.models import Transaction
+from transaction.pricing import price_transactions
+
+
+class Command(BaseCommand):
+    """
+    Fill the subtotal/tax/total snapshot columns for transactions created
+    before they existed, pricing each chunk with a single service type lookup.
+    """
+    help = 'Backfill persisted subtotal, tax and total columns on existing transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Number of transactions per chunk')
+        parser.add_argument('--all', action='store_true', help='Recompute rows that already have a snapshot')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        queryset = Transaction.objects.order_by('pk')
+        if not options['all']:
+            queryset = queryset.filter(total_with_tax__isnull=True)
+
+        updated = 0
+        last_pk = None
+        while True:
+            chunk_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            chunk = list(chunk_queryset.only('pk', 'basket')[:chunk_size])
+            if not chunk:
+                break
+
+            price_transactions(chunk)
+            now = timezone.now()
+            for transaction in chunk:
+                transaction.snapshot_totals()
+                transaction.updated_at = now  # bulk_update skips auto_now
+            Transaction.objects.bulk_update(chunk, ['subtotal', 'tax_amount', 'total_with_tax', 'updated_at'])
+            sync_transactions([transaction.pk for transaction in chunk])
+
+            updated += len(chunk)
+            last_pk = chunk[-1].pk
+            self.stdout.write(f'Backfilled {updated} transactions...')
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully backfilled totals for {updated} transactions'))
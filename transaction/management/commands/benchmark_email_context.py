@@ -0,0 +1,82 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from service import catalog
+from service.models import Type
+from transaction.email_service import TransactionEmailService
+from transaction.models import Transaction
+
+
+def _per_item_basket_info(transaction):
+    """
+    Reference implementation of the previous email context builder, kept only
+    for comparison: one query per item for each of the four totals passes,
+    plus one select_related query and an attribute-copying wrapper per item.
+    """
+    totals = []
+    for _ in range(4):  # subtotal and tax were each computed twice
+        total = 0
+        for item in transaction.basket:
+            total += Type.objects.get(id=item['service_type_id']).price * int(item['quantity'])
+        totals.append(total)
+
+    services = {}
+    for item in transaction.basket:
+        service_type = Type.objects.select_related('service').get(id=item['service_type_id'])
+        service = service_type.service
+        wrapper = type('ServiceWrapper', (), {})()
+        for attr in dir(service):
+            if not attr.startswith('_') and not callable(getattr(service, attr, None)):
+                try:
+                    setattr(wrapper, attr, getattr(service, attr))
+                except (AttributeError, TypeError):
+                    continue
+        services.setdefault(service.id, wrapper)
+    return totals, list(services.values())
+
+
+class Command(BaseCommand):
+    """
+    Micro-benchmark of building the email context for one transaction, comparing
+    the per-item lookup approach with the catalog-backed view model.
+
+    Uses unsaved in-memory transactions built from the active catalog, so it is
+    safe to run against any database.
+    """
+    help = 'Measure time and queries per transaction email context'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=10, help='Basket lines per transaction')
+        parser.add_argument('--iterations', type=int, default=200, help='Email contexts built per approach')
+
+    def _measure(self, build, transaction, iterations):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                build(transaction)
+            elapsed = time.perf_counter() - start
+        return elapsed / iterations * 1000, len(queries) / iterations
+
+    def handle(self, *args, **options):
+        service_types = list(catalog.get_catalog().types.values())[:options['items']]
+        if not service_types:
+            raise CommandError('The catalog has no active service types to benchmark with')
+
+        transaction = Transaction(
+            full_name='Benchmark',
+            email='benchmark@example.com',
+            status='APPROVED',
+            basket=[{'service_type_id': str(service_type.id), 'quantity': 2} for service_type in service_types],
+        )
+
+        iterations = options['iterations']
+        before_ms, before_queries = self._measure(_per_item_basket_info, transaction, iterations)
+        after_ms, after_queries = self._measure(TransactionEmailService._get_basket_info, transaction, iterations)
+
+        self.stdout.write(f'Basket lines: {len(service_types)}, iterations: {iterations}')
+        self.stdout.write(f'{"":<22}{"ms/email":>12}{"queries/email":>16}')
+        self.stdout.write(f'{"Per-item lookups":<22}{before_ms:>12.3f}{before_queries:>16.1f}')
+        self.stdout.write(f'{"Catalog view model":<22}{after_ms:>12.3f}{after_queries:>16.1f}')
+        if after_ms:
+            self.stdout.write(self.style.SUCCESS(f'Speedup: {before_ms / after_ms:.1f}x'))
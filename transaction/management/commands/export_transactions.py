@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from transaction.export import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, filter_export_queryset, iter_export
+from transaction.models import Transaction
+
+
+class Command(BaseCommand):
+    """
+    Stream transactions to a file or stdout as CSV or NDJSON, reading the
+    table in chunks so memory stays flat for any number of rows.
+    """
+    help = 'Export transactions as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='export_format', choices=list(EXPORT_FORMATS), default='csv', help='Output format')
+        parser.add_argument('--status', help='Only export transactions with this status')
+        parser.add_argument('--start', help='Only export transactions created on or after this ISO date/datetime')
+        parser.add_argument('--end', help='Only export transactions created up to this ISO date (inclusive) or before this datetime')
+        parser.add_argument('--output', help='File to write to (defaults to stdout)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows fetched from the database per chunk')
+
+    def handle(self, *args, **options):
+        try:
+            transactions = filter_export_queryset(
+                Transaction.objects.all(),
+                status=options['status'],
+                start=options['start'],
+                end=options['end'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        chunks = iter_export(transactions, options['export_format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(chunks)
+            self.stderr.write(self.style.SUCCESS(f"Exported transactions to {options['output']}"))
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
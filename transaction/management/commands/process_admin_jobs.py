@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from transaction.jobs import claimable_jobs, run_job
+from transaction.models import AdminJob
+
+
+class Command(BaseCommand):
+    """
+    Run queued admin jobs, and resume running ones whose runner died (see
+    ADMIN_JOB_STALE_AFTER). This is the supported job runner: keep it running
+    with --loop in production, where threads started by web workers can be
+    killed with their worker at any time.
+    """
+    help = 'Run queued and stale background admin jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new jobs')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep between polls when idle')
+
+    def handle(self, *args, **options):
+        while True:
+            for job_id in claimable_jobs().order_by('created_at').values_list('pk', flat=True):
+                if run_job(job_id):
+                    job = AdminJob.objects.get(pk=job_id)
+                    self.stdout.write(f'{job}: {job.message}')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
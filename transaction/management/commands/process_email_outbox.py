@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand
+from transaction.outbox import deliver_due
+
+
+class Command(BaseCommand):
+    """
+    Deliver queued transaction emails from the outbox, retrying failures with
+    exponential backoff. Run once (e.g. from cron) or continuously with --loop.
+    """
+    help = 'Deliver pending transaction notification emails from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Notifications claimed per batch')
+        parser.add_argument('--max-attempts', type=int, default=None, help='Attempts before a notification is marked FAILED')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new notifications')
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep between polls when idle')
+
+    def handle(self, *args, **options):
+        while True:
+            # Drain everything that is due before sleeping
+            while True:
+                sent, failed = deliver_due(options['batch_size'], options['max_attempts'])
+                if sent or failed:
+                    self.stdout.write(f'Sent {sent} emails, {failed} failed')
+                if sent + failed < options['batch_size']:
+                    break
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,55 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from transaction.analytics import rebuild_daily_revenue
+from transaction.models import Transaction
+
+
+class Command(BaseCommand):
+    """
+    Recompute the DailyRevenue rollup for a date range from the transactions,
+    one batch of days per database transaction.
+
+    Run it after backfill_transaction_lines or backfill_transaction_totals, or
+    whenever rollups are suspected to have drifted.
+    """
+    help = 'Rebuild daily revenue rollups for a date range (defaults to the whole history)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First ISO date to rebuild (defaults to the oldest transaction)')
+        parser.add_argument('--end', help='Last ISO date to rebuild, inclusive (defaults to today)')
+        parser.add_argument('--days', type=int, default=31, help='Number of days rebuilt per database transaction')
+
+    def _parse(self, value):
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date: {value}")
+        return day
+
+    def handle(self, *args, **options):
+        bounds = Transaction.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+        if options['start']:
+            start = self._parse(options['start'])
+        elif bounds['first'] is not None:
+            start = timezone.localdate(bounds['first'])
+        else:
+            start = timezone.localdate()
+        end = self._parse(options['end']) if options['end'] else max(
+            timezone.localdate(), timezone.localdate(bounds['last']) if bounds['last'] else start
+        )
+        if end < start:
+            raise CommandError('--end must not be before --start')
+        if options['days'] < 1:
+            raise CommandError('--days must be at least 1')
+
+        counted = 0
+        batch_start = start
+        while batch_start <= end:
+            batch_end = min(batch_start + timedelta(days=options['days'] - 1), end)
+            counted += rebuild_daily_revenue(batch_start, batch_end)
+            self.stdout.write(f'Rebuilt {batch_start} to {batch_end} ({counted} transactions so far)...')
+            batch_start = batch_end + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(f'Successfully rebuilt daily revenue from {start} to {end} for {counted} transactions'))
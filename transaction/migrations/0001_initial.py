@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-17 01:48
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Transaction',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('basket', models.JSONField(default=list, help_text='Array of items, each with service_type_id and quantity')),
+                ('full_name', models.CharField(max_length=255)),
+                ('email', models.EmailField(max_length=254)),
+                ('phone_number', models.CharField(blank=True, max_length=20, null=True)),
+                ('address', models.CharField(blank=True, max_length=255, null=True)),
+                ('city', models.CharField(blank=True, max_length=100, null=True)),
+                ('state', models.CharField(blank=True, max_length=100, null=True)),
+                ('zip_code', models.CharField(blank=True, max_length=20, null=True)),
+                ('card_number', models.CharField(blank=True, max_length=20, null=True)),
+                ('expiry_date', models.CharField(blank=True, max_length=7, null=True)),
+                ('cvv', models.CharField(blank=True, max_length=4, null=True)),
+                ('amount', models.FloatField(default=0.0, help_text='Total amount for the transaction')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('APPROVED', 'Approved'), ('DECLINED', 'Declined'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
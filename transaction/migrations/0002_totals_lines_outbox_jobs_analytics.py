@@ -0,0 +1,174 @@
+# Generated by Django 5.2.1 on 2026-10-17 01:48
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0002_basket_image_variants_updated_at'),
+        ('transaction', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdminJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('action', models.CharField(choices=[('RECALCULATE', 'Recalculate amount from basket'), ('MARK_COMPLETED', 'Mark as COMPLETED'), ('MARK_FAILED', 'Mark as FAILED')], max_length=30)),
+                ('status', models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='QUEUED', max_length=20)),
+                ('transaction_ids', models.JSONField(default=list, help_text='IDs of the transactions the action applies to')),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('message', models.TextField(blank=True, null=True)),
+                ('requested_by', models.CharField(blank=True, max_length=150, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('service_id', models.UUIDField(blank=True, help_text='Empty for all services', null=True)),
+                ('service_title', models.CharField(blank=True, default='', help_text='Latest title of the service', max_length=255)),
+                ('order_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'ordering': ['date', 'status', 'service_id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('transaction_status', models.CharField(help_text='Transaction status the notification is for', max_length=20)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('SENT', 'Sent'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['next_attempt_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('key', models.CharField(max_length=255)),
+                ('scope', models.CharField(help_text='Endpoint (and object) the key was used for', max_length=255)),
+                ('request_fingerprint', models.CharField(max_length=64)),
+                ('response_status', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('response_body', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RevenueRollupEntry',
+            fields=[
+                ('transaction', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='revenue_rollup', serialize=False, to='transaction.transaction')),
+                ('date', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('service_revenue', models.JSONField(default=dict, help_text='Title and revenue (as a string) per service ID')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TransactionLine',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('service_id', models.UUIDField(blank=True, help_text='Service the type belonged to at the time of sale', null=True)),
+                ('service_title', models.CharField(max_length=255)),
+                ('type_name', models.CharField(max_length=255)),
+                ('quantity', models.PositiveIntegerField()),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('line_total', models.DecimalField(decimal_places=2, help_text='unit_price times quantity', max_digits=12)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='subtotal',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Basket subtotal captured at checkout', max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='tax_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Tax amount captured at checkout', max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='total_with_tax',
+            field=models.DecimalField(blank=True, decimal_places=2, help_text='Total including tax captured at checkout', max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['-created_at', 'id'], name='transaction_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['status', '-created_at', 'id'], name='transaction_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['email', '-created_at', 'id'], name='transaction_email_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyrevenue',
+            index=models.Index(fields=['service_id', 'date'], name='daily_revenue_service_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrevenue',
+            constraint=models.UniqueConstraint(condition=models.Q(('service_id__isnull', False)), fields=('date', 'status', 'service_id'), name='unique_daily_service_revenue'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrevenue',
+            constraint=models.UniqueConstraint(condition=models.Q(('service_id__isnull', True)), fields=('date', 'status'), name='unique_daily_revenue'),
+        ),
+        migrations.AddField(
+            model_name='emailoutbox',
+            name='transaction',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='email_outbox', to='transaction.transaction'),
+        ),
+        migrations.AddConstraint(
+            model_name='idempotencykey',
+            constraint=models.UniqueConstraint(fields=('scope', 'key'), name='unique_idempotency_key'),
+        ),
+        migrations.AddField(
+            model_name='transactionline',
+            name='service_type',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transaction_lines', to='service.type'),
+        ),
+        migrations.AddField(
+            model_name='transactionline',
+            name='transaction',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='transaction.transaction'),
+        ),
+        migrations.AddIndex(
+            model_name='emailoutbox',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='emailoutbox',
+            constraint=models.UniqueConstraint(fields=('transaction', 'transaction_status'), name='unique_outbox_notification'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+import uuid
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import migrations
+
+CHUNK_SIZE = 500
+TAX_RATE = Decimal('0.10')
+CENTS = Decimal('0.01')
+
+
+def _type_id(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def _basket_items(basket):
+    for item in basket or []:
+        if isinstance(item, dict) and all(key in item for key in ['service_type_id', 'quantity']):
+            item_type_id = _type_id(item['service_type_id'])
+            if item_type_id is not None:
+                yield item_type_id, int(item['quantity'])
+
+
+def backfill_totals(apps, schema_editor):
+    """
+    Fill the subtotal/tax/total snapshot columns of existing transactions from
+    the current service type prices (see backfill_transaction_totals), pricing
+    each chunk with one service type query.
+    """
+    Transaction = apps.get_model('transaction', 'Transaction')
+    Type = apps.get_model('service', 'Type')
+    queryset = Transaction.objects.filter(total_with_tax__isnull=True).order_by('pk')
+    last_pk = None
+    while True:
+        chunk_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(chunk_queryset.only('pk', 'basket')[:CHUNK_SIZE])
+        if not chunk:
+            break
+        type_ids = {type_id for transaction in chunk for type_id, _ in _basket_items(transaction.basket)}
+        prices = dict(Type.objects.filter(id__in=type_ids).values_list('id', 'price'))
+        for transaction in chunk:
+            subtotal = sum(
+                (prices[type_id] * quantity for type_id, quantity in _basket_items(transaction.basket) if type_id in prices),
+                Decimal('0.00'),
+            )
+            tax_amount = subtotal * TAX_RATE
+            transaction.subtotal = subtotal.quantize(CENTS, rounding=ROUND_HALF_UP)
+            transaction.tax_amount = tax_amount.quantize(CENTS, rounding=ROUND_HALF_UP)
+            transaction.total_with_tax = (subtotal + tax_amount).quantize(CENTS, rounding=ROUND_HALF_UP)
+        Transaction.objects.bulk_update(chunk, ['subtotal', 'tax_amount', 'total_with_tax'])
+        last_pk = chunk[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service', '0002_basket_image_variants_updated_at'),
+        ('transaction', '0002_totals_lines_outbox_jobs_analytics'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
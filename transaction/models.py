@@ -1,7 +1,12 @@
 from django.db import models
+from django.utils import timezone
 import uuid
-from decimal import Decimal
-import json
+from decimal import Decimal, ROUND_HALF_UP
+from service import catalog
+from .pricing import DEFAULT_TAX_RATE, basket_items, basket_service_type_ids, price_basket, resolve_service_types
+
+CENTS = Decimal('0.01')
+
 
 class Transaction(models.Model):
     """
@@ -27,44 +32,111 @@ class Transaction(models.Model):
     expiry_date = models.CharField(max_length=7, blank=True, null=True)  # Format: MM/YYYY
     cvv = models.CharField(max_length=4, blank=True, null=True)
     amount = models.FloatField(default=0.00, help_text="Total amount for the transaction")
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True, help_text="Basket subtotal captured at checkout")
+    tax_amount = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True, help_text="Tax amount captured at checkout")
+    total_with_tax = models.DecimalField(max_digits=12, decimal_places=2, blank=True, null=True, help_text="Total including tax captured at checkout")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Default listing order and the keyset pagination cursor
+            models.Index(fields=['-created_at', 'id'], name='transaction_created_idx'),
+            # by_status and by_customer filters, already in listing order
+            models.Index(fields=['status', '-created_at', 'id'], name='transaction_status_created_idx'),
+            models.Index(fields=['email', '-created_at', 'id'], name='transaction_email_created_idx'),
+        ]
+    
+    def get_pricing(self, tax_rate=DEFAULT_TAX_RATE):
+        """
+        Get the priced basket totals, computed once and cached on the instance
+        until the basket or tax rate changes.
+        """
+        pricing = getattr(self, '_pricing', None)
+        if pricing is None or not pricing.matches(self.basket, tax_rate):
+            pricing = price_basket(self.basket, tax_rate=tax_rate)
+            self._pricing = pricing
+        return pricing
     
     def calculate_amount_from_basket(self):
         """
         Calculate the total amount from basket items using service type IDs.
         """
-        from service.models import Type
-        total = Decimal('0.00')
-        if self.basket:
-            for item in self.basket:
-                if all(key in item for key in ['service_type_id', 'quantity']):
-                    try:
-                        service_type = Type.objects.get(id=item['service_type_id'])
-                        quantity = int(item['quantity'])
-                        total += service_type.price * quantity
-                    except Type.DoesNotExist:
-                        continue  # Skip invalid service types
-        return total
+        return self.get_pricing().subtotal
     
-    def calculate_tax_amount(self, tax_rate=Decimal('0.10')):
+    def calculate_tax_amount(self, tax_rate=DEFAULT_TAX_RATE):
         """
         Calculate tax amount based on basket total (default 10% tax).
         """
-        subtotal = self.calculate_amount_from_basket()
-        return subtotal * tax_rate
+        return self.get_pricing(tax_rate).tax_amount
     
-    def get_total_with_tax(self, tax_rate=Decimal('0.10')):
+    def get_total_with_tax(self, tax_rate=DEFAULT_TAX_RATE):
         """
         Get total amount including tax.
         """
-        subtotal = self.calculate_amount_from_basket()
-        tax = subtotal * tax_rate
-        return subtotal + tax
+        return self.get_pricing(tax_rate).total_with_tax
+    
+    def snapshot_totals(self):
+        """
+        Capture the current basket totals in the persisted snapshot columns so
+        later reads neither query live prices nor drift when prices change.
+        """
+        pricing = self.get_pricing()
+        self.subtotal = pricing.subtotal.quantize(CENTS, rounding=ROUND_HALF_UP)
+        self.tax_amount = pricing.tax_amount.quantize(CENTS, rounding=ROUND_HALF_UP)
+        self.total_with_tax = pricing.total_with_tax.quantize(CENTS, rounding=ROUND_HALF_UP)
+    
+    def get_totals(self):
+        """
+        Get (subtotal, tax_amount, total_with_tax), preferring the checkout
+        snapshot and falling back to live pricing for rows that predate it.
+        """
+        if self.total_with_tax is not None:
+            return self.subtotal, self.tax_amount, self.total_with_tax
+        pricing = self.get_pricing()
+        return pricing.subtotal, pricing.tax_amount, pricing.total_with_tax
+    
+    def build_lines(self, service_types=None):
+        """
+        Build unsaved TransactionLine rows for the basket, capturing each
+        service type's current price, title and name. Items whose service
+        type cannot be resolved are skipped, as they are when pricing.
+        
+        Args:
+            service_types: Optional pre-resolved map of Type instances keyed by ID
+        """
+        if service_types is None:
+            service_types = resolve_service_types(basket_service_type_ids(self.basket))
+        lines = []
+        for item in basket_items(self.basket):
+            service_type = service_types.get(catalog.normalize_id(item['service_type_id']))
+            if service_type is None:
+                continue
+            quantity = int(item['quantity'])
+            lines.append(TransactionLine(
+                transaction=self,
+                service_type=service_type,
+                service_id=service_type.service_id,
+                service_title=service_type.service.title,
+                type_name=service_type.name,
+                quantity=quantity,
+                unit_price=service_type.price,
+                line_total=service_type.price * quantity,
+            ))
+        return lines
+    
+    def get_lines(self):
+        """
+        Get the TransactionLine rows recorded at checkout, using prefetched
+        lines when available. Empty for unsaved transactions and for those
+        checked out before lines were recorded.
+        """
+        if self._state.adding:
+            return []
+        return list(self.lines.all())
     
     def save(self, *args, **kwargs):
         """
@@ -85,3 +157,187 @@ class Transaction(models.Model):
     
     def __str__(self):
         return f"{self.id} - {self.full_name} ({self.status})"
+
+
+class TransactionLine(models.Model):
+    """
+    Represents one basket item of a transaction as sold.
+    
+    Written alongside the basket JSON at checkout (see Transaction.build_lines)
+    so reports can aggregate quantities and revenue with GROUP BY in the
+    database. Price, service title and type name are copied at the time of
+    sale and do not follow later catalog changes.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='lines')
+    service_type = models.ForeignKey('service.Type', on_delete=models.SET_NULL, blank=True, null=True, related_name='transaction_lines')
+    service_id = models.UUIDField(blank=True, null=True, help_text="Service the type belonged to at the time of sale")
+    service_title = models.CharField(max_length=255)
+    type_name = models.CharField(max_length=255)
+    quantity = models.PositiveIntegerField()
+    unit_price = models.DecimalField(max_digits=12, decimal_places=2)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2, help_text="unit_price times quantity")
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.service_title} - {self.type_name}"
+
+
+class DailyRevenue(models.Model):
+    """
+    Represents the orders and pre-tax revenue of one day and status.
+    
+    Rows without a service_id cover whole orders; the others cover the basket
+    lines of one service, counting each order once per service. The service
+    title is only kept for display, so renamed services stay one series. Kept
+    up to date incrementally by transaction.analytics.
+    """
+    date = models.DateField()
+    status = models.CharField(max_length=20)
+    service_id = models.UUIDField(blank=True, null=True, help_text="Empty for all services")
+    service_title = models.CharField(max_length=255, blank=True, default='', help_text="Latest title of the service")
+    order_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    
+    class Meta:
+        ordering = ['date', 'status', 'service_id']
+        constraints = [
+            # NULLs never conflict in unique constraints, so the all-services rows get their own
+            models.UniqueConstraint(
+                fields=['date', 'status', 'service_id'], condition=models.Q(service_id__isnull=False),
+                name='unique_daily_service_revenue',
+            ),
+            models.UniqueConstraint(
+                fields=['date', 'status'], condition=models.Q(service_id__isnull=True),
+                name='unique_daily_revenue',
+            ),
+        ]
+        indexes = [
+            # Per-service reports over a date range
+            models.Index(fields=['service_id', 'date'], name='daily_revenue_service_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} {self.status} {self.service_title or 'all services'}: {self.revenue}"
+
+
+class RevenueRollupEntry(models.Model):
+    """
+    Represents what one transaction currently contributes to DailyRevenue.
+    
+    The amounts are recorded so a later status or total change can subtract
+    exactly what was added, whatever happened to prices or lines since.
+    """
+    transaction = models.OneToOneField(Transaction, on_delete=models.CASCADE, primary_key=True, related_name='revenue_rollup')
+    date = models.DateField()
+    status = models.CharField(max_length=20)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2)
+    service_revenue = models.JSONField(default=dict, help_text="Title and revenue (as a string) per service ID")
+    
+    def __str__(self):
+        return f"{self.transaction_id} counted as {self.status} on {self.date}"
+
+
+class EmailOutbox(models.Model):
+    """
+    Represents a pending transaction email notification.
+    
+    Rows are written in the same database transaction as the status change and
+    delivered later by the process_email_outbox worker, so the API never waits
+    on template rendering or SMTP.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='email_outbox')
+    transaction_status = models.CharField(max_length=20, help_text="Transaction status the notification is for")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['next_attempt_at']
+        constraints = [
+            # One notification per transaction and status, however often it is enqueued
+            models.UniqueConstraint(fields=['transaction', 'transaction_status'], name='unique_outbox_notification'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.transaction_id} - {self.transaction_status} email ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Represents a client-supplied Idempotency-Key and the response it produced.
+    
+    A row without a response_status marks a request that is still in progress;
+    once completed, retries with the same key replay the stored response.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    key = models.CharField(max_length=255)
+    scope = models.CharField(max_length=255, help_text="Endpoint (and object) the key was used for")
+    request_fingerprint = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(blank=True, null=True)
+    response_body = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='unique_idempotency_key'),
+        ]
+    
+    def __str__(self):
+        return f"{self.scope} - {self.key}"
+
+
+class AdminJob(models.Model):
+    """
+    Represents a heavy admin action running in the background in chunks.
+    """
+    ACTION_CHOICES = [
+        ('RECALCULATE', 'Recalculate amount from basket'),
+        ('MARK_COMPLETED', 'Mark as COMPLETED'),
+        ('MARK_FAILED', 'Mark as FAILED'),
+    ]
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    action = models.CharField(max_length=30, choices=ACTION_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='QUEUED')
+    transaction_ids = models.JSONField(default=list, help_text="IDs of the transactions the action applies to")
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    message = models.TextField(blank=True, null=True)
+    requested_by = models.CharField(max_length=150, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    # Renewed after every chunk; a RUNNING job whose heartbeat is older than
+    # ADMIN_JOB_STALE_AFTER seconds lost its runner and may be reclaimed
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    @property
+    def progress(self):
+        """Percentage of transactions processed so far."""
+        return round(self.processed * 100 / self.total) if self.total else 100
+    
+    def __str__(self):
+        return f"{self.get_action_display()} ({self.processed}/{self.total}, {self.status})"
@@ -0,0 +1,136 @@
+"""
+Transactional outbox for transaction email notifications.
+
+Views enqueue a notification in the same database transaction as the status
+change; the process_email_outbox worker delivers due notifications with
+retries and exponential backoff. A unique (transaction, status) constraint
+dedups notifications, so retries and replays never email a customer twice.
+"""
+from datetime import timedelta
+import logging
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.utils import timezone
+from .email_service import NOTIFIABLE_STATUSES, TransactionEmailService
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_notification(transaction):
+    """
+    Queue the notification for the transaction's current status.
+
+    Call inside the database transaction that changes the status, so the
+    notification is committed (or rolled back) together with it.
+
+    Args:
+        transaction: Transaction instance
+
+    Returns:
+        bool: True if a new notification was queued, False if the status has no
+        email or an identical notification already exists
+    """
+    if transaction.status not in NOTIFIABLE_STATUSES:
+        return False
+    _, created = EmailOutbox.objects.get_or_create(
+        transaction=transaction,
+        transaction_status=transaction.status,
+    )
+    return created
+
+
+def enqueue_notifications(transaction_ids, status):
+    """
+    Queue notifications for many transactions that were moved to one status.
+
+    Call inside the database transaction that changes the status, like
+    enqueue_notification().
+
+    Returns:
+        int: Number of notifications passed to the outbox; existing ones are kept
+    """
+    if status not in NOTIFIABLE_STATUSES:
+        return 0
+    entries = EmailOutbox.objects.bulk_create(
+        [EmailOutbox(transaction_id=transaction_id, transaction_status=status) for transaction_id in transaction_ids],
+        ignore_conflicts=True,
+    )
+    return len(entries)
+
+
+def _retry_delay(attempts):
+    """Exponential backoff delay after the given number of failed attempts."""
+    base = getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 60)
+    maximum = getattr(settings, 'EMAIL_OUTBOX_MAX_RETRY_DELAY', 60 * 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), maximum))
+
+
+def claim_due(batch_size):
+    """
+    Claim up to batch_size due notifications for this worker.
+
+    Claimed rows are leased by pushing next_attempt_at forward, so concurrent
+    workers skip them while they are being delivered.
+    """
+    lease = timedelta(seconds=getattr(settings, 'EMAIL_OUTBOX_LEASE', 5 * 60))
+    now = timezone.now()
+    with db_transaction.atomic():
+        entries = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .select_related('transaction')
+            .filter(status='PENDING', next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        if entries:
+            EmailOutbox.objects.filter(pk__in=[entry.pk for entry in entries]).update(next_attempt_at=now + lease)
+    return entries
+
+
+def record_result(entry, sent, max_attempts=None, error=None):
+    """
+    Record a delivery attempt, scheduling a retry with backoff on failure.
+
+    Args:
+        entry: The EmailOutbox row that was attempted
+        sent: Whether the email was delivered
+        max_attempts: Attempts before giving up (EMAIL_OUTBOX_MAX_ATTEMPTS by default)
+        error: Why delivery failed, stored as last_error
+    """
+    if max_attempts is None:
+        max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    entry.attempts += 1
+    if sent:
+        entry.status = 'SENT'
+        entry.sent_at = timezone.now()
+        entry.last_error = None
+    else:
+        entry.last_error = error or 'Email could not be rendered or was not accepted by the backend'
+        if entry.attempts >= max_attempts:
+            entry.status = 'FAILED'
+            logger.error(f"Giving up on {entry.transaction_status} email for transaction {entry.transaction_id} after {entry.attempts} attempts")
+        else:
+            entry.next_attempt_at = timezone.now() + _retry_delay(entry.attempts)
+    entry.save(update_fields=['attempts', 'status', 'sent_at', 'last_error', 'next_attempt_at'])
+
+
+def deliver_due(batch_size=100, max_attempts=None):
+    """
+    Deliver one batch of due notifications over a single email connection.
+
+    Returns:
+        tuple: (sent, failed) counts for the batch
+    """
+    entries = claim_due(batch_size)
+    transactions = []
+    for entry in entries:
+        transaction = entry.transaction
+        # Render the email for the status it was queued for
+        transaction.status = entry.transaction_status
+        transactions.append(transaction)
+
+    errors = TransactionEmailService.deliver_notifications(transactions) if entries else []
+    for entry, error in zip(entries, errors):
+        record_result(entry, error is None, max_attempts=max_attempts, error=error)
+    sent = errors.count(None)
+    return sent, len(errors) - sent
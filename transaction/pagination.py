@@ -0,0 +1,18 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class TransactionCursorPagination(CursorPagination):
+    """
+    Keyset pagination for transaction listings.
+
+    Pages are addressed by an opaque cursor holding the created_at of the last
+    row seen, plus an offset past the rows that share that timestamp, so
+    fetching a deep page costs the same indexed range scan as the first one.
+    The cursor only uses the first ordering field; id just makes the order of
+    rows with equal timestamps deterministic and is not part of the cursor.
+    """
+    ordering = ('-created_at', 'id')
+    page_size = getattr(settings, 'TRANSACTION_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'TRANSACTION_MAX_PAGE_SIZE', 500)
@@ -0,0 +1,153 @@
+"""
+Basket pricing engine for transactions.
+
+Resolves every service type referenced by one basket (or by a whole page of
+transactions) with a single bulk lookup and computes subtotal, tax and total
+in one pass. Resolved types are keyed by canonical ID (catalog.normalize_id),
+so basket IDs in any case or format find their type.
+"""
+from decimal import Decimal
+from service import catalog
+
+DEFAULT_TAX_RATE = Decimal('0.10')
+
+
+class BasketPricing:
+    """
+    Priced totals for a basket, computed once and shared by every consumer.
+    """
+
+    def __init__(self, subtotal, tax_rate, basket_key):
+        self.subtotal = subtotal
+        self.tax_rate = tax_rate
+        self.tax_amount = subtotal * tax_rate
+        self.total_with_tax = subtotal + self.tax_amount
+        self.basket_key = basket_key
+
+    def matches(self, basket, tax_rate):
+        """Return True if this pricing is still valid for the given basket."""
+        return self.tax_rate == tax_rate and self.basket_key == basket_key(basket)
+
+
+def basket_items(basket):
+    """Yield the basket items that carry both a service type and a quantity."""
+    for item in basket or []:
+        if isinstance(item, dict) and all(key in item for key in ['service_type_id', 'quantity']):
+            yield item
+
+
+def basket_key(basket):
+    """
+    Build a hashable snapshot of the priced parts of a basket, used to detect
+    basket changes after a pricing was cached.
+    """
+    return tuple((str(item['service_type_id']), str(item['quantity'])) for item in basket_items(basket))
+
+
+def basket_service_type_ids(basket):
+    """
+    Return the distinct, well-formed service type IDs referenced by a basket.
+    """
+    # Malformed IDs are dropped, they can never match a service type
+    return set(filter(None, (catalog.normalize_id(item['service_type_id']) for item in basket_items(basket))))
+
+
+def resolve_service_types(type_ids):
+    """
+    Resolve service type IDs to Type instances (with their service).
+
+    Active types come from the in-process catalog cache; any others (types
+    deactivated since checkout) are fetched together in one query.
+
+    Args:
+        type_ids: Iterable of service type IDs
+
+    Returns:
+        dict: Type instances keyed by their string ID
+    """
+    type_ids = set(type_ids)
+    if not type_ids:
+        return {}
+    return catalog.get_types(type_ids)
+
+
+def load_service_types(type_ids):
+    """
+    Resolve service type IDs to Type instances (with their service) straight
+    from the database, with one query.
+
+    Checkout prices from here rather than from the catalog cache, so an order
+    is always charged the current price.
+
+    Args:
+        type_ids: Iterable of service type IDs
+
+    Returns:
+        dict: Type instances keyed by their string ID
+    """
+    from service.models import Type
+
+    type_ids = set(filter(None, map(catalog.normalize_id, type_ids)))
+    if not type_ids:
+        return {}
+    return {
+        str(service_type.id): service_type
+        for service_type in Type.objects.select_related('service').filter(id__in=type_ids)
+    }
+
+
+def price_basket(basket, service_types=None, tax_rate=DEFAULT_TAX_RATE):
+    """
+    Price a basket in a single pass.
+
+    Args:
+        basket: List of basket items, each with service_type_id and quantity
+        service_types: Optional pre-resolved map of Type instances keyed by ID
+        tax_rate: Tax rate applied to the subtotal
+
+    Returns:
+        BasketPricing: Subtotal, tax and total for the basket
+    """
+    if service_types is None:
+        service_types = resolve_service_types(basket_service_type_ids(basket))
+
+    subtotal = Decimal('0.00')
+    for item in basket_items(basket):
+        service_type = service_types.get(catalog.normalize_id(item['service_type_id']))
+        if service_type is None:
+            continue  # Skip invalid service types
+        subtotal += service_type.price * int(item['quantity'])
+    return BasketPricing(subtotal, tax_rate, basket_key(basket))
+
+
+def transactions_service_type_ids(transactions):
+    """
+    Return the distinct service type IDs referenced by a batch of transactions.
+    """
+    type_ids = set()
+    for transaction in transactions:
+        type_ids |= basket_service_type_ids(transaction.basket)
+    return type_ids
+
+
+def price_transactions(transactions, tax_rate=DEFAULT_TAX_RATE, service_types=None):
+    """
+    Price a batch of transactions with one service type lookup for all baskets.
+
+    The resulting pricing is cached on each transaction, so later calls to the
+    transaction's pricing methods within the same request are free.
+
+    Args:
+        transactions: Iterable of Transaction instances
+        tax_rate: Tax rate applied to each subtotal
+        service_types: Optional pre-resolved map of Type instances keyed by ID
+
+    Returns:
+        dict: The resolved Type instances keyed by their string ID
+    """
+    transactions = list(transactions)
+    if service_types is None:
+        service_types = resolve_service_types(transactions_service_type_ids(transactions))
+    for transaction in transactions:
+        transaction._pricing = price_basket(transaction.basket, service_types, tax_rate)
+    return service_types
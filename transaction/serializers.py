@@ -1,11 +1,25 @@
 from rest_framework import serializers
+from django.db import models, transaction as db_transaction
+from django.db.models import prefetch_related_objects
 from django.utils import timezone
 from datetime import datetime
 from decimal import Decimal
 import json
-from .models import Transaction
+import uuid
+from .models import Transaction, TransactionLine
+from .pricing import (
+    basket_service_type_ids,
+    load_service_types,
+    price_transactions,
+    resolve_service_types,
+    transactions_service_type_ids,
+)
+from core.dynamic_fields import DynamicFieldsMixin
+from service import catalog
 from service.models import Type, Service
 
+TOTAL_FIELDS = ('subtotal', 'tax_amount', 'total_with_tax')
+
 class BasketItemSerializer(serializers.Serializer):
     """
     Serializer for individual basket items.
@@ -18,46 +32,63 @@ class BasketItemSerializer(serializers.Serializer):
     service_type_price = serializers.SerializerMethodField(read_only=True)
     service_title = serializers.SerializerMethodField(read_only=True)
     
+    def _get_service_type_id(self, obj):
+        """Get the canonical service type ID of a basket item, or None."""
+        # Handle both dict (from JSON) and object access patterns
+        service_type_id = obj.get('service_type_id') if isinstance(obj, dict) else getattr(obj, 'service_type_id', None)
+        return catalog.normalize_id(service_type_id) if service_type_id else None
+    
+    def _get_service_type(self, obj):
+        """
+        Get the Type for a basket item from the serializer-context lookup map,
+        which the transaction serializers fill with one query per page.
+        """
+        service_type_id = self._get_service_type_id(obj)
+        if service_type_id is None:
+            return None
+        service_types = self.context.setdefault('service_types', {})
+        if service_type_id not in service_types:
+            # Standalone use without a prefetched map: resolve just this item
+            service_types[service_type_id] = resolve_service_types([service_type_id]).get(service_type_id)
+        return service_types[service_type_id]
+    
+    def _describe(self, obj):
+        """
+        Get (service title, type name, unit price) for a basket item, or None.
+        
+        Items of a transaction with TransactionLine rows (the 'basket_lines'
+        context entry, set while its transaction is rendered) are described as
+        sold at checkout; those of older transactions from the current catalog.
+        """
+        basket_lines = self.context.get('basket_lines')
+        if basket_lines is not None:
+            line = basket_lines.get(self._get_service_type_id(obj))
+            return (line.service_title, line.type_name, line.unit_price) if line else None
+        service_type = self._get_service_type(obj)
+        return (service_type.service.title, service_type.name, service_type.price) if service_type else None
+    
     def get_service_type_name(self, obj):
         """Get the service type name."""
-        try:
-            # Handle both dict (from JSON) and object access patterns
-            service_type_id = obj.get('service_type_id') if isinstance(obj, dict) else getattr(obj, 'service_type_id', None)
-            if service_type_id:
-                service_type = Type.objects.get(id=service_type_id)
-                return service_type.name
-        except (Type.DoesNotExist, AttributeError, KeyError):
-            pass
-        return None
+        description = self._describe(obj)
+        return description[1] if description else None
     
     def get_service_type_price(self, obj):
         """Get the service type price."""
-        try:
-            # Handle both dict (from JSON) and object access patterns
-            service_type_id = obj.get('service_type_id') if isinstance(obj, dict) else getattr(obj, 'service_type_id', None)
-            if service_type_id:
-                service_type = Type.objects.get(id=service_type_id)
-                return float(service_type.price)
-        except (Type.DoesNotExist, AttributeError, KeyError):
-            pass
-        return None
+        description = self._describe(obj)
+        return float(description[2]) if description else None
     
     def get_service_title(self, obj):
         """Get the service title."""
-        try:
-            # Handle both dict (from JSON) and object access patterns
-            service_type_id = obj.get('service_type_id') if isinstance(obj, dict) else getattr(obj, 'service_type_id', None)
-            if service_type_id:
-                service_type = Type.objects.get(id=service_type_id)
-                return service_type.service.title
-        except (Type.DoesNotExist, AttributeError, KeyError):
-            pass
-        return None
+        description = self._describe(obj)
+        return description[0] if description else None
     
     def validate_service_type_id(self, value):
         """Validate that the service type exists and is active."""
+        if catalog.get_type(value) is not None:
+            return value
+        # Not in the active catalog: look it up to report the precise reason
         try:
-            service_type = Type.objects.get(id=value)
+            service_type = Type.objects.select_related('service').get(id=value)
             if not service_type.is_active:
                 raise serializers.ValidationError("This service type is not active")
             if not service_type.service.is_active:
@@ -66,7 +97,33 @@ class BasketItemSerializer(serializers.Serializer):
         except Type.DoesNotExist:
             raise serializers.ValidationError("Service type does not exist")
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionListSerializer(serializers.ListSerializer):
+    """
+    List serializer that loads the page's TransactionLine rows with one query
+    and resolves the service types of the remaining baskets with a single
+    lookup before the rows are rendered, sharing it between the basket line
+    fields and pricing. All of it is skipped when ?fields= leaves out the
+    basket and the totals.
+    """
+    
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        transactions = list(iterable)
+        fields = self.child.fields
+        unpriced = []
+        if any(name in fields for name in TOTAL_FIELDS):
+            unpriced = [transaction for transaction in transactions if transaction.total_with_tax is None]
+        unlined = []
+        if 'basket' in fields:
+            prefetch_related_objects(transactions, 'lines')
+            unlined = [transaction for transaction in transactions if not transaction.get_lines()]
+        if unlined or unpriced:
+            service_types = resolve_service_types(transactions_service_type_ids(unlined + unpriced))
+            self.context['service_types'] = service_types
+            price_transactions(unpriced, service_types=service_types)
+        return super().to_representation(transactions)
+
+class TransactionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for Transaction model.
     """
@@ -99,23 +156,55 @@ class TransactionSerializer(serializers.ModelSerializer):
             'created_at'
         ]
         read_only_fields = ['id', 'created_at', 'amount', 'subtotal', 'tax_amount', 'total_with_tax']
+        list_serializer_class = TransactionListSerializer
         extra_kwargs = {
             'card_number': {'write_only': True},
             'expiry_date': {'write_only': True},
             'cvv': {'write_only': True},
         }
     
+    def to_representation(self, instance):
+        """
+        Describe the basket from the transaction's TransactionLine rows, or
+        for transactions without them resolve the basket's service types in
+        one query before rendering; list rendering prefetches both for the
+        whole page. Nothing is loaded when ?fields= leaves out the basket and
+        the totals.
+        """
+        needs_pricing = (
+            instance.total_with_tax is None
+            and getattr(instance, '_pricing', None) is None
+            and any(name in self.fields for name in TOTAL_FIELDS)
+        )
+        basket_lines = None
+        if 'basket' in self.fields:
+            lines = instance.get_lines()
+            if lines:
+                basket_lines = {str(line.service_type_id): line for line in lines if line.service_type_id}
+        self.context['basket_lines'] = basket_lines
+        needs_service_types = needs_pricing or ('basket' in self.fields and basket_lines is None)
+        if not needs_service_types:
+            return super().to_representation(instance)
+        service_types = self.context.setdefault('service_types', {})
+        missing_ids = basket_service_type_ids(instance.basket) - service_types.keys()
+        if missing_ids:
+            resolved = resolve_service_types(missing_ids)
+            service_types.update({type_id: resolved.get(type_id) for type_id in missing_ids})
+        if needs_pricing:
+            price_transactions([instance], service_types=service_types)
+        return super().to_representation(instance)
+    
     def get_subtotal(self, obj):
-        """Get the subtotal amount from basket items."""
-        return obj.calculate_amount_from_basket()
+        """Get the subtotal amount captured at checkout."""
+        return obj.get_totals()[0]
     
     def get_tax_amount(self, obj):
-        """Get the tax amount (10% of subtotal)."""
-        return obj.calculate_tax_amount()
+        """Get the tax amount (10% of subtotal) captured at checkout."""
+        return obj.get_totals()[1]
     
     def get_total_with_tax(self, obj):
-        """Get the total amount including tax."""
-        return obj.get_total_with_tax()
+        """Get the total amount including tax captured at checkout."""
+        return obj.get_totals()[2]
     
     def validate_basket(self, value):
         """
@@ -209,24 +298,34 @@ class TransactionSerializer(serializers.ModelSerializer):
         # Get card number for payment simulation
         card_number = validated_data.get('card_number')
         
-        # Create the transaction instance
-        transaction = Transaction.objects.create(**validated_data)
-        
-        # Set the basket data (it's stored as JSON in the model)
-        transaction.basket = basket_data
-        
-        # Automatically process payment based on card number
-        if card_number:
-            if card_number == '1':  # ✅ Approved Transaction
-                transaction.status = 'APPROVED'
-            elif card_number == '2':  # ❌ Declined
-                transaction.status = 'DECLINED'
-            elif card_number == '3':  # ⚠️ Gateway Failure
-                transaction.status = 'FAILED'
-            else:  # Default approved for other card numbers
-                transaction.status = 'APPROVED'
-        
-        transaction.save()
+        # Save the checkout and its lines together, so post-commit hooks see both
+        with db_transaction.atomic():
+            # Create the transaction instance
+            transaction = Transaction.objects.create(**validated_data)
+            
+            # Set the basket data (it's stored as JSON in the model)
+            transaction.basket = basket_data
+            
+            # Automatically process payment based on card number
+            if card_number:
+                if card_number == '1':  # ✅ Approved Transaction
+                    transaction.status = 'APPROVED'
+                elif card_number == '2':  # ❌ Declined
+                    transaction.status = 'DECLINED'
+                elif card_number == '3':  # ⚠️ Gateway Failure
+                    transaction.status = 'FAILED'
+                else:  # Default approved for other card numbers
+                    transaction.status = 'APPROVED'
+            
+            # Charge current database prices, not a possibly stale catalog
+            # snapshot, and persist them so later reads do not reprice the basket
+            service_types = load_service_types(basket_service_type_ids(basket_data))
+            price_transactions([transaction], service_types=service_types)
+            transaction.snapshot_totals()
+            transaction.save()
+            
+            # Record the basket as rows for SQL-side reporting
+            TransactionLine.objects.bulk_create(transaction.build_lines(service_types))
         
         return transaction
     
@@ -0,0 +1,46 @@
+from django.db import transaction as db_transaction
+from django.db.models.signals import post_init, post_save, pre_delete
+from django.dispatch import receiver
+from . import analytics
+from .models import RevenueRollupEntry, Transaction
+
+# Fields that decide a transaction's rollup contribution; lines are only
+# written at checkout, when the transaction is created
+REVENUE_FIELDS = ('status', 'created_at', 'subtotal', 'total_with_tax')
+
+
+def _revenue_state(instance):
+    # Read __dict__ so deferred fields are not loaded just for this
+    return tuple(instance.__dict__.get(name) for name in REVENUE_FIELDS)
+
+
+@receiver(post_init, sender=Transaction)
+def remember_revenue_state(sender, instance, **kwargs):
+    instance._revenue_state = _revenue_state(instance)
+
+
+@receiver(post_save, sender=Transaction)
+def sync_daily_revenue(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Update the revenue rollup once the save is committed, so rolled back
+    changes are never counted and a checkout is counted with its lines.
+    Saves that leave the revenue fields alone are skipped, except for
+    transactions without a totals snapshot, which are priced from the basket.
+    """
+    if raw:
+        return
+    state = _revenue_state(instance)
+    unchanged = state == instance._revenue_state and instance.total_with_tax is not None
+    instance._revenue_state = state
+    if unchanged and not created:
+        return
+    transaction_id = instance.pk
+    db_transaction.on_commit(lambda: analytics.sync_transactions([transaction_id]))
+
+
+@receiver(pre_delete, sender=Transaction)
+def remove_daily_revenue(sender, instance, **kwargs):
+    """Subtract a deleted transaction's contribution from the revenue rollup."""
+    entry = RevenueRollupEntry.objects.filter(transaction=instance.pk).first()
+    if entry is not None:
+        db_transaction.on_commit(lambda: analytics.remove_entry(entry))
@@ -1,3 +1,699 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
+from urllib.parse import parse_qs, urlparse
+from unittest.mock import patch
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum, prefetch_related_objects
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from service import catalog
+from service.models import Service, Type
+from .analytics import revenue_report
+from .email_service import TransactionEmailService
+from .jobs import JOB_HANDLERS
+from .outbox import claim_due, deliver_due, enqueue_notification
+from .models import AdminJob, DailyRevenue, EmailOutbox, IdempotencyKey, Transaction, TransactionLine
+from .pagination import TransactionCursorPagination
+from .pricing import price_transactions
+from .serializers import TransactionSerializer
+from .views import AnalyticsViewSet, TransactionViewSet
 
-# Create your tests here.
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked against SQLite')
+class TransactionIndexTests(TestCase):
+    """
+    Check with EXPLAIN that the listing endpoints are served by the
+    Transaction indexes instead of a full scan plus sort.
+    """
+
+    def explain(self, queryset):
+        ordering = TransactionCursorPagination.ordering
+        return queryset.order_by(*ordering)[:TransactionCursorPagination.page_size].explain()
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = self.explain(queryset)
+        self.assertIn(index_name, plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_list_uses_created_index(self):
+        self.assertUsesIndex(Transaction.objects.all(), 'transaction_created_idx')
+
+    def test_by_status_uses_status_index(self):
+        self.assertUsesIndex(Transaction.objects.filter(status='APPROVED'), 'transaction_status_created_idx')
+
+    def test_by_customer_uses_email_index(self):
+        self.assertUsesIndex(Transaction.objects.filter(email='customer@example.com'), 'transaction_email_created_idx')
+
+    def test_filtered_endpoints_query_through_their_indexes(self):
+        endpoints = [
+            ('list', {}, 'transaction_created_idx'),
+            ('by_status', {'status': 'APPROVED'}, 'transaction_status_created_idx'),
+            ('by_customer', {'email': 'customer@example.com'}, 'transaction_email_created_idx'),
+        ]
+        for action, params, index_name in endpoints:
+            with CaptureQueriesContext(connection) as queries:
+                TransactionViewSet.as_view({'get': action})(APIRequestFactory().get('/transactions/', params))
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {queries.captured_queries[0]['sql']}")
+                plan = ' '.join(row[-1] for row in cursor.fetchall())
+            self.assertIn(index_name, plan, action)
+            self.assertNotIn('TEMP B-TREE', plan, action)
+
+
+class BasketPricingTests(TestCase):
+    """
+    A page of baskets is priced with one service type lookup, and the result
+    is shared by every totals method.
+    """
+
+    def setUp(self):
+        service = Service.objects.create(title='Logo Design', logo='logos/logo.png')
+        basic = Type.objects.create(service=service, name='Basic', price=Decimal('10.00'))
+        premium = Type.objects.create(service=service, name='Premium', price=Decimal('99.00'))
+        basket = [
+            {'service_type_id': str(basic.id), 'quantity': 2},
+            {'service_type_id': str(premium.id), 'quantity': 1},
+            {'service_type_id': 'not-a-type', 'quantity': 5},
+        ]
+        for _ in range(3):
+            Transaction.objects.create(full_name='Jane Doe', email='jane@example.com', basket=basket)
+        # Price live rather than from the checkout snapshot
+        Transaction.objects.update(subtotal=None, tax_amount=None, total_with_tax=None)
+        catalog.invalidate()
+
+    def test_page_is_priced_with_one_lookup(self):
+        transactions = list(Transaction.objects.all())
+        # Services and types, loaded once into the catalog
+        with self.assertNumQueries(2):
+            price_transactions(transactions)
+        with self.assertNumQueries(0):
+            for transaction in transactions:
+                self.assertEqual(transaction.get_totals(), (Decimal('119.00'), Decimal('11.90'), Decimal('130.90')))
+                self.assertEqual(transaction.calculate_tax_amount(), Decimal('11.90'))
+                self.assertEqual(transaction.get_total_with_tax(), Decimal('130.90'))
+
+    def test_changed_basket_is_repriced(self):
+        transaction = Transaction.objects.first()
+        price_transactions([transaction])
+        transaction.basket = transaction.basket[1:]
+        self.assertEqual(transaction.calculate_amount_from_basket(), Decimal('99.00'))
+
+
+class BasketItemLookupTests(TestCase):
+    """
+    Basket lines on a transaction page are described from one lookup map.
+    """
+
+    def setUp(self):
+        service = Service.objects.create(title='Logo Design', logo='logos/logo.png')
+        self.types = [
+            Type.objects.create(service=service, name=f'Type {number}', price=Decimal('10.00')) for number in range(4)
+        ]
+        basket = [{'service_type_id': str(service_type.id), 'quantity': 1} for service_type in self.types]
+        for _ in range(5):
+            Transaction.objects.create(full_name='Jane Doe', email='jane@example.com', basket=basket)
+        catalog.invalidate()
+
+    def list(self):
+        return TransactionViewSet.as_view({'get': 'list'})(APIRequestFactory().get('/transactions/'))
+
+    def test_lines_add_no_queries_with_a_warm_catalog(self):
+        self.list()
+        # The page, then its (here missing) TransactionLine rows
+        with self.assertNumQueries(2):
+            response = self.list()
+        item = response.data['results'][0]['basket'][0]
+        self.assertEqual(item['service_title'], 'Logo Design')
+        self.assertEqual(item['service_type_price'], 10.0)
+
+    def test_inactive_types_are_resolved_together(self):
+        Type.objects.filter(pk__in=[service_type.pk for service_type in self.types[:2]]).update(is_active=False)
+        catalog.invalidate()
+        self.list()
+        # The page, its TransactionLine rows, then both inactive types in one query
+        with self.assertNumQueries(3):
+            response = self.list()
+        names = [item['service_type_name'] for item in response.data['results'][0]['basket']]
+        self.assertEqual(names, ['Type 0', 'Type 1', 'Type 2', 'Type 3'])
+
+
+class TransactionPaginationTests(TestCase):
+    """
+    Listings are paged by cursor on -created_at, without gaps or repeats.
+    """
+
+    def setUp(self):
+        now = timezone.now()
+        for number in range(7):
+            transaction = Transaction.objects.create(
+                full_name='Jane Doe', email='jane@example.com', basket=[],
+                status='APPROVED' if number % 2 else 'PENDING',
+            )
+            # Rows share timestamps, so pages rely on the cursor offset and the id order
+            Transaction.objects.filter(pk=transaction.pk).update(created_at=now - timedelta(minutes=number // 3))
+
+    def walk(self, action, params):
+        view = TransactionViewSet.as_view({'get': action})
+        pages, params = [], {**params, 'page_size': 3}
+        while True:
+            # Every page, however deep, is one indexed query plus one for its lines
+            with self.assertNumQueries(2):
+                response = view(APIRequestFactory().get('/transactions/', params))
+            pages.append([row['id'] for row in response.data['results']])
+            if not response.data['next']:
+                return pages
+            params['cursor'] = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+
+    def test_pages_cover_every_row_once_in_order(self):
+        pages = self.walk('list', {})
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        expected = Transaction.objects.order_by('-created_at', 'id').values_list('id', flat=True)
+        self.assertEqual([row for page in pages for row in page], [str(pk) for pk in expected])
+
+    def test_filtered_endpoints_are_paginated(self):
+        pages = self.walk('by_status', {'status': 'APPROVED'})
+        self.assertEqual([len(page) for page in pages], [3])
+        pages = self.walk('by_customer', {'email': 'jane@example.com'})
+        self.assertEqual(sum(len(page) for page in pages), 7)
+
+
+class TransactionConditionalGetTests(TestCase):
+    """
+    Transaction detail is validated by the row's updated_at, read with one query.
+    """
+
+    def setUp(self):
+        self.transaction = Transaction.objects.create(full_name='Jane Doe', email='jane@example.com', basket=[])
+
+    def retrieve(self, etag=None):
+        headers = {'If-None-Match': etag} if etag else None
+        request = APIRequestFactory().get('/transactions/', headers=headers)
+        return TransactionViewSet.as_view({'get': 'retrieve'})(request, pk=str(self.transaction.pk))
+
+    def test_unchanged_transaction_is_not_modified(self):
+        response = self.retrieve()
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.retrieve(response['ETag']).status_code, 304)
+
+    def test_bulk_status_change_invalidates_etag(self):
+        etag = self.retrieve()['ETag']
+        JOB_HANDLERS['MARK_FAILED']([self.transaction.pk])
+        self.assertEqual(self.retrieve(etag).status_code, 200)
+
+
+class TransactionSparseFieldsetTests(TestCase):
+    """
+    Leaving out the basket and totals skips service type lookups and pricing.
+    """
+
+    def test_list_without_basket_or_totals_prices_nothing(self):
+        service = Service.objects.create(title='Logo Design', logo='logos/logo.png')
+        service_type = Type.objects.create(service=service, name='Premium', price=Decimal('99.00'))
+        Transaction.objects.create(
+            full_name='Jane Doe', email='jane@example.com',
+            basket=[{'service_type_id': str(service_type.id), 'quantity': 1}],
+        )
+        catalog.invalidate()
+        request = APIRequestFactory().get('/transactions/', {'fields': 'id,status'})
+        with self.assertNumQueries(1):
+            response = TransactionViewSet.as_view({'get': 'list'})(request)
+        self.assertEqual(set(response.data['results'][0]), {'id', 'status'})
+
+
+class TransactionLineTests(TestCase):
+    """
+    Baskets are recorded as TransactionLine rows that aggregate in SQL.
+    """
+
+    def setUp(self):
+        service = Service.objects.create(title='Logo Design', logo='logos/logo.png')
+        self.basic = Type.objects.create(service=service, name='Basic', price=Decimal('10.00'))
+        self.premium = Type.objects.create(service=service, name='Premium', price=Decimal('99.00'))
+        catalog.invalidate()
+        self.basket = [
+            {'service_type_id': str(self.basic.id), 'quantity': 3},
+            {'service_type_id': str(self.premium.id), 'quantity': 1},
+        ]
+
+    def test_checkout_writes_lines(self):
+        serializer = TransactionSerializer(data={
+            'full_name': 'Jane Doe', 'email': 'jane@example.com', 'card_number': '1', 'basket': self.basket,
+        })
+        serializer.is_valid(raise_exception=True)
+        transaction = serializer.save()
+        lines = {line.type_name: line for line in transaction.lines.all()}
+        self.assertEqual(lines['Basic'].quantity, 3)
+        self.assertEqual(lines['Basic'].line_total, Decimal('30.00'))
+        self.assertEqual(lines['Premium'].service_title, 'Logo Design')
+
+    def test_checkout_charges_database_prices(self):
+        catalog.get_catalog()
+        # A price change this process's catalog snapshot has not seen yet
+        Type.objects.filter(pk=self.premium.pk).update(price=Decimal('120.00'))
+        basket = [{'service_type_id': str(self.premium.id).upper(), 'quantity': 1}]
+        serializer = TransactionSerializer(data={
+            'full_name': 'Jane Doe', 'email': 'jane@example.com', 'card_number': '1', 'basket': basket,
+        })
+        serializer.is_valid(raise_exception=True)
+        transaction = serializer.save()
+        self.assertEqual(transaction.subtotal, Decimal('120.00'))
+        self.assertEqual(transaction.lines.get().unit_price, Decimal('120.00'))
+
+    def test_lines_are_shown_as_sold(self):
+        serializer = TransactionSerializer(data={
+            'full_name': 'Jane Doe', 'email': 'jane@example.com', 'card_number': '1', 'basket': self.basket,
+        })
+        serializer.is_valid(raise_exception=True)
+        transaction = serializer.save()
+        Type.objects.filter(pk=self.basic.pk).update(price=Decimal('15.00'), name='Starter')
+        Service.objects.update(title='Branding')
+        catalog.invalidate()
+
+        request = APIRequestFactory().get('/transactions/')
+        for response in [
+            TransactionViewSet.as_view({'get': 'retrieve'})(request, pk=str(transaction.pk)).data,
+            TransactionViewSet.as_view({'get': 'list'})(request).data['results'][0],
+        ]:
+            items = [(item['service_title'], item['service_type_name'], item['service_type_price']) for item in response['basket']]
+            self.assertEqual(items, [('Logo Design', 'Basic', 10.0), ('Logo Design', 'Premium', 99.0)])
+            total = sum(Decimal(str(item['service_type_price'])) * item['quantity'] for item in response['basket'])
+            self.assertEqual(total, response['subtotal'])
+
+        info = TransactionEmailService._get_basket_info(transaction)
+        self.assertEqual([group.title for group in info['services']], ['Logo Design'])
+        self.assertEqual(
+            [(line.name, line.price, line.quantity) for line in info['services'][0].types],
+            [('Basic', Decimal('10.00'), 3), ('Premium', Decimal('99.00'), 1)],
+        )
+        self.assertEqual(sum(line.subtotal for line in info['services'][0].types), info['total_amount'])
+
+    def test_backfill_and_group_by(self):
+        Transaction.objects.create(full_name='Jane Doe', email='jane@example.com', basket=self.basket)
+        Transaction.objects.create(full_name='John Doe', email='john@example.com', basket=self.basket[:1])
+        call_command('backfill_transaction_lines', chunk_size=1, stdout=StringIO())
+        call_command('backfill_transaction_lines', stdout=StringIO())  # Already backfilled: no duplicates
+        revenue = dict(
+            TransactionLine.objects.values_list('type_name').annotate(Sum('line_total')).order_by()
+        )
+        self.assertEqual(revenue, {'Basic': Decimal('60.00'), 'Premium': Decimal('99.00')})
+
+
+class DailyRevenueTests(TestCase):
+    """
+    The daily rollup follows checkouts and status changes incrementally and
+    matches a full rebuild.
+    """
+
+    def setUp(self):
+        self.service = Service.objects.create(title='Logo Design', logo='logos/logo.png')
+        self.service_type = Type.objects.create(service=self.service, name='Premium', price=Decimal('50.00'))
+        catalog.invalidate()
+
+    def checkout(self, quantity, card_number='1'):
+        serializer = TransactionSerializer(data={
+            'full_name': 'Jane Doe', 'email': 'jane@example.com', 'card_number': card_number,
+            'basket': [{'service_type_id': str(self.service_type.id), 'quantity': quantity}],
+        })
+        serializer.is_valid(raise_exception=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            return serializer.save()
+
+    def rollup(self):
+        return sorted(DailyRevenue.objects.filter(order_count__gt=0).values_list(
+            'status', 'service_title', 'order_count', 'revenue',
+        ))
+
+    def test_checkout_and_status_change_update_rollup(self):
+        self.checkout(1)
+        transaction = self.checkout(3, card_number='2')
+        report = revenue_report(group_by=['status'])
+        self.assertEqual([(row['status'], row['order_count'], row['revenue']) for row in report], [
+            ('APPROVED', 1, Decimal('50.00')), ('DECLINED', 1, Decimal('150.00')),
+        ])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            transaction.status = 'APPROVED'
+            transaction.save()
+        report = revenue_report(group_by=['status', 'service'])
+        self.assertEqual(report, [{
+            'status': 'APPROVED', 'service': self.service.id, 'service_title': 'Logo Design',
+            'revenue': Decimal('200.00'), 'order_count': 2, 'average_order_value': Decimal('100.00'),
+        }])
+
+        incremental = self.rollup()
+        call_command('rebuild_daily_revenue', stdout=StringIO())
+        self.assertEqual(self.rollup(), incremental)
+
+    def test_recalculation_reprices_lines_and_rollup(self):
+        transaction = self.checkout(2)
+        catalog.get_catalog()
+        # A price change this process's catalog snapshot has not seen yet
+        Type.objects.filter(pk=self.service_type.pk).update(price=Decimal('60.00'))
+        JOB_HANDLERS['RECALCULATE']([transaction.pk])
+        transaction.refresh_from_db()
+        self.assertEqual(transaction.subtotal, Decimal('120.00'))
+        self.assertEqual(transaction.lines.get().unit_price, Decimal('60.00'))
+        self.assertEqual(self.rollup(), [
+            ('APPROVED', '', 1, Decimal('120.00')), ('APPROVED', 'Logo Design', 1, Decimal('120.00')),
+        ])
+
+    def test_bulk_status_change_and_delete(self):
+        transaction = self.checkout(2)
+        JOB_HANDLERS['MARK_FAILED']([transaction.pk])
+        self.assertEqual(self.rollup(), [('FAILED', '', 1, Decimal('100.00')), ('FAILED', 'Logo Design', 1, Decimal('100.00'))])
+        with self.captureOnCommitCallbacks(execute=True):
+            transaction.delete()
+        self.assertEqual(self.rollup(), [])
+
+    def test_renamed_service_stays_one_series(self):
+        self.checkout(1)
+        self.service.title = 'Brand Design'
+        self.service.save()
+        catalog.invalidate()
+        self.checkout(1)
+        report = revenue_report(group_by=['service'])
+        self.assertEqual([(row['service'], row['service_title'], row['order_count']) for row in report], [
+            (self.service.id, 'Brand Design', 2),
+        ])
+
+    def test_saves_that_do_not_change_revenue_are_not_synced(self):
+        transaction = self.checkout(1)
+        transaction = Transaction.objects.get(pk=transaction.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            transaction.description = 'Gift'
+            transaction.save()
+        self.assertEqual(callbacks, [])
+
+    def test_endpoint_validates_parameters(self):
+        self.checkout(1)
+        view = AnalyticsViewSet.as_view({'get': 'revenue'})
+
+        def get(params, user=User(is_staff=True)):
+            request = APIRequestFactory().get('/analytics/revenue/', params)
+            force_authenticate(request, user=user)
+            return view(request)
+
+        response = get({'start': '2000-01-01'})
+        self.assertEqual(response.data['results'][0]['order_count'], 1)
+        self.assertIn('day', response.data['results'][0])
+        self.assertEqual(get({'group_by': 'week'}).status_code, 400)
+        self.assertEqual(get({'service': 'Logo Design'}).status_code, 400)
+        self.assertEqual(get({}, user=User()).status_code, 403)
+
+
+class TransactionExportTests(TestCase):
+    """
+    Exports contain customer details, so only staff can download them.
+    """
+
+    def setUp(self):
+        Transaction.objects.create(full_name='Jane Doe', email='jane@example.com', basket=[])
+
+    def export(self, user=None):
+        request = APIRequestFactory().get('/transactions/export/', {'output': 'ndjson'})
+        if user is not None:
+            force_authenticate(request, user=user)
+        # As routed: the action's own permission_classes apply
+        return TransactionViewSet.as_view({'get': 'export'}, **TransactionViewSet.export.kwargs)(request)
+
+    def test_anonymous_clients_are_refused(self):
+        self.assertEqual(self.export().status_code, 403)
+
+    def test_staff_can_export(self):
+        staff = User.objects.create_user('admin', is_staff=True)
+        response = self.export(staff)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'jane@example.com', b''.join(response.streaming_content))
+
+    def test_command_writes_to_stdout(self):
+        stdout = StringIO()
+        call_command('export_transactions', export_format='ndjson', stdout=stdout)
+        self.assertIn('jane@example.com', stdout.getvalue())
+
+
+class TransactionAdminTests(TestCase):
+    """
+    The changelist shows formatted totals, priced from the snapshot or live.
+    """
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        service = Service.objects.create(title='Logo Design', logo='logos/logo.png')
+        self.service_type = Type.objects.create(service=service, name='Premium', price=Decimal('100.00'))
+        catalog.invalidate()
+
+    def create_legacy_transaction(self):
+        """A transaction saved before the totals snapshot existed."""
+        transaction = Transaction.objects.create(
+            full_name='Jane Doe', email='jane@example.com',
+            basket=[{'service_type_id': str(self.service_type.id), 'quantity': 1}],
+        )
+        Transaction.objects.filter(pk=transaction.pk).update(subtotal=None, tax_amount=None, total_with_tax=None)
+        return transaction
+
+    def test_total_column_prices_rows_without_snapshot(self):
+        self.create_legacy_transaction()
+        response = self.client.get('/admin/transaction/transaction/')
+        self.assertContains(response, '<td class="field-basket_total">$110.00</td>', html=True)
+
+    def test_changelist_queries_do_not_grow_with_rows_or_basket_size(self):
+        def changelist_queries():
+            catalog.invalidate()
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get('/admin/transaction/transaction/').status_code, 200)
+            return len(queries)
+
+        self.create_legacy_transaction()
+        baseline = changelist_queries()
+        for _ in range(20):
+            transaction = self.create_legacy_transaction()
+            transaction.basket = [{'service_type_id': str(self.service_type.id), 'quantity': 1}] * 10
+            transaction.save(update_fields=['basket'])
+        self.assertEqual(changelist_queries(), baseline)
+
+
+@override_settings(ADMIN_JOB_CHUNK_SIZE=1, ADMIN_JOB_STALE_AFTER=60)
+class AdminJobLeaseTests(TestCase):
+    """
+    The job runner command resumes jobs whose runner stopped renewing its lease.
+    """
+
+    def setUp(self):
+        self.transactions = [
+            Transaction.objects.create(full_name='Jane Doe', email='jane@example.com', basket=[]) for _ in range(3)
+        ]
+
+    def create_running_job(self, heartbeat_age):
+        return AdminJob.objects.create(
+            action='MARK_FAILED', status='RUNNING', processed=1, total=3,
+            transaction_ids=[str(transaction.pk) for transaction in self.transactions],
+            started_at=timezone.now() - heartbeat_age, heartbeat_at=timezone.now() - heartbeat_age,
+        )
+
+    def test_stale_job_is_resumed_from_its_progress(self):
+        job = self.create_running_job(timedelta(minutes=5))
+        call_command('process_admin_jobs', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), ('DONE', 3))
+        statuses = [Transaction.objects.get(pk=transaction.pk).status for transaction in self.transactions]
+        self.assertEqual(statuses, ['PENDING', 'FAILED', 'FAILED'])
+
+    def test_job_with_a_live_lease_is_left_alone(self):
+        job = self.create_running_job(timedelta(seconds=5))
+        call_command('process_admin_jobs', stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), ('RUNNING', 1))
+
+
+class EmailContextTests(TestCase):
+    """
+    Email contexts group slotted line items by service from one catalog lookup.
+    """
+
+    def setUp(self):
+        logo = Service.objects.create(title='Logo Design', logo='logos/logo.png')
+        web = Service.objects.create(title='Web Development', logo='logos/web.png')
+        lines = [(logo, 'Basic', '10.00', 2), (web, 'Landing', '80.00', 1), (logo, 'Premium', '99.00', 1)]
+        basket = [
+            {'service_type_id': str(Type.objects.create(service=service, name=name, price=Decimal(price)).id), 'quantity': quantity}
+            for service, name, price, quantity in lines
+        ]
+        self.transaction = Transaction.objects.create(
+            full_name='Jane Doe', email='jane@example.com', basket=basket, status='APPROVED',
+        )
+        catalog.invalidate()
+
+    def test_lines_are_grouped_by_service(self):
+        catalog.get_catalog()
+        prefetch_related_objects([self.transaction], 'lines')
+        with self.assertNumQueries(0):
+            info = TransactionEmailService._get_basket_info(self.transaction)
+        groups = {
+            group.title: [(line.name, line.quantity, line.subtotal) for line in group.types] for group in info['services']
+        }
+        self.assertEqual(groups, {
+            'Logo Design': [('Basic', 2, Decimal('20.00')), ('Premium', 1, Decimal('99.00'))],
+            'Web Development': [('Landing', 1, Decimal('80.00'))],
+        })
+        self.assertEqual((info['service_count'], info['total_amount']), (2, Decimal('199.00')))
+        self.assertFalse(hasattr(info['services'][0].types[0], '__dict__'))
+
+    def test_rendered_email_lists_every_line(self):
+        email = TransactionEmailService.build_notification_email(self.transaction)
+        for text in ['Logo Design', 'Basic', 'Premium', 'Web Development', 'Landing']:
+            self.assertIn(text, email.body)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_email_context', iterations=2, stdout=out)
+        self.assertIn('Catalog view model', out.getvalue())
+
+
+class BulkStatusEmailTests(TestCase):
+    """
+    Bulk status changes queue their emails in the outbox instead of sending them.
+    """
+
+    def setUp(self):
+        self.transaction = Transaction.objects.create(full_name='Jane Doe', email='jane@example.com', basket=[])
+
+    def test_status_change_is_queued_once(self):
+        JOB_HANDLERS['MARK_FAILED']([self.transaction.pk])
+        JOB_HANDLERS['MARK_FAILED']([self.transaction.pk])
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(list(EmailOutbox.objects.values_list('transaction_status', 'status')), [('FAILED', 'PENDING')])
+
+    def test_delivery_errors_are_recorded(self):
+        JOB_HANDLERS['MARK_FAILED']([self.transaction.pk])
+        with patch.object(mail.get_connection().__class__, 'send_messages', side_effect=OSError('Connection refused')):
+            self.assertEqual(deliver_due(), (0, 1))
+        entry = EmailOutbox.objects.get()
+        self.assertEqual((entry.status, entry.attempts), ('PENDING', 1))
+        self.assertEqual(entry.last_error, 'Sending failed: Connection refused')
+
+
+class IdempotencyKeyTests(TestCase):
+    """
+    Requests repeated with the same Idempotency-Key replay the first response.
+    """
+
+    def setUp(self):
+        service = Service.objects.create(title='Logo Design', logo='logos/logo.png')
+        service_type = Type.objects.create(service=service, name='Premium', price=Decimal('50.00'))
+        catalog.invalidate()
+        self.data = {
+            'full_name': 'Jane Doe', 'email': 'jane@example.com', 'card_number': '1',
+            'basket': [{'service_type_id': str(service_type.id), 'quantity': 1}],
+        }
+
+    def create(self, data=None, key='checkout-1'):
+        request = APIRequestFactory().post(
+            '/transactions/', data or self.data, format='json', headers={'Idempotency-Key': key},
+        )
+        return TransactionViewSet.as_view({'post': 'create'})(request)
+
+    def test_retry_replays_the_response(self):
+        first = self.create()
+        retry = self.create()
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual((retry.status_code, retry['Idempotent-Replayed']), (201, 'true'))
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_key_reused_with_a_different_body_is_rejected(self):
+        self.create()
+        response = self.create({**self.data, 'full_name': 'John Doe'})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_concurrent_duplicate_waits_for_the_first_response(self):
+        self.create()
+        # Put the key back in progress, as if the first request were still running
+        IdempotencyKey.objects.update(response_status=None, response_body=None)
+
+        def finish_first_request(seconds):
+            IdempotencyKey.objects.update(response_status=201, response_body={'id': 'first'})
+
+        with patch('transaction.idempotency.time.sleep', side_effect=finish_first_request) as sleep:
+            response = self.create()
+        sleep.assert_called_once()
+        self.assertEqual((response.status_code, response.data), (201, {'id': 'first'}))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_expired_key_is_processed_again(self):
+        self.create()
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        response = self.create()
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+        self.assertEqual(Transaction.objects.count(), 2)
+
+
+@override_settings(EMAIL_OUTBOX_RETRY_DELAY=60, EMAIL_OUTBOX_MAX_RETRY_DELAY=600, EMAIL_OUTBOX_MAX_ATTEMPTS=3)
+class EmailOutboxTests(TestCase):
+    """
+    Notifications are queued once per status, claimed under a lease and
+    retried with backoff until they are sent or attempts run out.
+    """
+
+    def setUp(self):
+        self.transaction = Transaction.objects.create(
+            full_name='Jane Doe', email='jane@example.com', basket=[], status='APPROVED',
+        )
+
+    def fail_delivery(self):
+        return patch.object(mail.get_connection().__class__, 'send_messages', side_effect=OSError('Connection refused'))
+
+    def make_due(self):
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+
+    def test_one_notification_per_transaction_and_status(self):
+        self.assertTrue(enqueue_notification(self.transaction))
+        self.assertFalse(enqueue_notification(self.transaction))
+        self.transaction.status = 'PENDING'
+        self.assertFalse(enqueue_notification(self.transaction))
+        self.transaction.status = 'COMPLETED'
+        self.assertTrue(enqueue_notification(self.transaction))
+        self.assertEqual(sorted(EmailOutbox.objects.values_list('transaction_status', flat=True)), ['APPROVED', 'COMPLETED'])
+
+    def test_claimed_notifications_are_leased(self):
+        enqueue_notification(self.transaction)
+        with patch.object(EmailOutbox.objects, 'select_for_update', wraps=EmailOutbox.objects.select_for_update) as select:
+            self.assertEqual(len(claim_due(10)), 1)
+        select.assert_called_once_with(skip_locked=True)
+        # Leased to the first worker, so a second worker finds nothing due
+        self.assertEqual(claim_due(10), [])
+        self.assertGreater(EmailOutbox.objects.get().next_attempt_at, timezone.now())
+
+    def test_failures_back_off_then_give_up(self):
+        enqueue_notification(self.transaction)
+        delays = []
+        with self.fail_delivery():
+            for _ in range(3):
+                self.make_due()
+                started = timezone.now()
+                self.assertEqual(deliver_due(), (0, 1))
+                entry = EmailOutbox.objects.get()
+                delays.append(round((entry.next_attempt_at - started).total_seconds() / 60))
+        self.assertEqual(delays[:2], [1, 2])
+        self.assertEqual((entry.status, entry.attempts), ('FAILED', 3))
+        self.make_due()
+        self.assertEqual(deliver_due(), (0, 0))
+
+    def test_command_sends_due_notifications(self):
+        enqueue_notification(self.transaction)
+        out = StringIO()
+        call_command('process_email_outbox', stdout=out)
+        self.assertEqual(out.getvalue(), 'Sent 1 emails, 0 failed\n')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['jane@example.com'])
+        entry = EmailOutbox.objects.get()
+        self.assertEqual((entry.status, entry.attempts, entry.last_error), ('SENT', 1, None))
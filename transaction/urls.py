@@ -1,7 +1,8 @@
 from rest_framework.routers import DefaultRouter
-from .views import TransactionViewSet
+from .views import AnalyticsViewSet, TransactionViewSet
 
 router = DefaultRouter()
 router.register(r'transactions', TransactionViewSet)
+router.register(r'analytics', AnalyticsViewSet, basename='analytics')
 
 urlpatterns = router.urls
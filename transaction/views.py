@@ -1,21 +1,40 @@
+import uuid
+from django.db import transaction as db_transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from core.conditional import ConditionalGetMixin
+from service.models import Service, Type
+from .analytics import REPORT_GROUPS, revenue_report
 from .models import Transaction
+from .pagination import TransactionCursorPagination
 from .serializers import TransactionSerializer
-from .email_service import TransactionEmailService
+from .export import EXPORT_FORMATS, filter_export_queryset, iter_export
+from .idempotency import idempotent
+from .outbox import enqueue_notification
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     ViewSet for Transaction model providing CRUD operations.
     """
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
+    pagination_class = TransactionCursorPagination
+    # Detail responses change with the transaction row and with the catalog
+    # used to describe its basket
+    conditional_actions = ('retrieve',)
+    conditional_object_field = 'updated_at'
+    conditional_models = (Service, Type)
     
+    @idempotent
     def create(self, request, *args, **kwargs):
         """
         Create a new transaction with basket items.
@@ -23,19 +42,11 @@ class TransactionViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=request.data)
         
         if serializer.is_valid():
-            # Save the transaction
-            transaction = serializer.save()
-            
-            # Send email notification based on final transaction status
-            try:
-                email_service = TransactionEmailService()
-                email_sent = email_service.send_transaction_notification(transaction)
-                if email_sent:
-                    logger.info(f"Transaction email sent for transaction {transaction.id} with status {transaction.status}")
-                else:
-                    logger.warning(f"Failed to send transaction email for transaction {transaction.id}")
-            except Exception as e:
-                logger.error(f"Error sending transaction email for transaction {transaction.id}: {str(e)}")
+            # Save the transaction and queue its notification atomically; the
+            # email itself is delivered by the process_email_outbox worker
+            with db_transaction.atomic():
+                transaction = serializer.save()
+                enqueue_notification(transaction)
             
             # Return the created transaction with calculated amounts
             response_serializer = self.get_serializer(transaction)
@@ -43,7 +54,17 @@ class TransactionViewSet(viewsets.ModelViewSet):
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    def _update_status(self, transaction, new_status):
+        """
+        Save a new status and queue its email notification in one database transaction.
+        """
+        with db_transaction.atomic():
+            transaction.status = new_status
+            transaction.save()
+            enqueue_notification(transaction)
+    
     @action(detail=True, methods=['post'])
+    @idempotent
     def process_payment(self, request, pk=None):
         """
         Process payment for a transaction.
@@ -62,20 +83,7 @@ class TransactionViewSet(viewsets.ModelViewSet):
         if card_number:
             # Simulate different payment outcomes based on card number
             if card_number == '1':  # ✅ Approved Transaction
-                transaction.status = 'APPROVED'
-                transaction.save()
-                
-                # Send approval email notification
-                try:
-                    email_service = TransactionEmailService()
-                    email_sent = email_service.send_transaction_notification(transaction)
-                    if email_sent:
-                        logger.info(f"Approval email sent for transaction {transaction.id}")
-                    else:
-                        logger.warning(f"Failed to send approval email for transaction {transaction.id}")
-                except Exception as e:
-                    logger.error(f"Error sending approval email for transaction {transaction.id}: {str(e)}")
-                
+                self._update_status(transaction, 'APPROVED')
                 return Response({
                     'message': 'Payment approved successfully',
                     'transaction_id': transaction.id,
@@ -83,20 +91,7 @@ class TransactionViewSet(viewsets.ModelViewSet):
                 }, status=status.HTTP_200_OK)
                 
             elif card_number == '2':  # ❌ Declined
-                transaction.status = 'DECLINED'
-                transaction.save()
-                
-                # Send decline email notification
-                try:
-                    email_service = TransactionEmailService()
-                    email_sent = email_service.send_transaction_notification(transaction)
-                    if email_sent:
-                        logger.info(f"Decline email sent for transaction {transaction.id}")
-                    else:
-                        logger.warning(f"Failed to send decline email for transaction {transaction.id}")
-                except Exception as e:
-                    logger.error(f"Error sending decline email for transaction {transaction.id}: {str(e)}")
-                
+                self._update_status(transaction, 'DECLINED')
                 return Response({
                     'message': 'Payment declined',
                     'transaction_id': transaction.id,
@@ -104,20 +99,7 @@ class TransactionViewSet(viewsets.ModelViewSet):
                 }, status=status.HTTP_400_BAD_REQUEST)
             
             elif card_number == '3':  # ⚠️ Gateway Failure
-                transaction.status = 'FAILED'
-                transaction.save()
-                
-                # Send failure email notification
-                try:
-                    email_service = TransactionEmailService()
-                    email_sent = email_service.send_transaction_notification(transaction)
-                    if email_sent:
-                        logger.info(f"Failure email sent for transaction {transaction.id}")
-                    else:
-                        logger.warning(f"Failed to send failure email for transaction {transaction.id}")
-                except Exception as e:
-                    logger.error(f"Error sending failure email for transaction {transaction.id}: {str(e)}")
-                
+                self._update_status(transaction, 'FAILED')
                 return Response({
                     'message': 'Gateway failure - payment could not be processed',
                     'transaction_id': transaction.id,
@@ -125,20 +107,7 @@ class TransactionViewSet(viewsets.ModelViewSet):
                 }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             
             else:  # Default approved for other card numbers
-                transaction.status = 'APPROVED'
-                transaction.save()
-                
-                # Send approval email notification
-                try:
-                    email_service = TransactionEmailService()
-                    email_sent = email_service.send_transaction_notification(transaction)
-                    if email_sent:
-                        logger.info(f"Approval email sent for transaction {transaction.id}")
-                    else:
-                        logger.warning(f"Failed to send approval email for transaction {transaction.id}")
-                except Exception as e:
-                    logger.error(f"Error sending approval email for transaction {transaction.id}: {str(e)}")
-                
+                self._update_status(transaction, 'APPROVED')
                 return Response({
                     'message': 'Payment approved successfully',
                     'transaction_id': transaction.id,
@@ -158,8 +127,9 @@ class TransactionViewSet(viewsets.ModelViewSet):
         status_param = request.query_params.get('status', None)
         if status_param:
             transactions = Transaction.objects.filter(status=status_param)
-            serializer = self.get_serializer(transactions, many=True)
-            return Response(serializer.data)
+            page = self.paginate_queryset(transactions)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
         return Response({'error': 'Status parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=False, methods=['get'])
@@ -170,6 +140,89 @@ class TransactionViewSet(viewsets.ModelViewSet):
         email_param = request.query_params.get('email', None)
         if email_param:
             transactions = Transaction.objects.filter(email=email_param)
-            serializer = self.get_serializer(transactions, many=True)
-            return Response(serializer.data)
+            page = self.paginate_queryset(transactions)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
         return Response({'error': 'Email parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def export(self, request):
+        """
+        Stream all matching transactions as CSV or NDJSON. Staff only, since
+        the export holds every customer's contact details.
+        
+        Query parameters: output (csv or ndjson, default csv), status,
+        start and end (ISO dates or datetimes on created_at).
+        """
+        export_format = request.query_params.get('output', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': f"Output must be one of: {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            transactions = filter_export_queryset(
+                Transaction.objects.all(),
+                status=request.query_params.get('status'),
+                start=request.query_params.get('start'),
+                end=request.query_params.get('end'),
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        response = StreamingHttpResponse(
+            iter_export(transactions, export_format),
+            content_type=EXPORT_FORMATS[export_format]
+        )
+        filename = f"transactions-{timezone.now():%Y%m%d%H%M%S}.{export_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class AnalyticsViewSet(viewsets.ViewSet):
+    """
+    ViewSet for revenue reporting, served from the DailyRevenue rollup.
+    Revenue figures are staff only.
+    """
+    permission_classes = [IsAdminUser]
+    
+    @action(detail=False, methods=['get'])
+    def revenue(self, request):
+        """
+        Revenue (before tax), order count and average order value.
+        
+        Query parameters: start and end (ISO dates, inclusive), status,
+        service (service ID) and group_by (comma-separated day, status
+        and service; default day,status).
+        """
+        group_by = [name.strip() for name in request.query_params.get('group_by', 'day,status').split(',') if name.strip()]
+        unknown = set(group_by) - REPORT_GROUPS.keys()
+        if unknown:
+            return Response(
+                {'error': f"group_by must be made of: {', '.join(REPORT_GROUPS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        dates = {}
+        for param in ('start', 'end'):
+            value = request.query_params.get(param)
+            if value:
+                dates[param] = parse_date(value)
+                if dates[param] is None:
+                    return Response({'error': f"Invalid date: {value}"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        service = request.query_params.get('service')
+        if service:
+            try:
+                service = uuid.UUID(service)
+            except ValueError:
+                return Response({'error': f"Invalid service ID: {service}"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        report = revenue_report(
+            status=request.query_params.get('status'),
+            service=service,
+            group_by=list(dict.fromkeys(group_by)),
+            **dates,
+        )
+        return Response({'results': report})